@@ -1,40 +1,31 @@
-from collections import defaultdict
+from utils.tempo_map import TempoMap
+from utils.note_stats import polyphony_stats, pitch_stats, ioi_stats
 
 class FeatureExtractionAgent:
     def run(self, roles, tempo):
-        seconds_per_beat = 60.0 / tempo
+        # tempo is a TempoMap (or a plain BPM number)
+        tempo_map = TempoMap.coerce(tempo)
         features = {}
 
         for role, role_notes in roles.items():
-            if not role_notes:
+            if not len(role_notes):
                 features[role] = {}
                 continue
 
-            durations_ql = [
-                n["duration"] / seconds_per_beat
-                for n in role_notes
-            ]
-
-            pitches = [n["pitch"] for n in role_notes]
+            start = role_notes.start
+            durations_ql = tempo_map.durations_to_beats(start, role_notes.duration)
+            # Onsets and ends in beats so polyphony and rhythm follow the tempo map
+            onsets_ql = tempo_map.seconds_to_beats(start)
 
             features[role] = {
-                "avg_pitch": sum(pitches) / len(pitches),
+                "avg_pitch": float(role_notes.pitch.mean()),
                 "note_density": len(role_notes) / max(
-                    (role_notes[-1]["start"] - role_notes[0]["start"]), 0.001
+                    float(start[-1] - start[0]), 0.001
                 ),
-                "avg_duration_ql": sum(durations_ql) / len(durations_ql)
+                "avg_duration_ql": float(durations_ql.mean()),
+                **polyphony_stats(onsets_ql, onsets_ql + durations_ql),
+                **pitch_stats(role_notes.pitch),
+                **ioi_stats(onsets_ql)
             }
 
         return features
-
- 
-
-    def _estimate_polyphony(self, notes):
-        timeline = {}
-
-        for n in notes:
-            t = round(n["start_ql"], 2)
-            timeline[t] = timeline.get(t, 0) + 1
-
-        return max(timeline.values()) if timeline else 1
-
@@ -1,18 +1,90 @@
-import pretty_midi
+import io
+import time
+
+import numpy as np
+
+from utils.note_table import NoteTable
+from utils.midi_reader import SMFReader, estimate_tempo
+from utils.tempo_map import TempoMap, initial_time_signature
+from utils.per_thread import PerThread
+
+# SMF default when a file carries no set_tempo events
+DEFAULT_BPM = 120.0
 
 class MIDIAnalysisAgent:
-    def run(self, midi_path):
-        midi = pretty_midi.PrettyMIDI(midi_path)
-        notes = []
+    # "smf" is the streaming reader; "pretty_midi" is kept as the reference parser.
+    # skip_tracks / skip_channels (e.g. {9} for drums) apply to the smf reader.
+    PARSERS = ("smf", "pretty_midi")
+
+    # Filled by run() for pipeline instrumentation; one agent serves many threads
+    last_stats = PerThread(dict)
+
+    def __init__(self, parser="smf", skip_tracks=(), skip_channels=()):
+        if parser not in self.PARSERS:
+            raise ValueError(f"Unknown MIDI parser '{parser}', expected one of {self.PARSERS}")
+        self.parser = parser
+        self.skip_tracks = skip_tracks
+        self.skip_channels = skip_channels
+
+    def run(self, midi):
+        """
+        Returns (notes, tempo_map). midi is a path, the file's bytes (bytes,
+        bytearray or memoryview) or a binary file object. The tempo map comes
+        from the file's set_tempo / time_signature events; only files without
+        tempo events fall back to a heuristic global tempo estimate.
+        """
+        self.last_stats = {"tempo_estimated": False, "tempo_estimate_seconds": 0.0}
+        if self.parser == "pretty_midi":
+            notes, tempo_map = self._run_pretty_midi(midi)
+            self.last_stats["notes"] = len(notes)
+            return notes, tempo_map
+
+        midi = SMFReader(self.skip_tracks, self.skip_channels).read(midi)
+        notes = midi.notes.sorted().compact()
 
+        if midi.tempo_events:
+            tempo_map = TempoMap.from_midi(midi)
+        else:
+            tempo_map = self._estimated_tempo_map(
+                notes, initial_time_signature(midi.time_signatures)
+            )
+        self.last_stats["notes"] = len(notes)
+        return notes, tempo_map
+
+    def _estimated_tempo_map(self, notes, time_signature):
+        t0 = time.perf_counter()
+        try:
+            bpm = estimate_tempo(notes.start)
+        except ValueError:
+            # Fewer than two usable onsets
+            bpm = DEFAULT_BPM
+        self.last_stats["tempo_estimated"] = True
+        self.last_stats["tempo_estimate_seconds"] = round(time.perf_counter() - t0, 4)
+        return TempoMap.constant(bpm, time_signature, estimated=True)
+
+    def _run_pretty_midi(self, source):
+        import pretty_midi
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        midi = pretty_midi.PrettyMIDI(source)
+
+        pitch, start, end = [], [], []
         for inst in midi.instruments:
-            for n in inst.notes:
-                notes.append({
-                    "pitch": n.pitch,
-                    "start": float(n.start),               # ✅ REQUIRED
-                    "duration": float(n.end - n.start)     # ✅ REQUIRED
-                })
-
-        notes.sort(key=lambda x: (x["start"], -x["pitch"]))
-        tempo = midi.estimate_tempo()
-        return notes, tempo
+            pitch.extend(n.pitch for n in inst.notes)
+            start.extend(n.start for n in inst.notes)
+            end.extend(n.end for n in inst.notes)
+
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        notes = NoteTable(pitch, start, end - start).sorted().compact()
+
+        time_signature = initial_time_signature([
+            (midi.time_to_tick(ts.time), ts.numerator, ts.denominator)
+            for ts in midi.time_signature_changes
+        ])
+        times, bpms = midi.get_tempo_changes()
+        # pretty_midi reports a lone 120 BPM when the file has no tempo events
+        if len(bpms) == 1 and bpms[0] == DEFAULT_BPM:
+            return notes, self._estimated_tempo_map(notes, time_signature)
+        return notes, TempoMap.from_changes(times, bpms, time_signature)
@@ -1,8 +1,11 @@
-from google import genai
-import os
+import numpy as np
 import json
+import os
 import re
 import sys
+import threading
+import time
+from contextlib import nullcontext
 from pathlib import Path
 
 # Add parent directory to path for mcp import
@@ -11,15 +14,58 @@ if str(parent_dir) not in sys.path:
     sys.path.insert(0, str(parent_dir))
 
 from mcp.music_rules_server import MusicRulesServer
+from agents.rule_planner_agent import RulePlannerAgent
+from utils.note_table import NoteTable
+from utils.plan_cache import get_plan_cache
+from utils.gemini_client import get_client, get_model_name
+from utils.per_thread import PerThread
 
 class NoteAssignmentAgent:
-    def __init__(self):
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        x=self.client.models.list()
-        for m in x:
-            print(m.name)
-        self.model = "gemini-3-flash-preview"
+    # Bump whenever the prompt or plan post-processing changes so cached
+    # plans from older prompts are not reused
+    PROMPT_VERSION = 2
+
+    # Most instruments kept per role, for Gemini plans and edited ones alike
+    MAX_PER_ROLE = {
+        "Melody": 2,
+        "Harmony": 2,
+        "Bass": 2
+    }
+
+    # "gemini" asks the LLM (plan cache first); "rules" plans offline
+    PLANNERS = ("gemini", "rules")
+
+    # Filled by run() for pipeline instrumentation; one agent serves many threads
+    last_stats = PerThread(dict)
+
+    def __init__(self, plan_cache=None, client=None, llm_limiter=None, planner=None, llm_budget=None):
+        # An explicit client (tests, benchmarks), else the process-wide one,
+        # created on the first real request
+        self._client = client
+        self.model = get_model_name()
         self.rules_server = MusicRulesServer()
+        # Like the client, the shared plan cache (an SQLite file) is opened on first use
+        self._plan_cache = plan_cache
+        # Optional semaphore (any context manager) bounding concurrent Gemini calls
+        self.llm_limiter = llm_limiter if llm_limiter is not None else nullcontext()
+        self.planner = planner or os.getenv("PLANNER", "gemini")
+        if self.planner not in self.PLANNERS:
+            raise ValueError(f"Unknown planner {self.planner!r}; choose one of: {', '.join(self.PLANNERS)}")
+        # Seconds to wait for Gemini before going ahead with the rule plan
+        # (None or 0: wait as long as it takes)
+        if llm_budget is None:
+            llm_budget = float(os.getenv("LLM_BUDGET_SECONDS", "0"))
+        self.llm_budget = llm_budget or None
+        self.rule_planner = RulePlannerAgent(self.MAX_PER_ROLE)
+
+    @property
+    def plan_cache(self):
+        return self._plan_cache if self._plan_cache is not None else get_plan_cache()
+
+    @property
+    def client(self):
+        # Not kept on the agent: the shared client is reset after a fork
+        return self._client if self._client is not None else get_client()
 
     def _extract_json(self, text):
         """
@@ -33,7 +79,30 @@ class NoteAssignmentAgent:
         except json.JSONDecodeError:
             return None
 
-    def run(self, roles, features):
+    def _describe_role(self, role_features):
+        """
+        Prompt lines for one role's features
+        """
+        f = role_features
+        if not f:
+            # FeatureExtractionAgent gives {} for a role without notes
+            return 'No notes in this role; it stays silent whatever is chosen'
+        return (
+            f'Average pitch: {f["avg_pitch"]:.2f}\n'
+            f'Pitch range (MIDI): {f["pitch_min"]}-{f["pitch_max"]}, '
+            f'10th-90th percentile {f["pitch_p10"]:.0f}-{f["pitch_p90"]:.0f}\n'
+            f'Note density: {f["note_density"]:.2f}\n'
+            f'Average duration (quarter lengths): {f["avg_duration_ql"]:.2f}\n'
+            f'Polyphony: max {f["max_polyphony"]}, mean {f["mean_polyphony"]:.2f} notes at once\n'
+            f'Time between onsets (quarter lengths): median {f["ioi_median_ql"]:.2f}, '
+            f'mean {f["ioi_mean_ql"]:.2f}'
+        )
+
+    def _request_plan(self, features):
+        """
+        Ask Gemini for an instrument plan.
+        Returns (plan, explanations); plan is None if the response is unusable.
+        """
         prompt = f"""
 You are an orchestration expert.
 
@@ -41,10 +110,11 @@ You are given symbolic musical features extracted from a MIDI file.
 Your task is to choose orchestral instruments that best preserve the original sound.
 
 For each role, you are given:
-- Average pitch
+- Average pitch and pitch range
 - Note density
 - Average duration
-- Polyphony level
+- Polyphony level (how many notes sound at once)
+- Rhythmic activity (time between note onsets)
 
 Use these features to select instruments. You can select multiple instruments per role to mimick the original sound exactly.
 
@@ -83,19 +153,13 @@ Output format:
 FEATURES:
 
 Melody:
-Average pitch: {features["Melody"]["avg_pitch"]:.2f}
-Note density: {features["Melody"]["note_density"]:.2f}
-Average duration (quarter lengths): {features["Melody"]["avg_duration_ql"]:.2f}
+{self._describe_role(features.get("Melody"))}
 
 Harmony:
-Average pitch: {features["Harmony"]["avg_pitch"]:.2f}
-Note density: {features["Harmony"]["note_density"]:.2f}
-Average duration (quarter lengths): {features["Harmony"]["avg_duration_ql"]:.2f}
+{self._describe_role(features.get("Harmony"))}
 
 Bass:
-Average pitch: {features["Bass"]["avg_pitch"]:.2f}
-Note density: {features["Bass"]["note_density"]:.2f}
-Average duration (quarter lengths): {features["Bass"]["avg_duration_ql"]:.2f}
+{self._describe_role(features.get("Bass"))}
 
 """
 
@@ -109,16 +173,10 @@ Average duration (quarter lengths): {features["Bass"]["avg_duration_ql"]:.2f}
         print(raw_text)
         print("----------------------------\n")
 
-        MAX_PER_ROLE = {
-            "Melody": 2,
-            "Harmony": 2,
-            "Bass": 2
-        }
-
         def trim_plan(plan):
             trimmed = {}
             for role, instruments in plan.items():
-                trimmed[role] = instruments[:MAX_PER_ROLE.get(role, 1)]
+                trimmed[role] = instruments[:self.MAX_PER_ROLE.get(role, 1)]
             return trimmed
 
         plan_data = self._extract_json(raw_text)
@@ -136,20 +194,105 @@ Average duration (quarter lengths): {features["Bass"]["avg_duration_ql"]:.2f}
             explanations = {}
         
         plan = trim_plan(plan) if plan else None
+        return plan, explanations
+
+    def _request_plan_within(self, features, cache_key, budget):
+        """
+        Ask Gemini in a background thread and wait at most budget seconds.
+        Returns (plan, explanations, llm_seconds), or None when the budget
+        runs out; the request then keeps going and its plan still lands in
+        the plan cache for the next job with these features.
+        """
+        done = threading.Event()
+        outcome = {}
+
+        def request():
+            try:
+                with self.llm_limiter:
+                    t0 = time.perf_counter()
+                    plan, explanations = self._request_plan(features)
+                    outcome["result"] = (plan, explanations, round(time.perf_counter() - t0, 4))
+                if plan is not None:
+                    self.plan_cache.put(cache_key, {
+                        "assignments": plan,
+                        "explanations": explanations
+                    })
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=request, name="gemini-plan", daemon=True).start()
+        if not done.wait(budget):
+            return None
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    @classmethod
+    def check_plan(cls, plan):
+        """
+        Validate a hand-edited plan {role: [instrument, ...]}; raises ValueError.
+        Returns it in role order, which decides the part order of the score.
+        """
+        if not isinstance(plan, dict) or set(plan) != set(cls.MAX_PER_ROLE):
+            raise ValueError(f"The plan must list instruments for {', '.join(cls.MAX_PER_ROLE)}")
+        for role, instruments in plan.items():
+            if not isinstance(instruments, list) or \
+                    not 1 <= len(instruments) <= cls.MAX_PER_ROLE[role]:
+                raise ValueError(f"{role} needs 1 to {cls.MAX_PER_ROLE[role]} instruments")
+            unknown = [inst for inst in instruments if inst not in MusicRulesServer.INSTRUMENT_RANGES]
+            if unknown:
+                raise ValueError(f"Unknown instrument(s): {', '.join(map(str, unknown))}")
+        return {role: plan[role] for role in cls.MAX_PER_ROLE}
+
+    def run(self, roles, features, plan=None, explanations=None):
+        """
+        Choose instruments for each role and split the notes between them.
+        plan, if given, is used as-is instead of asking Gemini (re-orchestration).
+        """
+        edited = plan is not None
+        cached = None
+        llm_seconds = None
+        speculative = False
+        if edited:
+            print("✓ Using the edited orchestration plan")
+            explanations = explanations or {}
+        elif self.planner == "rules":
+            print("✓ Planning orchestration offline with the rule planner")
+            plan, explanations = self.rule_planner.run(features)
+        else:
+            cache_key = self.plan_cache.make_key(features, self.model, self.PROMPT_VERSION)
+            cached = self.plan_cache.get(cache_key)
+            if cached is not None:
+                print("✓ Using cached orchestration plan")
+                plan = cached["assignments"]
+                explanations = cached["explanations"]
+            elif self.llm_budget:
+                answer = self._request_plan_within(features, cache_key, self.llm_budget)
+                if answer is None:
+                    print(f"⏱️  Gemini took longer than {self.llm_budget:g}s. Using the rule plan for now.")
+                    speculative = True
+                    plan, explanations = self.rule_planner.run(features)
+                else:
+                    plan, explanations, llm_seconds = answer
+            else:
+                with self.llm_limiter:
+                    t0 = time.perf_counter()
+                    plan, explanations = self._request_plan(features)
+                    llm_seconds = round(time.perf_counter() - t0, 4)
+                # Only real Gemini plans are cached, never the fallback below
+                if plan is not None:
+                    self.plan_cache.put(cache_key, {
+                        "assignments": plan,
+                        "explanations": explanations
+                    })
 
         # 🔁 FALLBACK (CRITICAL FOR STABILITY)
+        used_fallback = plan is None
         if plan is None:
-            print("⚠️ Gemini returned invalid JSON. Using fallback instrumentation.")
-            plan = {
-                "Melody": ["Violin"],
-                "Harmony": ["Viola"],
-                "Bass": ["Cello"]
-            }
-            explanations = {
-                "Melody": "Default violin chosen for melody range",
-                "Harmony": "Default viola chosen for harmony range",
-                "Bass": "Default cello chosen for bass range"
-            }
+            print("⚠️ Gemini returned invalid JSON. Using the rule planner instead.")
+            plan, explanations = self.rule_planner.run(features)
 
         INSTRUMENT_MAP = {
             "Piano": "Piano",
@@ -179,42 +322,76 @@ Average duration (quarter lengths): {features["Bass"]["avg_duration_ql"]:.2f}
 
         for role, instruments in plan.items():
             for inst in instruments:
-                assignments.setdefault(normalize(inst), []).extend(roles[role])
+                assignments.setdefault(normalize(inst), []).append(roles[role])
+
+        assignments = {
+            inst_name: NoteTable.concat(parts)
+            for inst_name, parts in assignments.items()
+        }
 
         # Validate and filter notes by instrument pitch ranges
+        reassign_started = time.perf_counter()
         validated_assignments = {}
-        reassigned_notes = []
+        reassigned_count = 0
+        unplaceable_count = 0
+        preferred_instruments = list(assignments.keys())
         
         for inst_name, notes in assignments.items():
             valid_notes, invalid_notes = self.rules_server.filter_notes_by_range(inst_name, notes)
             
             # Add valid notes first
-            if valid_notes:
-                validated_assignments.setdefault(inst_name, []).extend(valid_notes)
+            if len(valid_notes):
+                validated_assignments.setdefault(inst_name, []).append(valid_notes)
             
             # Handle invalid notes
-            if invalid_notes:
+            if len(invalid_notes):
                 print(f"⚠️  {len(invalid_notes)} note(s) out of range for {inst_name}")
-                # Try to reassign invalid notes to suitable instruments
-                for note in invalid_notes:
-                    suitable_inst = self.rules_server.find_suitable_instrument(
-                        note["pitch"], 
-                        current_instrument=inst_name,
-                        preferred_instruments=list(assignments.keys())
-                    )
-                    if suitable_inst:
-                        reassigned_notes.append((note, inst_name, suitable_inst))
-                        validated_assignments.setdefault(suitable_inst, []).append(note)
+                # Reassign all invalid notes to suitable instruments in one lookup
+                targets = self.rules_server.find_suitable_instruments(
+                    invalid_notes.pitch,
+                    current_instrument=inst_name,
+                    preferred_instruments=preferred_instruments
+                )
+                for target in np.unique(targets).tolist():
+                    rows = targets == target
+                    if target >= 0:
+                        reassigned_count += int(rows.sum())
+                        target_name = self.rules_server.instrument_names[target]
                     else:
-                        # If no suitable instrument found, keep the note anyway (don't lose data)
-                        print(f"   Note pitch {note['pitch']} couldn't be reassigned, keeping with {inst_name}")
-                        validated_assignments.setdefault(inst_name, []).append(note)
+                        # If no suitable instrument found, keep the notes anyway (don't lose data)
+                        unplaceable_count += int(rows.sum())
+                        stuck = sorted(set(invalid_notes.pitch[rows].tolist()))
+                        print(f"   Note pitch(es) {stuck} couldn't be reassigned, keeping with {inst_name}")
+                        target_name = inst_name
+                    validated_assignments.setdefault(target_name, []).append(invalid_notes.select(rows))
         
-        if reassigned_notes:
-            print(f"✓ Reassigned {len(reassigned_notes)} note(s) to suitable instruments")
+        if reassigned_count:
+            print(f"✓ Reassigned {reassigned_count} note(s) to suitable instruments")
+
+        validated_assignments = {
+            inst_name: NoteTable.concat(parts)
+            for inst_name, parts in validated_assignments.items()
+        }
+
+        self.last_stats = {
+            # "edited": no lookup, the plan came with the request
+            "plan_cache": "edited" if edited else "skipped" if self.planner == "rules"
+                          else "hit" if cached is not None else "miss",
+            "planner": "edited" if edited else self.planner,
+            "llm_seconds": llm_seconds,
+            "fallback": used_fallback,
+            # The rule plan stood in for a Gemini answer still on its way
+            "speculative": speculative,
+            "reassign_seconds": round(time.perf_counter() - reassign_started, 4),
+            "reassigned_notes": reassigned_count,
+            "unplaceable_notes": unplaceable_count
+        }
         
         # Return both assignments and explanations
         return {
             "assignments": validated_assignments,
-            "explanations": explanations
+            "plan": plan,
+            "explanations": explanations,
+            "fallback": used_fallback,
+            "speculative": speculative
         }
@@ -1,15 +1,83 @@
+import numpy as np
+
 class RoleAssignmentAgent:
-    def run(self, notes):
-        melody = []
-        harmony = []
-        bass = []
-
-        for n in notes:
-            if n["pitch"] >= 72:
-                melody.append(n)
-            elif n["pitch"] >= 55:
-                harmony.append(n)
-            else:
-                bass.append(n)
+    # Lowest pitch of Harmony and of Melody (MIDI numbers)
+    DEFAULT_SPLIT_POINTS = (55, 72)
+    MODES = ("split", "skyline")
+
+    def __init__(self, split_points=DEFAULT_SPLIT_POINTS, mode="split", onset_tolerance=1e-3):
+        self.split_points = self._check_split_points(split_points)
+        self.mode = self._check_mode(mode)
+        self.onset_tolerance = onset_tolerance
+
+    def _check_split_points(self, split_points):
+        split_points = tuple(int(p) for p in split_points)
+        if len(split_points) != 2 or not 0 <= split_points[0] <= split_points[1] <= 128:
+            raise ValueError(
+                f"split_points must be two ascending MIDI pitches, got {split_points}"
+            )
+        return split_points
+
+    def _check_mode(self, mode):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown role mode '{mode}', expected one of {self.MODES}")
+        return mode
+
+    def run(self, notes, split_points=None, mode=None):
+        """
+        Split a NoteTable into (melody, harmony, bass) views in one pass.
+        split_points and mode override the agent defaults for this call.
+        """
+        split_points = self.split_points if split_points is None else self._check_split_points(split_points)
+        mode = self.mode if mode is None else self._check_mode(mode)
+
+        if mode == "skyline":
+            return self._skyline(notes, split_points[0])
+
+        # 0 = Bass, 1 = Harmony, 2 = Melody
+        bands = np.searchsorted(split_points, notes.pitch, side="right")
+        return self._partition(notes, bands)
+
+    def _partition(self, notes, bands):
+        """
+        Group rows by band with one stable sort; each role keeps note order
+        """
+        order = np.argsort(bands, kind="stable")
+        bass_end, harmony_end = np.cumsum(np.bincount(bands, minlength=3))[:2]
+
+        bass = notes.select(order[:bass_end])
+        harmony = notes.select(order[bass_end:harmony_end])
+        melody = notes.select(order[harmony_end:])
 
         return melody, harmony, bass
+
+    def _skyline(self, notes, bass_split):
+        """
+        Melody is the highest note starting at each onset, unless a higher
+        note from the previous onset is still sounding over it. The rest is
+        split into harmony and bass at bass_split.
+        """
+        bands = np.where(notes.pitch >= bass_split, 1, 0)
+        if not len(notes):
+            return self._partition(notes, bands)
+
+        # Sorting by (start, -pitch) puts the top note first in each onset group
+        order = np.lexsort((-notes.pitch, notes.start))
+        start = notes.start[order]
+        pitch = notes.pitch[order]
+        end = notes.end[order]
+
+        onset_heads = np.flatnonzero(np.r_[True, np.diff(start) > self.onset_tolerance])
+        top = order[onset_heads]
+
+        # Drop candidates covered by a higher, still-sounding previous top note
+        head_start = start[onset_heads]
+        head_pitch = pitch[onset_heads]
+        head_end = end[onset_heads]
+        covered = np.zeros(len(onset_heads), dtype=bool)
+        covered[1:] = (head_end[:-1] > head_start[1:] + self.onset_tolerance) & (
+            head_pitch[:-1] > head_pitch[1:]
+        )
+
+        bands[top[~covered]] = 2
+        return self._partition(notes, bands)
@@ -0,0 +1,243 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path for mcp import
+parent_dir = Path(__file__).parent.parent
+if str(parent_dir) not in sys.path:
+    sys.path.insert(0, str(parent_dir))
+
+from mcp.music_rules_server import MusicRulesServer
+from utils.per_thread import PerThread
+
+NOTE_NAMES = ("C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B")
+
+
+def note_name(pitch):
+    pitch = int(round(pitch))
+    return f"{NOTE_NAMES[pitch % 12]}{pitch // 12 - 1}"
+
+
+def _coverage(low, high, a, b):
+    """
+    Share of the semitones a..b (inclusive) that fall inside low..high
+    """
+    a, b = int(round(a)), int(round(b))
+    inside = min(b, high) - max(a, low) + 1
+    return max(inside, 0) / (b - a + 1)
+
+
+def _clip(value):
+    return min(max(value, 0.0), 1.0)
+
+
+class RulePlannerAgent:
+    """
+    Offline orchestration planner. Scores every pitched instrument of
+    MusicRulesServer.INSTRUMENT_RANGES against each role's features and
+    returns the best fit per role, with a second instrument when the first
+    cannot reach the role's range. Pure arithmetic on the features: no
+    network, a few milliseconds, and the same plan for the same features.
+    """
+
+    ROLES = ("Melody", "Harmony", "Bass")
+
+    # (agility, sustain, chord) per instrument: how well it handles fast
+    # passages and long held notes (0-1), and how many notes it comfortably
+    # sounds at once. Unpitched percussion and the ambiguous "Bass" are left
+    # out, so they are never proposed.
+    TRAITS = {
+        "Violin": (0.9, 0.9, 2),
+        "Viola": (0.8, 0.9, 2),
+        "Cello": (0.7, 0.9, 2),
+        "Double Bass": (0.5, 0.8, 1),
+        "Harp": (0.6, 0.2, 6),
+        "Guitar": (0.6, 0.3, 6),
+        "Electric Guitar": (0.7, 0.6, 6),
+        "Bass Guitar": (0.6, 0.4, 1),
+        "Flute": (0.9, 0.6, 1),
+        "Piccolo": (0.9, 0.5, 1),
+        "Alto Flute": (0.7, 0.6, 1),
+        "Oboe": (0.7, 0.7, 1),
+        "English Horn": (0.6, 0.7, 1),
+        "Clarinet": (0.9, 0.7, 1),
+        "Bass Clarinet": (0.6, 0.7, 1),
+        "Bassoon": (0.6, 0.7, 1),
+        "Contrabassoon": (0.3, 0.7, 1),
+        "Recorder": (0.6, 0.4, 1),
+        "French Horn": (0.5, 0.9, 1),
+        "Trumpet": (0.7, 0.7, 1),
+        "Cornet": (0.7, 0.6, 1),
+        "Trombone": (0.5, 0.8, 1),
+        "Bass Trombone": (0.4, 0.8, 1),
+        "Tuba": (0.3, 0.8, 1),
+        "Piano": (0.9, 0.4, 10),
+        "Electric Piano": (0.8, 0.4, 10),
+        "Harpsichord": (0.8, 0.1, 10),
+        "Celesta": (0.6, 0.2, 4),
+        "Organ": (0.6, 1.0, 10),
+        "Accordion": (0.6, 0.9, 6),
+        "Timpani": (0.3, 0.3, 1),
+        "Xylophone": (0.8, 0.0, 2),
+        "Marimba": (0.7, 0.1, 4),
+        "Vibraphone": (0.6, 0.5, 4),
+        "Glockenspiel": (0.6, 0.2, 2),
+        "Tubular Bells": (0.2, 0.5, 1),
+        "Soprano": (0.4, 0.9, 1),
+        "Alto": (0.4, 0.9, 1),
+        "Tenor": (0.4, 0.9, 1),
+        "Choir Aahs": (0.3, 1.0, 6),
+        "Voice Oohs": (0.3, 1.0, 6),
+    }
+
+    WEIGHTS = {
+        "range": 0.4,
+        "center": 0.15,
+        "agility": 0.15,
+        "sustain": 0.1,
+        "chords": 0.2,
+    }
+    # Semitones between the role's median and the instrument's middle at
+    # which the center score reaches zero
+    CENTER_SPAN = 24
+    # Subtracted from instruments another role already uses
+    REUSE_PENALTY = 0.15
+    # A second instrument must add at least this share of the role's range
+    MIN_EXTRA_COVERAGE = 0.1
+
+    # Roles without notes get the classic string plan
+    DEFAULT_PLAN = {
+        "Melody": ["Violin"],
+        "Harmony": ["Viola"],
+        "Bass": ["Cello"]
+    }
+
+    # Best candidates per role from the last run() in this thread,
+    # {role: [(instrument, score)]}
+    last_ranking = PerThread(dict)
+
+    def __init__(self, max_per_role=None):
+        self.max_per_role = max_per_role or {role: 2 for role in self.ROLES}
+
+    def _demands(self, f):
+        """
+        What a role asks of its instrument, each 0-1
+        """
+        onsets_per_second = f["note_density"] / max(f["mean_polyphony"], 1.0)
+        # A single onset (one note or chord) has no IOI and a meaningless
+        # density; there is no rhythm to keep up with
+        fast = 0.0 if f["ioi_median_ql"] == 0 else max(
+            _clip((1.0 - f["ioi_median_ql"]) / 0.75),
+            _clip((onsets_per_second - 2.0) / 6.0)
+        )
+        return {
+            # Sixteenths (IOI 0.25) or 8+ onsets a second count as fully fast
+            "fast": fast,
+            # Notes of two beats or more on average need full sustain
+            "long": _clip((f["avg_duration_ql"] - 0.5) / 1.5),
+        }
+
+    def score(self, instrument, f, demands):
+        """
+        (total, parts) for one instrument against one role's features
+        """
+        low, high = MusicRulesServer.INSTRUMENT_RANGES[instrument]
+        agility, sustain, chord = self.TRAITS[instrument]
+        parts = {
+            "range": 0.7 * _coverage(low, high, f["pitch_p10"], f["pitch_p90"])
+                     + 0.3 * _coverage(low, high, f["pitch_min"], f["pitch_max"]),
+            # The median near the middle of the instrument: a full-range
+            # keyboard is a poor fit for a bass line it merely reaches
+            "center": _clip(1.0 - abs(f["pitch_median"] - (low + high) / 2) / self.CENTER_SPAN),
+            "agility": 1.0 - max(demands["fast"] - agility, 0.0),
+            "sustain": 1.0 - max(demands["long"] - sustain, 0.0),
+            "chords": min(chord / f["mean_polyphony"], 1.0) if f["mean_polyphony"] > 1 else 1.0,
+        }
+        total = sum(self.WEIGHTS[name] * value for name, value in parts.items())
+        # Rounded so float noise in the features never reorders near-ties
+        return round(total, 6), parts
+
+    def rank(self, f, used=()):
+        """
+        [(score, instrument, parts)] best first; ties keep table order
+        """
+        demands = self._demands(f)
+        ranking = []
+        for instrument in self.TRAITS:
+            total, parts = self.score(instrument, f, demands)
+            if instrument in used:
+                total = round(total - self.REUSE_PENALTY, 6)
+            ranking.append((total, instrument, parts))
+        ranking.sort(key=lambda entry: -entry[0])
+        return ranking
+
+    def _second(self, first, ranking, f, used):
+        """
+        The best-ranked instrument that reaches notes first cannot, or None
+        """
+        low, high = MusicRulesServer.INSTRUMENT_RANGES[first]
+        span = f["pitch_max"] - f["pitch_min"] + 1
+        for total, instrument, _ in ranking:
+            if instrument == first or instrument in used:
+                continue
+            other_low, other_high = MusicRulesServer.INSTRUMENT_RANGES[instrument]
+            # Semitones of the role that only the candidate reaches
+            extra = sum(
+                1 for pitch in range(f["pitch_min"], f["pitch_max"] + 1)
+                if not low <= pitch <= high and other_low <= pitch <= other_high
+            )
+            if extra / span >= self.MIN_EXTRA_COVERAGE:
+                return instrument
+        return None
+
+    def _explain(self, role, instruments, f, demands, ranking):
+        first = instruments[0]
+        low, high = MusicRulesServer.INSTRUMENT_RANGES[first]
+        core = _coverage(low, high, f["pitch_p10"], f["pitch_p90"])
+        rhythm = "fast" if demands["fast"] >= 0.67 else "moderate" if demands["fast"] >= 0.25 else "slow"
+        texture = (
+            "chordal texture" if f["mean_polyphony"] >= 2
+            else "occasional double stops" if f["mean_polyphony"] > 1.2
+            else "single line"
+        )
+        text = (
+            f"{first} covers {core:.0%} of the {role.lower()}'s core range "
+            f"({note_name(f['pitch_p10'])}-{note_name(f['pitch_p90'])}) "
+            f"and suits its {rhythm} rhythm and {texture}."
+        )
+        if len(instruments) > 1:
+            text += f" {instruments[1]} takes the notes outside the {first}'s range."
+        runners_up = [
+            f"{instrument} ({total:.2f})" for total, instrument, _ in ranking
+            if instrument not in instruments
+        ][:2]
+        if runners_up:
+            text += f" Next best: {', '.join(runners_up)}."
+        return text
+
+    def run(self, features):
+        """
+        Plan every role. Returns (plan, explanations) like a Gemini plan.
+        """
+        plan = {}
+        explanations = {}
+        used = set()
+        self.last_ranking = {}
+        for role in self.ROLES:
+            f = features.get(role) or {}
+            if not f:
+                plan[role] = list(self.DEFAULT_PLAN[role])
+                explanations[role] = f"No {role.lower()} notes; {plan[role][0]} kept as a placeholder."
+                continue
+
+            ranking = self.rank(f, used)
+            instruments = [ranking[0][1]]
+            if self.max_per_role.get(role, 1) > 1:
+                second = self._second(instruments[0], ranking, f, used)
+                if second is not None:
+                    instruments.append(second)
+
+            plan[role] = instruments
+            used.update(instruments)
+            explanations[role] = self._explain(role, instruments, f, self._demands(f), ranking)
+            self.last_ranking[role] = [(instrument, total) for total, instrument, _ in ranking[:5]]
+        return plan, explanations
@@ -1,76 +1,223 @@
 import os
+import json
+import time
 import atexit
 import shutil
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
+import xml.etree.ElementTree as ET
+from tempfile import SpooledTemporaryFile
+from flask import Flask, Blueprint, Request, render_template, request, jsonify, redirect, url_for, session, Response, current_app
+from werkzeug.local import LocalProxy
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from dotenv import load_dotenv
 
-from agents.midi_analysis_agent import MIDIAnalysisAgent
 from agents.role_assignment_agent import RoleAssignmentAgent
 from agents.note_assignment_agent import NoteAssignmentAgent
-from agents.feature_extraction_agent import FeatureExtractionAgent
-from utils.score_renderer import render_score
+from utils.score_renderer import ENGINES, GRID
+from utils.job_queue import JobStore, JobQueue, QueueFullError, JobTooLargeError
+from utils.result_cache import ResultCache, read_and_hash
+from utils.midi_reader import MidiParseError, scan_header, estimate_note_count
+from utils.admission import MemoryModel, default_memory_budget
+from utils.metrics import MetricsRegistry
+from utils.storage import StorageManager
+from utils.artifacts import JobArtifacts
+from utils.compression import write_mxl, MXL_MIMETYPE
+from utils.downloads import send_download, file_etag
+from utils.measure_index import load_index, build_index, measure_count, select_parts, read_fragment, read_fragment_json
+from utils.gemini_client import get_model_name
+from utils.warmup import warm_up
 
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size (increased for larger MIDI files)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['OUTPUT_FOLDER'] = 'output'
+class UploadRequest(Request):
+    """Keep uploads up to UPLOAD_SPOOL_BYTES in memory (Werkzeug spools anything over 500KB to disk)"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_BYTES'], mode='rb+')
 
-# Ensure directories exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+class ConverterServices:
+    """
+    State shared by the views: score and artifact storage, the result cache,
+    metrics and the job queue. Jobs, scores and caches live on disk, so any
+    worker of a pre-fork server can report a job or serve a score another
+    worker queued; metrics and the pending-job count are per process.
+    """
+    def __init__(self, config):
+        # Generated scores are kept under a byte cap and idle TTL (OUTPUT_* env),
+        # least recently downloaded first out; survives restarts
+        self.storage = StorageManager.from_env(config['OUTPUT_FOLDER'])
+        # Same policy for job artifacts (ARTIFACT_* env), with a smaller default cap
+        self.artifact_storage = StorageManager.from_env(config['ARTIFACT_FOLDER'], prefix='ARTIFACT',
+                                                        max_bytes=1024 * 1024 * 1024)
+        # Finished conversions keyed on upload content + pipeline settings (RESULT_CACHE_* env)
+        self.result_cache = ResultCache.from_env()
+        # Aggregated pipeline metrics, served at /metrics
+        self.metrics = MetricsRegistry()
+        # Predicts each job's peak memory from its note count (MEMORY_MODEL env)
+        self.memory_model = MemoryModel.from_env()
+        self.memory_samples_path = config['MEMORY_SAMPLES_PATH']
+        # Conversions run in background worker processes; job state lives in JOB_FOLDER
+        self.job_store = JobStore(config['JOB_FOLDER'])
+        self.job_queue = JobQueue(
+            self.job_store,
+            workers=config['JOB_WORKERS'],
+            max_pending=config['JOB_QUEUE_LIMIT'],
+            on_done=self.job_finished,
+            memory_budget=config['MEMORY_BUDGET_BYTES']
+        )
+        self._owner_pid = os.getpid()
 
-def cleanup_output_files():
-    """Delete all output files when server shuts down"""
-    try:
-        output_folder = app.config['OUTPUT_FOLDER']
-        if os.path.exists(output_folder):
-            for filename in os.listdir(output_folder):
-                file_path = os.path.join(output_folder, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                        print(f"Cleaned up output file: {filename}")
-                except Exception as e:
-                    print(f"Error deleting {filename}: {e}")
-        print("Output files cleanup completed")
-    except Exception as e:
-        print(f"Error during cleanup: {e}")
+    def start(self):
+        self.storage.start()
+        self.artifact_storage.start()
+        atexit.register(self.shutdown)
 
-def cleanup_upload_files():
-    """Delete all upload files when server shuts down"""
-    try:
-        upload_folder = app.config['UPLOAD_FOLDER']
-        if os.path.exists(upload_folder):
-            for filename in os.listdir(upload_folder):
-                file_path = os.path.join(upload_folder, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                        print(f"Cleaned up upload file: {filename}")
-                except Exception as e:
-                    print(f"Error deleting {filename}: {e}")
-        print("Upload files cleanup completed")
-    except Exception as e:
-        print(f"Error during cleanup: {e}")
+    def shutdown(self):
+        """Cleanup on server shutdown (output files stay; the storage manager expires them)"""
+        atexit.unregister(self.shutdown)
+        self.storage.stop()
+        self.artifact_storage.stop()
+        self.job_queue.shutdown()
+        # Pre-fork workers also exit on restarts; only the process that built
+        # the app clears the job records every worker shares
+        if os.getpid() == self._owner_pid:
+            self.job_store.clear()
+
+    def job_finished(self, job):
+        """Record metrics for a finished job and store its score in the result cache"""
+        result = job['result']
+        self.metrics.record_job(job['status'], result['metrics'] if result else None)
+        if job['status'] != 'done':
+            return
+        self.record_memory(job)
+        # Fallback and speculative plans stand in for Gemini; let the next upload retry
+        if job.get('cache_key') and not result.get('fallback') and not result.get('speculative') \
+                and not result.get('profile'):
+            self.result_cache.put(job['cache_key'], result['output_path'], {
+                'instruments': result['instruments'],
+                'tempo': result['tempo'],
+                'explanations': result['explanations']
+            })
+        # Enforce the output cap now rather than at the next periodic sweep
+        self.storage.sweep()
+        self.artifact_storage.sweep()
+
+    def record_memory(self, job):
+        """Compare a finished job's peak memory with its estimate, for calibrating the model"""
+        added = job['result']['metrics']['memory']['added_bytes']
+        peaks = [value for value in added.values() if value is not None]
+        if not peaks or not job.get('memory_estimate'):
+            return
+        self.metrics.observe('memory_estimate_ratio', 'Peak memory a job added over its estimate',
+                             max(peaks) / job['memory_estimate'], buckets=MEMORY_RATIO_BUCKETS)
+        if not self.memory_samples_path:
+            return
+        # One JSON line per job, input for python -m benchmarks memory --log
+        sample = {
+            'notes': job['result']['metrics']['notes'],
+            'estimated_notes': job.get('estimated_notes'),
+            'renderer': job.get('engine'),
+            'estimate': job['memory_estimate'],
+            'stages': added
+        }
+        with open(self.memory_samples_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(sample) + '\n')
+
+MEMORY_RATIO_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1, 1.25, 1.5, 2, 4)
+
+def _service(name):
+    """The current app's ConverterServices attribute, resolved per request"""
+    return LocalProxy(lambda: getattr(current_app.extensions['converter'], name))
+
+storage = _service('storage')
+artifact_storage = _service('artifact_storage')
+result_cache = _service('result_cache')
+metrics = _service('metrics')
+job_store = _service('job_store')
+job_queue = _service('job_queue')
+memory_model = _service('memory_model')
+
+# Every route; create_app registers it on the app it builds
+bp = Blueprint('converter', __name__)
+
+def load_secret_key(path):
+    """
+    SECRET_KEY from the environment, else a random key created once at path,
+    so every worker process (and every restart) signs session cookies alike
+    """
+    key = os.getenv('SECRET_KEY')
+    if key:
+        return key
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(os.urandom(32))
+        os.chmod(tmp_path, 0o600)
+        try:
+            # Fails if another worker got there first; its key wins
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+def create_app(config=None, warm=False):
+    """
+    Build the web app; config overrides the defaults below.
+    warm=True preloads the conversion pipeline (see utils.warmup). Pre-fork
+    servers should build the app in the master, as wsgi.py does with
+    gunicorn --preload, so workers share the preloaded pages.
+    """
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size (increased for larger MIDI files)
+    app.config['UPLOAD_SPOOL_BYTES'] = int(os.getenv('UPLOAD_SPOOL_BYTES', str(32 * 1024 * 1024)))
+    # Uploads with more MTrk chunks than this are rejected before parsing
+    app.config['MIDI_MAX_TRACKS'] = int(os.getenv('MIDI_MAX_TRACKS', '1024'))
+    app.config['OUTPUT_FOLDER'] = 'output'
+    # Parsed notes, features and rendered parts of each job, for re-orchestration
+    app.config['ARTIFACT_FOLDER'] = 'artifacts'
+    app.config['JOB_FOLDER'] = 'jobs'
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '0')) or None  # None = one per CPU
+    app.config['JOB_QUEUE_LIMIT'] = int(os.getenv('JOB_QUEUE_LIMIT', '32'))
+    # Estimated job memory allowed to run at once (MEMORY_BUDGET_BYTES, default
+    # half the RAM, 0 = no limit), shared by every web process using JOB_FOLDER
+    app.config['MEMORY_BUDGET_BYTES'] = default_memory_budget()
+    # Append each job's estimated and actual memory here for calibration
+    app.config['MEMORY_SAMPLES_PATH'] = os.getenv('MEMORY_SAMPLES_PATH') or None
+    # Opt-in cProfile/tracemalloc dumps for jobs submitted with profile=1
+    app.config['ALLOW_PROFILING'] = os.getenv('ALLOW_PROFILING') == '1'
+    app.config['PROFILE_FOLDER'] = 'profiles'
+    # Let a fronting web server (nginx, Apache) send download files itself
+    app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == '1'
+    # Measures per /preview page by default, and the most one request may ask for
+    app.config['PREVIEW_MEASURES'] = 8
+    app.config['PREVIEW_MAX_MEASURES'] = 32
+    app.config.update(config or {})
+    app.secret_key = app.config.get('SECRET_KEY') or load_secret_key(
+        os.path.join(app.instance_path, 'secret_key')
+    )
 
-# Register cleanup functions to run on server shutdown
-atexit.register(cleanup_output_files)
-atexit.register(cleanup_upload_files)
+    app.extensions['converter'] = ConverterServices(app.config)
+    app.register_blueprint(bp)
+
+    if warm:
+        print(f"🔥 Conversion pipeline preloaded in {warm_up():.2f}s")
+    app.extensions['converter'].start()
+    return app
 
 ALLOWED_EXTENSIONS = {'mid', 'midi'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/convert', methods=['POST'])
+@bp.route('/convert', methods=['POST'])
 def convert():
     if 'file' not in request.files:
         return jsonify({
@@ -92,93 +239,322 @@ def convert():
             'error': 'Invalid file type. Please upload a .mid or .midi file.'
         }), 400
     
+    # Optional per-request role split configuration
+    try:
+        split_points = (
+            int(request.form.get('bass_split', RoleAssignmentAgent.DEFAULT_SPLIT_POINTS[0])),
+            int(request.form.get('melody_split', RoleAssignmentAgent.DEFAULT_SPLIT_POINTS[1]))
+        )
+        role_mode = request.form.get('role_mode', 'split')
+        # Validate here so bad settings fail the request, not the job
+        RoleAssignmentAgent(split_points=split_points, mode=role_mode)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid role settings: {e}'
+        }), 400
+    
+    renderer = request.form.get('renderer') or None
+    if renderer is not None and renderer not in ENGINES:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid renderer. Choose one of: {", ".join(ENGINES)}'
+        }), 400
+    
+    # "rules" plans offline, without a Gemini call
+    planner = request.form.get('planner') or None
+    if planner is not None and planner not in NoteAssignmentAgent.PLANNERS:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid planner. Choose one of: {", ".join(NoteAssignmentAgent.PLANNERS)}'
+        }), 400
+    
     try:
-        # Save uploaded file
+        # The upload is parsed from memory; it never goes through uploads/
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        midi_data, content_hash = read_and_hash(file.stream)
         
-        # Initialize agents
-        midi_agent = MIDIAnalysisAgent()
-        role_agent = RoleAssignmentAgent()
-        note_agent = NoteAssignmentAgent()
-        feature_agent = FeatureExtractionAgent()
+        # Cheap header and chunk-table check so broken or oversized files
+        # fail here instead of in a worker
+        try:
+            header = scan_header(midi_data, max_tracks=current_app.config['MIDI_MAX_TRACKS'])
+        except MidiParseError as e:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid MIDI file: {e}'
+            }), 400
         
-        # Run conversion pipeline
-        notes, tempo = midi_agent.run(filepath)
-        melody, harmony, bass = role_agent.run(notes)
-        roles = {
-            "Melody": melody,
-            "Harmony": harmony,
-            "Bass": bass
-        }
-        features = feature_agent.run(roles, tempo)
-        note_agent_result = note_agent.run(roles, features)
-        
-        # Extract assignments and explanations
-        if isinstance(note_agent_result, dict) and "assignments" in note_agent_result:
-            assignments = note_agent_result["assignments"]
-            explanations = note_agent_result.get("explanations", {})
-        else:
-            # Fallback for old format
-            assignments = note_agent_result
-            explanations = {}
+        # Same bytes + same settings = same score, whatever the file is called
+        engine = renderer or os.getenv('SCORE_RENDERER', 'music21')
+        cache_key = result_cache.make_key(
+            content_hash,
+            split_points=list(split_points),
+            role_mode=role_mode,
+            renderer=engine,
+            planner=planner or os.getenv('PLANNER', 'gemini'),
+            grid=GRID,
+            model=get_model_name(),
+            prompt_version=NoteAssignmentAgent.PROMPT_VERSION
+        )
+        # Profiling needs a real run, so it skips the cache
+        profile = current_app.config['ALLOW_PROFILING'] and request.form.get('profile') == '1'
+        cached = None if profile else result_cache.get(cache_key)
+        if cached is not None:
+            output_filename = f"orchestral_score_{cache_key[:32]}.musicxml"
+            output_path = os.path.join(current_app.config['OUTPUT_FOLDER'], output_filename)
+            try:
+                result_cache.export(cache_key, output_path)
+                # A hard link keeps the cached artifact's last access, which may
+                # already be older than OUTPUT_TTL; the sweep would delete the
+                # score before it is downloaded
+                storage.touch(output_path)
+            except OSError:
+                # Evicted between lookup and export; convert as usual
+                cached = None
+        if cached is not None:
+            store_results_in_session(output_filename, cached)
+            print(f"✓ Using cached result for {filename}")
+            return jsonify({
+                'success': True,
+                'cached': True,
+                'redirect_url': '/results',
+                'instruments': cached['instruments'],
+                'tempo': cached['tempo'],
+                'download_url': f'/download/{output_filename}'
+            })
         
         # Generate unique output filename
-        output_filename = f"orchestral_score_{os.urandom(8).hex()}.musicxml"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-        
-        # Render score
-        render_score(assignments, tempo, output_path)
-        
-        # Read the generated MusicXML
-        with open(output_path, 'r', encoding='utf-8') as f:
-            musicxml_content = f.read()
+        token = os.urandom(8).hex()
+        output_filename = f"orchestral_score_{token}.musicxml"
+        output_path = os.path.join(current_app.config['OUTPUT_FOLDER'], output_filename)
         
-        # Get instrument list
-        instruments = list(assignments.keys())
+        # Intermediate results are kept so the job can be re-orchestrated
+        options = {'artifacts': os.path.join(current_app.config['ARTIFACT_FOLDER'], token)}
+        if profile:
+            options['profile_prefix'] = os.path.join(
+                current_app.config['PROFILE_FOLDER'], os.path.splitext(output_filename)[0]
+            )
         
-        # Store results - use file reference instead of full content in session
-        # (Flask sessions are cookie-based with 4KB limit, can't store large MusicXML)
-        download_url = f'/download/{output_filename}'
+        # Admission control: a sampled note count predicts the job's peak memory
+        estimated_notes = estimate_note_count(midi_data, header)
+        memory = memory_model.estimate(estimated_notes, engine)['peak']
         
-        # Store only metadata in session (small data)
-        session['output_filename'] = output_filename
-        session['instruments'] = instruments
-        session['tempo'] = round(tempo, 2)
-        session['download_url'] = download_url
-        session['explanations'] = explanations  # Store Gemini's explanations
-        
-        # Mark session as modified to ensure it's saved
-        session.modified = True
-        
-        # Clean up uploaded file
-        os.remove(filepath)
+        # Queue the conversion; the upload bytes go to the worker with the job
+        job = job_queue.submit(
+            midi_data, output_path,
+            meta={'output_filename': output_filename, 'cache_key': cache_key,
+                  'estimated_notes': estimated_notes, 'engine': engine},
+            memory=memory,
+            split_points=split_points,
+            role_mode=role_mode,
+            renderer=renderer,
+            planner=planner,
+            # Always keep plain MusicXML; .mxl and gzip copies are made on download
+            output_format='musicxml',
+            # Measure offsets for /preview
+            index=True,
+            **options
+        )
         
-        print(f"Session stored - filename: {output_filename}, instruments: {instruments}, tempo: {tempo}")
+        print(f"Queued job {job['id']} for {filename}")
         
         return jsonify({
             'success': True,
-            'redirect_url': '/results',  # Use absolute path
-            'musicxml': musicxml_content,  # Still send in response for preview
-            'instruments': instruments,
-            'tempo': round(tempo, 2),
-            'download_url': download_url
-        })
+            'job_id': job['id'],
+            'status_url': f"/jobs/{job['id']}",
+            'events_url': f"/jobs/{job['id']}/events"
+        }), 202
+    
+    except QueueFullError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    
+    except JobTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
     
     except Exception as e:
-        # Clean up on error
-        if 'filepath' in locals() and os.path.exists(filepath):
-            os.remove(filepath)
-        
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
-@app.route('/results')
+@bp.route('/jobs/<job_id>/reorchestrate', methods=['POST'])
+def reorchestrate(job_id):
+    """
+    Re-render a finished conversion with an edited instrument plan, sent as
+    {"plan": {"Melody": [...], "Harmony": [...], "Bass": [...]}}. Parsing,
+    feature extraction and Gemini are skipped and unchanged parts are reused.
+    Answers like /convert with a new job.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    if job['status'] != 'done':
+        return jsonify({
+            'success': False,
+            'error': 'Only finished conversions can be re-orchestrated'
+        }), 409
+    
+    artifacts = JobArtifacts(job['options'].get('artifacts') or '')
+    if not artifacts.prefix or not artifacts.has_analysis():
+        return jsonify({
+            'success': False,
+            'error': 'This conversion has expired, please upload the file again'
+        }), 410
+    
+    try:
+        body = request.get_json(silent=True) or {}
+        plan = NoteAssignmentAgent.check_plan(body.get('plan'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid plan: {e}'
+        }), 400
+    
+    # Keep Gemini's explanations for the roles that did not change
+    previous = job['result']
+    explanations = {
+        role: previous['explanations'].get(role, '')
+        if previous.get('plan', {}).get(role) == instruments else 'Chosen by hand'
+        for role, instruments in plan.items()
+    }
+    
+    output_filename = f"orchestral_score_{os.urandom(8).hex()}.musicxml"
+    output_path = os.path.join(current_app.config['OUTPUT_FOLDER'], output_filename)
+    options = {key: value for key, value in job['options'].items() if key != 'profile_prefix'}
+    options.update(plan=plan, explanations=explanations)
+    
+    # Same notes as the source job; its parse is skipped but render dominates
+    engine = options.get('renderer') or os.getenv('SCORE_RENDERER', 'music21')
+    notes = previous['metrics']['notes']
+    
+    artifact_storage.touch(artifacts.notes_path)
+    try:
+        new_job = job_queue.submit(
+            None, output_path,
+            meta={'output_filename': output_filename, 'source_job': job_id,
+                  'estimated_notes': notes, 'engine': engine},
+            memory=memory_model.estimate(notes, engine)['peak'],
+            **options
+        )
+    except QueueFullError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    except JobTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    
+    print(f"Queued job {new_job['id']} re-orchestrating {job_id}")
+    
+    return jsonify({
+        'success': True,
+        'job_id': new_job['id'],
+        'status_url': f"/jobs/{new_job['id']}",
+        'events_url': f"/jobs/{new_job['id']}/events"
+    }), 202
+
+def job_payload(job):
+    """Public view of a job record"""
+    payload = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'stages': job['stages'],
+        'progress': job['progress'],
+        'error': job['error']
+    }
+    if job['status'] == 'done':
+        result = job['result']
+        payload.update({
+            'redirect_url': f"/results?job={job['id']}",
+            'instruments': result['instruments'],
+            'plan': result.get('plan'),
+            'tempo': result['tempo'],
+            'download_url': f"/download/{job['output_filename']}",
+            'reorchestrate_url': f"/jobs/{job['id']}/reorchestrate"
+        })
+    return payload
+
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Poll the state of a conversion job"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    if job['status'] == 'done':
+        store_results_in_session(job['output_filename'], job['result'])
+    
+    return jsonify(job_payload(job))
+
+@bp.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream job progress as server-sent events until the job finishes"""
+    if job_store.get(job_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    # The generator runs after the request has ended, when the current_app
+    # proxies no longer resolve
+    store = job_store._get_current_object()
+    
+    def generate():
+        last_update = None
+        while True:
+            job = store.get(job_id)
+            if job is None:
+                yield 'event: failed\ndata: {"error": "Job not found"}\n\n'
+                return
+            if job['updated'] != last_update:
+                last_update = job['updated']
+                yield f"event: {job['status']}\ndata: {json.dumps(job_payload(job))}\n\n"
+                if job['status'] in ('done', 'failed'):
+                    return
+            time.sleep(0.25)
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def store_results_in_session(output_filename, result):
+    """
+    Store result metadata in the session for the results page.
+    Flask sessions are cookie-based with 4KB limit, so only small data goes here.
+    """
+    session['output_filename'] = output_filename
+    session['instruments'] = result['instruments']
+    session['tempo'] = result['tempo']
+    session['download_url'] = f"/download/{output_filename}"
+    session['explanations'] = result['explanations']  # Store Gemini's explanations
+    session.modified = True
+
+@bp.route('/results')
 def results():
     """Display results page with orchestration data"""
+    # A finished job id takes precedence over whatever is in the session
+    job = job_store.get(request.args.get('job', ''))
+    if job is not None and job['status'] == 'done':
+        store_results_in_session(job['output_filename'], job['result'])
+    
     # Get file reference from session
     output_filename = session.get('output_filename', '')
     instruments = session.get('instruments', [])
@@ -195,76 +571,182 @@ def results():
     if not output_filename:
         # If no file reference in session, redirect to home
         print("WARNING: No output_filename in session, redirecting to index")
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     # Verify file exists (don't read it - too large for template)
-    filepath = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+    filepath = os.path.join(current_app.config['OUTPUT_FOLDER'], output_filename)
     if not os.path.exists(filepath):
         print(f"WARNING: File not found: {filepath}, redirecting to index")
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     # Don't read the MusicXML file - it's too large and causes lag
     # Just pass empty string since we removed the preview section
+    mxl_url = os.path.splitext(download_url)[0] + '.mxl' if download_url else ''
     return render_template('results.html', 
-                         musicxml='',  # Empty - preview removed for performance
+                         musicxml='',  # Empty - the page pages through /preview instead
+                         preview_url=url_for('.preview', filename=output_filename),
                          instruments=instruments,
                          tempo=tempo,
                          download_url=download_url,
+                         mxl_url=mxl_url,
                          explanations=explanations)
 
-@app.route('/download/<filename>')
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Pipeline and cache metrics in Prometheus text format"""
+    cache = result_cache.stats()
+    stored = storage.stats()
+    queue = job_queue.stats()
+    text = metrics.render(gauges={
+        'jobs_pending': ('Conversion jobs queued or running', job_queue.pending()),
+        'jobs_waiting': ('Jobs held back for a worker or for memory', queue['waiting']),
+        'memory_reserved_bytes': ('Estimated memory of the running jobs', queue['memory_reserved']),
+        'memory_reserved_total_bytes': ('Estimated memory of the running jobs of all web processes',
+                                        queue['memory_reserved_total']),
+        'memory_budget_bytes': ('Estimated job memory allowed at once (0 = no limit)',
+                                current_app.config['MEMORY_BUDGET_BYTES'] or 0),
+        'result_cache_hits': ('Result cache hits since start', cache['hits']),
+        'result_cache_misses': ('Result cache misses since start', cache['misses']),
+        'result_cache_entries': ('Conversions stored in the result cache', cache['entries']),
+        'result_cache_bytes': ('Size of stored result cache artifacts', cache['bytes']),
+        'output_bytes': ('Size of generated scores on disk', stored['bytes']),
+        'output_files': ('Generated score files on disk', stored['files']),
+        'output_evictions_ttl': ('Scores removed after their idle TTL since start', stored['evictions']['ttl']),
+        'output_evictions_size': ('Scores removed to stay under the byte cap since start', stored['evictions']['size'])
+    })
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@bp.route('/cache/stats')
+def cache_stats():
+    """Hit-rate statistics for the conversion result cache"""
+    return jsonify(result_cache.stats())
+
+@bp.route('/storage/stats')
+def storage_stats():
+    """Disk usage and eviction counts for generated scores"""
+    return jsonify(storage.stats())
+
+def send_score(filepath):
+    """Send an output file with the download name and type for its format"""
+    storage.touch(filepath)
+    if filepath.endswith('.mxl'):
+        return send_download(filepath, 'orchestral_score.mxl', MXL_MIMETYPE)
+    return send_download(filepath, 'orchestral_score.musicxml', 'application/xml')
+
+@bp.route('/download/<filename>')
 def download(filename):
     """
-    Download the generated MusicXML file using streaming for large files.
-    Similar to how Google Drive handles large downloads.
+    Download a generated score. Supports Range requests, ETag validation and
+    gzip transfer; <name>.mxl serves the zipped MusicXML, built on first request.
     """
-    filepath = os.path.join(app.config['OUTPUT_FOLDER'], filename)
+    filepath = safe_join(current_app.config['OUTPUT_FOLDER'], filename)
     
-    if os.path.exists(filepath):
-        # Get file size for proper headers
-        file_size = os.path.getsize(filepath)
-        
-        # Use streaming for large files (like Google Drive does)
-        def generate():
-            with open(filepath, 'rb') as f:
-                # Stream in chunks to handle large files efficiently
-                chunk_size = 8192  # 8KB chunks
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    yield chunk
-        
-        from flask import Response
-        response = Response(
-            generate(),
-            mimetype='application/xml',
-            headers={
-                'Content-Disposition': f'attachment; filename=orchestral_score.musicxml',
-                'Content-Type': 'application/xml; charset=utf-8',
-                'Content-Length': str(file_size),
-                'Accept-Ranges': 'bytes',  # Support for range requests
-            }
-        )
-        return response
+    if filepath and filename.endswith('.mxl') and not os.path.exists(filepath):
+        xml_path = os.path.splitext(filepath)[0] + '.musicxml'
+        if os.path.isfile(xml_path):
+            write_mxl(xml_path, filepath)
+    
+    if filepath and os.path.isfile(filepath):
+        return send_score(filepath)
     else:
-        # Fallback: try to get filename from session and read file
+        # Fallback: try to get filename from session
         output_filename = session.get('output_filename', '')
         if output_filename:
-            fallback_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+            fallback_path = os.path.join(current_app.config['OUTPUT_FOLDER'], output_filename)
             if os.path.exists(fallback_path):
-                return send_file(
-                    fallback_path,
-                    as_attachment=True,
-                    download_name='orchestral_score.musicxml',
-                    mimetype='application/xml'
-                )
+                return send_score(fallback_path)
         return jsonify({
             'success': False,
             'error': 'File not found'
         }), 404
 
-@app.route('/download-blob')
+@bp.route('/preview/<filename>')
+def preview(filename):
+    """
+    A page of measures from a generated score, read through its measure index.
+    Query: start/end (1-based, inclusive), parts=P1,P3 and format=json|xml.
+    """
+    filepath = safe_join(current_app.config['OUTPUT_FOLDER'], filename)
+    if not filepath or not filename.endswith('.musicxml') or not os.path.isfile(filepath):
+        return jsonify({
+            'success': False,
+            'error': 'File not found'
+        }), 404
+    
+    fmt = request.args.get('format', 'json')
+    part_ids = [p for p in request.args.get('parts', '').split(',') if p]
+    try:
+        start = int(request.args.get('start', 1))
+        end = int(request.args.get('end', start + current_app.config['PREVIEW_MEASURES'] - 1))
+        if fmt not in ('json', 'xml'):
+            raise ValueError("format must be 'json' or 'xml'")
+        if start < 1 or end < start:
+            raise ValueError('start must be >= 1 and end >= start')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid preview request: {e}'
+        }), 400
+    
+    storage.touch(filepath)
+    try:
+        index = load_index(filepath)
+        total = measure_count(index)
+        if not total:
+            raise ValueError('No complete measures')
+    except SCORE_READ_ERRORS as e:
+        return unreadable_score(filename, e)
+    
+    try:
+        if start > total:
+            raise ValueError(f'The score has {total} measures')
+        select_parts(index, part_ids)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid preview request: {e}'
+        }), 400
+    
+    end = min(end, start + current_app.config['PREVIEW_MAX_MEASURES'] - 1, total)
+    try:
+        response = preview_response(filepath, index, fmt, start, end, part_ids)
+    except SCORE_READ_ERRORS:
+        # The index no longer matches the file (hand-edited or replaced
+        # in place); rebuild it once before giving up on the score
+        try:
+            response = preview_response(filepath, build_index(filepath), fmt, start, end, part_ids)
+        except SCORE_READ_ERRORS as e:
+            return unreadable_score(filename, e)
+    
+    # Fragments only change when the score does
+    response.set_etag(f"{file_etag(filepath)}-{fmt}-{start}-{end}-{','.join(part_ids)}")
+    return response.make_conditional(request)
+
+# What a damaged score, or an index out of step with it, raises while being read
+SCORE_READ_ERRORS = (ET.ParseError, OSError, KeyError, IndexError, ValueError)
+
+def preview_response(filepath, index, fmt, start, end, part_ids):
+    """Measures start..end of the selected parts as XML or JSON"""
+    if fmt == 'xml':
+        return Response(read_fragment(filepath, index, start - 1, end - 1, part_ids),
+                        mimetype='application/xml')
+    return jsonify({
+        'success': True,
+        'start': start,
+        'end': end,
+        'total_measures': measure_count(index),
+        'parts': [{'id': part['id'], 'name': part['name']} for part in index['parts']],
+        'fragment': read_fragment_json(filepath, index, start - 1, end - 1, part_ids)
+    })
+
+def unreadable_score(filename, error):
+    print(f"⚠️ Cannot preview {filename}: {error!r}")
+    return jsonify({
+        'success': False,
+        'error': 'This score cannot be read, please convert the file again'
+    }), 409
+
+@bp.route('/download-blob')
 def download_blob():
     """Alternative download endpoint that streams MusicXML from file"""
     output_filename = session.get('output_filename', '')
@@ -274,34 +756,18 @@ def download_blob():
             'error': 'No MusicXML file available'
         }), 404
     
-    filepath = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+    filepath = os.path.join(current_app.config['OUTPUT_FOLDER'], output_filename)
     if not os.path.exists(filepath):
         return jsonify({
             'success': False,
             'error': 'File not found'
         }), 404
     
-    # Stream from file
-    return send_file(
-        filepath,
-        as_attachment=True,
-        download_name='orchestral_score.musicxml',
-        mimetype='application/xml'
-    )
+    return send_score(filepath)
 
 if __name__ == '__main__':
-    try:
-        print("Starting MIDI Converter server...")
-        print(f"Upload limit: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024):.0f}MB")
-        print("Cleanup registered: Output files will be deleted on server shutdown")
-        app.run(debug=True, host='0.0.0.0', port=5001)
-    except KeyboardInterrupt:
-        print("\nServer shutting down...")
-        cleanup_output_files()
-        cleanup_upload_files()
-    except Exception as e:
-        print(f"Server error: {e}")
-        cleanup_output_files()
-        cleanup_upload_files()
-        raise
-
+    # Development server; for production serve wsgi.py with a pre-fork WSGI server
+    app = create_app()
+    print("Starting MIDI Converter server...")
+    print(f"Upload limit: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024):.0f}MB")
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=int(os.getenv('PORT', '5001')))
@@ -0,0 +1,190 @@
+"""
+Benchmark command line.
+
+    python -m benchmarks run --output benchmarks/results/baseline.json
+    python -m benchmarks run --output benchmarks/results/current.json
+    python -m benchmarks compare benchmarks/results/baseline.json benchmarks/results/current.json
+    python -m benchmarks generate big.mid --notes 1000000 --polyphony 8
+    python -m benchmarks load --requests 100 --concurrency 16
+    python -m benchmarks memory --output memory_model.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.bench import CASES, DEFAULT_CASES, compare, run_suite
+from benchmarks.synthetic_midi import DEFAULT_RESOLUTION, generate_midi
+from benchmarks.load_test import run_load_test
+from benchmarks.memory import check_model, measure_memory, read_samples
+from utils.admission import MemoryModel
+
+DEFAULT_OUTPUT = os.path.join("benchmarks", "results", "latest.json")
+
+
+def cmd_run(args):
+    cases = args.cases.split(",")
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        print(f"❌ Unknown case(s) {', '.join(unknown)}; choose from {', '.join(CASES)}")
+        return 2
+    render_workers = [int(n) for n in args.render_workers.split(",")]
+    report = run_suite(cases, args.repeat, args.engines.split(","), args.workdir, render_workers)
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows, regressed = compare(baseline, current, args.threshold, args.min_delta)
+    print(f"{'case':<8} {'stage':<16} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, stage, base, cur, ratio, slower in rows:
+        flag = "  ❌ REGRESSION" if slower else ""
+        print(f"{name:<8} {stage:<16} {base:10.4f} {cur:10.4f} {ratio:7.2f}{flag}")
+
+    if regressed:
+        print(f"❌ Regression beyond {args.threshold:.0%}")
+        return 1
+    print("✅ No regressions")
+    return 0
+
+
+def cmd_generate(args):
+    generate_midi(
+        args.path, notes=args.notes, polyphony=args.polyphony,
+        pitch_low=args.pitch_low, pitch_high=args.pitch_high,
+        tempo_changes=args.tempo_changes, tracks=args.tracks,
+        resolution=args.resolution, seed=args.seed
+    )
+    print(f"✅ Wrote {args.notes} notes to {args.path}")
+    return 0
+
+
+def cmd_load(args):
+    report = run_load_test(
+        url=args.url, requests=args.requests, concurrency=args.concurrency, notes=args.notes,
+        wait=not args.no_wait, same_file=args.same_file, llm_latency=args.llm_latency,
+        planner=args.planner, renderer=args.renderer
+    )
+    print(f"    {report['requests_per_second']:.2f} requests/s over {report['seconds']:.2f}s, "
+          f"responses {report['statuses']}, jobs {report['jobs']}")
+    for name in ("accepted_latency", "done_latency"):
+        latency = report[name]
+        if latency:
+            print(f"    {name:<17} p50 {latency['p50'] * 1000:8.1f}ms  p99 {latency['p99'] * 1000:8.1f}ms")
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0
+
+
+def cmd_memory(args):
+    if args.log:
+        samples = read_samples(args.log)
+    else:
+        cases = args.cases.split(",")
+        unknown = [name for name in cases if name not in CASES]
+        if unknown:
+            print(f"❌ Unknown case(s) {', '.join(unknown)}; choose from {', '.join(CASES)}")
+            return 2
+        samples = measure_memory(cases, args.engines.split(","), args.workdir)
+    if not samples:
+        print("❌ No memory samples to fit")
+        return 1
+
+    model = MemoryModel.fit(samples, margin=args.margin)
+    print(f"{'notes':>9} {'engine':<8} {'stage':<12} {'actual MB':>10} {'model MB':>10}")
+    for notes, renderer, stage, actual, estimate in check_model(model, samples):
+        print(f"{notes:9d} {renderer:<8} {stage:<12} {actual / 2 ** 20:10.1f} {estimate / 2 ** 20:10.1f}")
+    if args.output:
+        model.save(args.output)
+        print(f"✅ Model written to {args.output}; serve with MEMORY_MODEL={args.output}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Pipeline benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Benchmark every stage on synthetic MIDI files")
+    run.add_argument("--cases", default=",".join(DEFAULT_CASES),
+                     help=f"Comma-separated cases from {', '.join(CASES)}")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per stage (best is compared)")
+    run.add_argument("--engines", default="direct",
+                     help="Comma-separated render engines (music21 is skipped on large cases)")
+    run.add_argument("--render-workers", default="1",
+                     help="Comma-separated render pool sizes to time, e.g. 1,2,4")
+    run.add_argument("--output", default=DEFAULT_OUTPUT)
+    run.add_argument("--workdir", default=None, help="Where to put generated MIDI files")
+    run.set_defaults(func=cmd_run)
+
+    cmp = commands.add_parser("compare", help="Fail if any stage regressed against a baseline")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.25,
+                     help="Allowed fractional slowdown per stage (default 0.25 = 25%%)")
+    cmp.add_argument("--min-delta", type=float, default=0.005,
+                     help="Ignore slowdowns smaller than this many seconds")
+    cmp.set_defaults(func=cmd_compare)
+
+    gen = commands.add_parser("generate", help="Write one synthetic MIDI file")
+    gen.add_argument("path")
+    gen.add_argument("--notes", type=int, default=1000)
+    gen.add_argument("--polyphony", type=int, default=4)
+    gen.add_argument("--pitch-low", type=int, default=36)
+    gen.add_argument("--pitch-high", type=int, default=96)
+    gen.add_argument("--tempo-changes", type=int, default=0)
+    gen.add_argument("--tracks", type=int, default=1)
+    gen.add_argument("--resolution", type=int, default=DEFAULT_RESOLUTION)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.set_defaults(func=cmd_generate)
+
+    load = commands.add_parser("load", help="Concurrent /convert load test with the LLM stubbed")
+    load.add_argument("--url", default=None,
+                      help="Running server to test (default: serve the app in-process with a Gemini stub)")
+    load.add_argument("--requests", type=int, default=50)
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--notes", type=int, default=1000, help="Notes per uploaded file")
+    load.add_argument("--no-wait", action="store_true",
+                      help="Only time until the upload is accepted, not until the job finishes")
+    load.add_argument("--same-file", action="store_true",
+                      help="Upload one file repeatedly (exercises the result cache)")
+    load.add_argument("--llm-latency", type=float, default=0.0,
+                      help="Delay of the in-process Gemini stub per request (seconds)")
+    load.add_argument("--planner", choices=("gemini", "rules"), default=None)
+    load.add_argument("--renderer", choices=("music21", "direct"), default="direct")
+    load.add_argument("--output", default=None, help="Also write the report as JSON")
+    load.set_defaults(func=cmd_load)
+
+    mem = commands.add_parser("memory", help="Fit the admission control memory model")
+    mem.add_argument("--log", default=None,
+                     help="Fit to samples the app logged at MEMORY_SAMPLES_PATH instead of measuring")
+    mem.add_argument("--cases", default=",".join(DEFAULT_CASES),
+                     help=f"Comma-separated cases from {', '.join(CASES)}")
+    mem.add_argument("--engines", default="direct,music21",
+                     help="Comma-separated render engines (music21 is skipped on large cases)")
+    mem.add_argument("--margin", type=float, default=1.2,
+                     help="Headroom over the largest observed bytes per note")
+    mem.add_argument("--output", default=None, help="Where to save the fitted model (JSON)")
+    mem.add_argument("--workdir", default=None, help="Where to put generated MIDI files")
+    mem.set_defaults(func=cmd_memory)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
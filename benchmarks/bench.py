@@ -0,0 +1,180 @@
+"""
+Per-stage benchmarks on synthetic MIDI files.
+
+Each case is generated deterministically, then every pipeline stage is timed
+on its own (parse, roles, features, orchestration with a stubbed Gemini
+client, rendering per engine and render pool size). Results are plain JSON so runs can be saved
+as baselines and compared later.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from agents.midi_analysis_agent import MIDIAnalysisAgent
+from agents.role_assignment_agent import RoleAssignmentAgent
+from agents.note_assignment_agent import NoteAssignmentAgent
+from agents.feature_extraction_agent import FeatureExtractionAgent
+from utils.plan_cache import PlanCache
+from utils.score_renderer import render_score
+from benchmarks.synthetic_midi import generate_midi
+
+# name -> generate_midi arguments
+CASES = {
+    "1k": {"notes": 1_000, "polyphony": 4, "tracks": 1, "tempo_changes": 0},
+    "10k": {"notes": 10_000, "polyphony": 4, "tracks": 4, "tempo_changes": 8},
+    "100k": {"notes": 100_000, "polyphony": 6, "tracks": 8, "tempo_changes": 32,
+             "pitch_low": 21, "pitch_high": 108},
+    "1m": {"notes": 1_000_000, "polyphony": 8, "tracks": 16, "tempo_changes": 64,
+           "pitch_low": 21, "pitch_high": 108},
+}
+DEFAULT_CASES = ("1k", "10k", "100k")
+
+# music21 rendering is orders of magnitude slower; skip it on big cases
+MUSIC21_MAX_NOTES = 10_000
+
+# Plan with deliberately narrow instruments so range reassignment does real work
+STUB_PLAN = {
+    "assignments": {
+        "Melody": ["Oboe", "Trumpet"],
+        "Harmony": ["French Horn"],
+        "Bass": ["Tuba", "Cello"],
+    },
+    "explanations": {
+        "Melody": "Benchmark plan",
+        "Harmony": "Benchmark plan",
+        "Bass": "Benchmark plan",
+    },
+}
+
+
+class StubClient:
+    """
+    Stands in for the Gemini client so orchestration is timed without network calls
+    """
+
+    def __init__(self, plan=STUB_PLAN):
+        self.models = self
+        self._text = json.dumps(plan)
+
+    def generate_content(self, **kwargs):
+        return SimpleNamespace(text=self._text)
+
+
+def _time(fn, repeat):
+    """
+    Run fn repeat times with agent prints silenced. Returns (timing, last result).
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            result = fn()
+            runs.append(time.perf_counter() - t0)
+    timing = {
+        "min": round(min(runs), 6),
+        "median": round(statistics.median(runs), 6),
+        "runs": [round(r, 6) for r in runs],
+    }
+    return timing, result
+
+
+def bench_case(midi_path, repeat=3, engines=("direct",), workdir=None, render_workers=(1,)):
+    """
+    Time every stage on one MIDI file. Returns {"notes": n, "stages": {...}}.
+    """
+    stages = {}
+
+    stages["parse"], (notes, tempo_map) = _time(lambda: MIDIAnalysisAgent().run(midi_path), repeat)
+
+    stages["roles"], (melody, harmony, bass) = _time(lambda: RoleAssignmentAgent().run(notes), repeat)
+    roles = {"Melody": melody, "Harmony": harmony, "Bass": bass}
+
+    stages["features"], features = _time(lambda: FeatureExtractionAgent().run(roles, tempo_map), repeat)
+
+    # A fresh in-memory plan cache per run so the stubbed request path is always taken
+    def orchestrate():
+        agent = NoteAssignmentAgent(plan_cache=PlanCache(path=None), client=StubClient())
+        return agent.run(roles, features)["assignments"]
+
+    stages["orchestrate"], assignments = _time(orchestrate, repeat)
+
+    output_path = os.path.join(workdir or tempfile.gettempdir(), "benchmark_score.musicxml")
+    for engine in engines:
+        if engine == "music21" and len(notes) > MUSIC21_MAX_NOTES:
+            continue
+        for workers in render_workers:
+            # Serial keeps the plain stage name so older baselines still compare
+            stage = f"render_{engine}" if workers == 1 else f"render_{engine}_x{workers}"
+            stages[stage], _ = _time(
+                lambda: render_score(assignments, tempo_map, output_path, engine=engine,
+                                     workers=workers), repeat
+            )
+
+    return {"notes": len(notes), "stages": stages}
+
+
+def run_suite(case_names=DEFAULT_CASES, repeat=3, engines=("direct",), workdir=None,
+              render_workers=(1,)):
+    """
+    Generate and benchmark each named case. Returns the JSON-ready report.
+    """
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "repeat": repeat,
+            "engines": list(engines),
+            "render_workers": list(render_workers),
+            "cpus": os.cpu_count(),
+        },
+        "cases": {},
+    }
+
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for name in case_names:
+            params = CASES[name]
+            midi_path = generate_midi(os.path.join(tmp, f"{name}.mid"), **params)
+            print(f"⏱️  {name}: {params['notes']} notes")
+            result = bench_case(midi_path, repeat, engines, tmp, render_workers)
+            result["params"] = params
+            report["cases"][name] = result
+            for stage, timing in result["stages"].items():
+                print(f"    {stage:<16} {timing['min']:10.4f}s (median {timing['median']:.4f}s)")
+
+    return report
+
+
+def compare(baseline, current, threshold=0.25, min_delta=0.005):
+    """
+    Compare two reports stage by stage on best-of-N time. A stage regresses
+    when it is more than threshold (fractional) slower and the slowdown is
+    above min_delta seconds. Returns (rows, regressed).
+    """
+    rows = []
+    regressed = False
+    for name, case in current["cases"].items():
+        base_case = baseline["cases"].get(name)
+        if base_case is None:
+            continue
+        for stage, timing in case["stages"].items():
+            base = base_case["stages"].get(stage)
+            if base is None:
+                continue
+            ratio = timing["min"] / base["min"] if base["min"] else float("inf")
+            slower = ratio > 1 + threshold and timing["min"] - base["min"] > min_delta
+            regressed = regressed or slower
+            rows.append((name, stage, base["min"], timing["min"], ratio, slower))
+    return rows, regressed
@@ -0,0 +1,201 @@
+"""
+Concurrent /convert load test.
+
+Fires `requests` uploads at the web app from `concurrency` client threads
+and reports throughput plus p50/p99 latency, both until the upload is
+accepted (202) and, with wait=True, until its job has finished. Without a
+url the app is built with create_app() and served in-process on a free
+port, with the Gemini stub standing in for the LLM and every folder in a
+temporary directory. Each upload is a distinct synthetic file unless
+same_file=True, so the result cache does not short-circuit the conversions.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic_midi import generate_midi
+from utils.gemini_stub import start_stub_server
+
+POLL_INTERVAL = 0.05
+
+
+def _multipart(fields, filename, data):
+    boundary = os.urandom(16).hex()
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: audio/midi\r\n\r\n'.encode("utf-8") + data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _request(url, body=None, content_type=None, timeout=60):
+    """
+    (status, JSON body) of a GET, or a POST when body is given
+    """
+    req = urllib.request.Request(url, data=body)
+    if content_type:
+        req.add_header("Content-Type", content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b"{}")
+        except ValueError:
+            return e.code, {}
+
+
+def convert_once(base_url, midi, form, wait=True, timeout=300):
+    """
+    One upload. Returns {"status", "accepted_seconds", "done_seconds", "job_status"}.
+    """
+    body, content_type = _multipart(form, "load_test.mid", midi)
+    t0 = time.perf_counter()
+    status, payload = _request(f"{base_url}/convert", body, content_type)
+    outcome = {
+        "status": status,
+        "accepted_seconds": time.perf_counter() - t0,
+        "done_seconds": None,
+        # Cached uploads answer 200 with the finished result
+        "job_status": "done" if status == 200 else None,
+    }
+    if status == 200:
+        outcome["done_seconds"] = outcome["accepted_seconds"]
+    if status != 202 or not wait:
+        return outcome
+
+    deadline = t0 + timeout
+    while time.perf_counter() < deadline:
+        _, job = _request(f"{base_url}/jobs/{payload['job_id']}")
+        if job.get("status") in ("done", "failed"):
+            outcome["job_status"] = job["status"]
+            outcome["done_seconds"] = time.perf_counter() - t0
+            break
+        time.sleep(POLL_INTERVAL)
+    else:
+        outcome["job_status"] = "timeout"
+    return outcome
+
+
+def _latency(values):
+    if not values:
+        return None
+    p50, p99 = np.percentile(values, (50, 99))
+    return {"p50": round(float(p50), 4), "p99": round(float(p99), 4),
+            "max": round(float(max(values)), 4)}
+
+
+def _serve_in_process(tmp, llm_latency, planner):
+    """
+    Start the stub LLM and the app on free local ports. Returns (base_url, stop).
+    """
+    from werkzeug.serving import make_server
+
+    stub, stub_url = start_stub_server(latency=llm_latency)
+    # Read by the app and by the conversion processes it forks
+    os.environ["GEMINI_BASE_URL"] = stub_url
+    os.environ.setdefault("GEMINI_API_KEY", "load-test")
+    os.environ["PLAN_CACHE_PATH"] = ""
+    os.environ["RESULT_CACHE_DIR"] = os.path.join(tmp, "result_cache")
+    if planner:
+        os.environ["PLANNER"] = planner
+
+    from app import create_app
+    app = create_app({
+        "OUTPUT_FOLDER": os.path.join(tmp, "output"),
+        "ARTIFACT_FOLDER": os.path.join(tmp, "artifacts"),
+        "JOB_FOLDER": os.path.join(tmp, "jobs"),
+        "SECRET_KEY": "load-test",
+    })
+    # One access log line per upload and poll would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        stub.shutdown()
+        app.extensions["converter"].shutdown()
+
+    return f"http://127.0.0.1:{server.server_port}", stop
+
+
+def run_load_test(url=None, requests=50, concurrency=8, notes=1000, wait=True, same_file=False,
+                  llm_latency=0.0, planner=None, renderer="direct"):
+    """
+    Run the load test. Returns the JSON-ready report.
+    """
+    form = {"renderer": renderer}
+    if planner:
+        form["planner"] = planner
+
+    with tempfile.TemporaryDirectory() as tmp:
+        midis = []
+        for i in range(1 if same_file else requests):
+            path = generate_midi(os.path.join(tmp, f"load_{i}.mid"), notes=notes, seed=i)
+            with open(path, "rb") as f:
+                midis.append(f.read())
+
+        stop = None
+        base_url = url.rstrip("/") if url else None
+        if base_url is None:
+            base_url, stop = _serve_in_process(tmp, llm_latency, planner)
+        print(f"⏱️  {requests} uploads of {notes} notes, {concurrency} at a time, against {base_url}")
+
+        try:
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(
+                    lambda i: convert_once(base_url, midis[i % len(midis)], form, wait),
+                    range(requests)
+                ))
+            seconds = time.perf_counter() - t0
+        finally:
+            if stop is not None:
+                stop()
+
+    statuses = {}
+    jobs = {}
+    for outcome in outcomes:
+        statuses[str(outcome["status"])] = statuses.get(str(outcome["status"]), 0) + 1
+        if outcome["job_status"]:
+            jobs[outcome["job_status"]] = jobs.get(outcome["job_status"], 0) + 1
+    accepted = [o["accepted_seconds"] for o in outcomes if o["status"] in (200, 202)]
+    done = [o["done_seconds"] for o in outcomes if o["job_status"] == "done"]
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "url": url,
+            "requests": requests,
+            "concurrency": concurrency,
+            "notes": notes,
+            "wait": wait,
+            "same_file": same_file,
+            "llm_latency": llm_latency,
+            "planner": planner,
+            "renderer": renderer,
+            "cpus": os.cpu_count(),
+        },
+        "seconds": round(seconds, 4),
+        # Finished conversions per second when waiting, else accepted uploads
+        "requests_per_second": round((len(done) if wait else len(accepted)) / seconds, 3),
+        "statuses": statuses,
+        "jobs": jobs,
+        "accepted_latency": _latency(accepted),
+        "done_latency": _latency(done),
+    }
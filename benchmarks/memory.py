@@ -0,0 +1,84 @@
+"""
+Memory model calibration.
+
+Measures the memory each pipeline stage adds for synthetic files of every
+case and engine, or reads the samples the web app logs at
+MEMORY_SAMPLES_PATH, and fits utils.admission.MemoryModel to them. Each
+measurement runs in a fresh process, after a small warm-up conversion, so
+lazily loaded libraries and memory kept from earlier runs do not count.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+
+from benchmarks.bench import CASES, MUSIC21_MAX_NOTES
+from benchmarks.synthetic_midi import generate_midi
+from utils.admission import MemoryModel
+from utils.midi_reader import estimate_note_count
+from utils.pipeline import STAGES, run_pipeline
+
+
+def _measure(midi_path, engine, workdir, queue):
+    warmup = generate_midi(os.path.join(workdir, "warmup.mid"), notes=200, seed=1)
+    run_pipeline(warmup, os.path.join(workdir, f"warmup_{engine}.musicxml"),
+                 renderer=engine, planner="rules")
+    with open(midi_path, "rb") as f:
+        estimated_notes = estimate_note_count(f.read())
+    result = run_pipeline(midi_path, os.path.join(workdir, f"measured_{engine}.musicxml"),
+                          renderer=engine, planner="rules")
+    queue.put({
+        "notes": result["metrics"]["notes"],
+        "estimated_notes": estimated_notes,
+        "renderer": engine,
+        "stages": result["metrics"]["memory"]["added_bytes"],
+    })
+
+
+def measure_memory(case_names, engines, workdir=None):
+    """
+    One sample per case and engine, like those the web app logs, each
+    printed next to the current model's (MEMORY_MODEL) prediction
+    """
+    model = MemoryModel.from_env()
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods()
+                                          else None)
+    samples = []
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for name in case_names:
+            params = CASES[name]
+            path = generate_midi(os.path.join(tmp, f"{name}.mid"), seed=0, **params)
+            for engine in engines:
+                if engine == "music21" and params["notes"] > MUSIC21_MAX_NOTES:
+                    continue
+                queue = context.Queue()
+                child = context.Process(target=_measure, args=(path, engine, tmp, queue))
+                child.start()
+                sample = queue.get()
+                child.join()
+                predicted = model.estimate(sample["notes"], engine)["peak"]
+                print(f"📏 {name} {engine}: {max(sample['stages'].values()) / 2 ** 20:.1f} MB peak, "
+                      f"model predicts {predicted / 2 ** 20:.1f} MB")
+                samples.append(sample)
+    return samples
+
+
+def read_samples(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_model(model, samples):
+    """
+    [(notes, renderer, stage, actual bytes, estimated bytes)] per sample stage
+    """
+    rows = []
+    for sample in samples:
+        estimate = model.estimate(sample["notes"], sample["renderer"])["stages"]
+        for stage in STAGES:
+            actual = sample["stages"].get(stage)
+            if actual is not None:
+                rows.append((sample["notes"], sample["renderer"], stage, actual, estimate[stage]))
+    return rows
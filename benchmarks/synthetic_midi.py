@@ -0,0 +1,134 @@
+"""
+Deterministic synthetic MIDI files for benchmarks.
+
+Notes are laid out as a grid of chords: every step starts `polyphony`
+distinct pitches that end before the next step, so at most `polyphony`
+notes sound at once. Chord voices are spread round-robin over the note
+tracks, and tempo changes go in a separate conductor track. Events are
+encoded with numpy so files with millions of notes are generated quickly.
+"""
+import struct
+
+import numpy as np
+
+from utils.midi_reader import MAX_TICK
+
+# A coarse resolution keeps million-note files under the reader's MAX_TICK
+DEFAULT_RESOLUTION = 96
+END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def _varint(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _encode_events(ticks, status, data1, data2):
+    """
+    Encode sorted 3-byte channel events as delta-time + status + data bytes
+    """
+    ticks = np.asarray(ticks, dtype=np.int64)
+    deltas = np.diff(ticks, prepend=0)
+    nbytes = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    sizes = nbytes + 3
+    offsets = np.cumsum(sizes) - sizes
+
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(4):
+        rows = nbytes > k
+        remaining = nbytes[rows] - 1 - k
+        byte = (deltas[rows] >> (7 * remaining)) & 0x7F
+        out[offsets[rows] + k] = byte | np.where(remaining > 0, 0x80, 0)
+    out[offsets + nbytes] = status
+    out[offsets + nbytes + 1] = data1
+    out[offsets + nbytes + 2] = data2
+    return out.tobytes()
+
+
+def _chunk(kind, body):
+    return kind + struct.pack(">L", len(body)) + body
+
+
+def synthetic_notes(notes=1000, polyphony=4, pitch_low=36, pitch_high=96,
+                    resolution=DEFAULT_RESOLUTION, seed=0):
+    """
+    (start_tick, end_tick, pitch, voice) arrays for the synthetic score
+    """
+    span = pitch_high - pitch_low + 1
+    if not 1 <= polyphony <= span:
+        raise ValueError(f"polyphony must be between 1 and the pitch span ({span})")
+
+    rng = np.random.default_rng(seed)
+    steps = -(-notes // polyphony)
+    # One chord per 16th note
+    step_ticks = resolution // 4
+    if steps * step_ticks >= MAX_TICK:
+        raise ValueError(f"{notes} notes at polyphony {polyphony} exceed {MAX_TICK} ticks; "
+                         "lower the resolution or raise the polyphony")
+
+    step_start = np.arange(steps, dtype=np.int64) * step_ticks
+    # Each step lasts between a quarter and a full step, so chords never overlap
+    step_length = rng.integers(step_ticks // 4, step_ticks + 1, steps)
+
+    # Distinct pitches per chord: a random root plus evenly spaced voices
+    root = rng.integers(0, span, steps)
+    spacing = span // polyphony
+    voice = np.arange(polyphony)
+    pitch = pitch_low + (root[:, None] + voice[None, :] * spacing) % span
+
+    start = np.repeat(step_start, polyphony)[:notes]
+    end = start + np.repeat(step_length, polyphony)[:notes]
+    return start, end, pitch.ravel()[:notes], np.tile(voice, steps)[:notes]
+
+
+def generate_midi(path, notes=1000, polyphony=4, pitch_low=36, pitch_high=96,
+                  tempo_changes=0, tracks=1, resolution=DEFAULT_RESOLUTION, seed=0):
+    """
+    Write a type-1 SMF with the given shape. The same arguments always
+    produce byte-identical files. Returns the path.
+    """
+    start, end, pitch, voice = synthetic_notes(
+        notes, polyphony, pitch_low, pitch_high, resolution, seed
+    )
+    rng = np.random.default_rng(seed + 1)
+    last_tick = int(end.max()) if len(end) else 0
+
+    # Conductor track: 4/4, initial tempo and evenly spaced tempo changes
+    conductor = bytearray(b"\x00\xff\x58\x04\x04\x02\x18\x08")
+    change_ticks = [0] + [
+        last_tick * (k + 1) // (tempo_changes + 1) for k in range(tempo_changes)
+    ]
+    bpms = rng.integers(60, 181, len(change_ticks))
+    previous = 0
+    for tick, bpm in zip(change_ticks, bpms.tolist()):
+        conductor += _varint(tick - previous) + b"\xff\x51\x03" + struct.pack(">L", 60_000_000 // bpm)[1:]
+        previous = tick
+    conductor += END_OF_TRACK
+
+    chunks = [_chunk(b"MTrk", bytes(conductor))]
+    for track in range(tracks):
+        rows = voice % tracks == track
+        channel = track % 16
+        if channel == 9:
+            # Keep notes off the GM drum channel
+            channel = 10
+        ticks = np.concatenate([end[rows], start[rows]])
+        # Note-offs sort before note-ons at the same tick
+        is_on = np.r_[np.zeros(rows.sum(), dtype=np.int64), np.ones(rows.sum(), dtype=np.int64)]
+        pitches = np.concatenate([pitch[rows], pitch[rows]])
+        order = np.lexsort((pitches, is_on, ticks))
+        status = np.where(is_on[order] == 1, 0x90, 0x80) | channel
+        velocity = np.where(is_on[order] == 1, 80, 0)
+        body = _encode_events(ticks[order], status, pitches[order], velocity)
+        chunks.append(_chunk(b"MTrk", body + END_OF_TRACK))
+
+    header = _chunk(b"MThd", struct.pack(">hhh", 1, tracks + 1, resolution))
+    with open(path, "wb") as f:
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+    return path
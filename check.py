@@ -1,9 +1,29 @@
-from google import genai
-import os
+import argparse
+import time
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from dotenv import load_dotenv
 
-models = client.models.list()
+from utils.gemini_client import get_client, get_model_name, list_models
 
-for m in models:
-    print(m.name)
+load_dotenv()
+
+parser = argparse.ArgumentParser(description="Gemini connectivity diagnostics")
+parser.add_argument("--ping", type=int, default=0,
+                    help="Send N small generate_content requests and report latency")
+args = parser.parse_args()
+
+client = get_client()
+
+for name in list_models(client):
+    print(name)
+
+if args.ping:
+    latencies = []
+    for _ in range(args.ping):
+        t0 = time.perf_counter()
+        client.models.generate_content(model=get_model_name(), contents="ping")
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    print(f"{args.ping} request(s): min {latencies[0] * 1000:.1f}ms, "
+          f"median {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"max {latencies[-1] * 1000:.1f}ms")
@@ -1,35 +1,118 @@
+import argparse
+import json
 import os
+import sys
 from dotenv import load_dotenv
 
-from agents.midi_analysis_agent import MIDIAnalysisAgent
 from agents.role_assignment_agent import RoleAssignmentAgent
 from agents.note_assignment_agent import NoteAssignmentAgent
-from agents.feature_extraction_agent import FeatureExtractionAgent
-from utils.score_renderer import render_score
+from utils.score_renderer import ENGINES, FORMATS
+from utils.batch import run_batch
+from utils.pipeline import run_pipeline
+from utils.import_profile import profile_imports
 
 load_dotenv()
 
 INPUT_MIDI = "input.mid"
+OUTPUT_PATH = os.path.join("output", "orchestral_score.musicxml")
 
-midi_agent = MIDIAnalysisAgent()
-role_agent = RoleAssignmentAgent()
-note_agent = NoteAssignmentAgent()
-feature_agent = FeatureExtractionAgent()
 
-notes, tempo = midi_agent.run(INPUT_MIDI)
-melody, harmony, bass = role_agent.run(notes)
-roles = {
-    "Melody": melody,
-    "Harmony": harmony,
-    "Bass": bass
-}
-features = feature_agent.run(roles, tempo)
+def convert_single(profile_dir=None, output_format=None, **options):
+    profile_prefix = os.path.join(profile_dir, "orchestral_score") if profile_dir else None
+    result = run_pipeline(INPUT_MIDI, OUTPUT_PATH, output_format=output_format,
+                          profile_prefix=profile_prefix, **options)
 
-assignments = note_agent.run(roles,features)
-for inst, notes in assignments.items():
-    print(inst, notes[0])
-    break
+    for stage, entry in result["metrics"]["stages"].items():
+        print(f"  {stage:<12} {entry['wall_seconds']:8.3f}s wall {entry['cpu_seconds']:8.3f}s cpu")
+    if "profile" in result:
+        print(f"📊 Profile written to {', '.join(result['profile'])}")
 
-render_score(assignments, tempo)
+    print("✅ Orchestral MusicXML generated in ./output/")
+    return result
 
-print("✅ Orchestral MusicXML generated in ./output/")
+
+def write_report(path, entries):
+    """
+    JSON timing report: every file's metrics plus per-stage totals
+    """
+    totals = {}
+    for entry in entries:
+        for stage, timing in entry.get("metrics", {}).get("stages", {}).items():
+            total = totals.setdefault(stage, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+            total["wall_seconds"] = round(total["wall_seconds"] + timing["wall_seconds"], 4)
+            total["cpu_seconds"] = round(total["cpu_seconds"] + timing["cpu_seconds"], 4)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"files": entries, "stage_totals": totals}, f, indent=2)
+    print(f"📊 Timing report written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert MIDI files to orchestral MusicXML")
+    parser.add_argument("inputs", nargs="*",
+                        help="MIDI files, directories or glob patterns to convert in batch "
+                             f"(default: convert {INPUT_MIDI} only)")
+    parser.add_argument("-o", "--output-dir", default=os.path.join("output", "batch"),
+                        help="Directory for batch outputs and the manifest")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Conversion processes (default: one per CPU)")
+    parser.add_argument("--llm-concurrency", type=int, default=2,
+                        help="Max simultaneous Gemini requests across all workers")
+    parser.add_argument("--manifest", default=None,
+                        help="Manifest path (default: <output-dir>/manifest.jsonl)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reconvert files the manifest lists as done")
+    parser.add_argument("--renderer", choices=ENGINES, default=None)
+    parser.add_argument("--format", choices=FORMATS, default=None, dest="output_format",
+                        help="musicxml, compressed mxl, or both (default: $SCORE_FORMAT or musicxml)")
+    parser.add_argument("--role-mode", choices=RoleAssignmentAgent.MODES, default=None)
+    parser.add_argument("--planner", choices=NoteAssignmentAgent.PLANNERS, default=None,
+                        help="gemini, or rules to plan offline without any network call "
+                             "(default: $PLANNER or gemini)")
+    parser.add_argument("--llm-budget", type=float, default=None, metavar="SECONDS",
+                        help="Use the rule plan when Gemini takes longer than this "
+                             "(default: $LLM_BUDGET_SECONDS, or wait)")
+    parser.add_argument("--report", default=None,
+                        help="Write a JSON timing report (per-stage wall/CPU time, memory, LLM stats)")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="Write cProfile and tracemalloc dumps for each conversion to DIR")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="Report the import time of every module the run loads "
+                             "(re-runs the command under python -X importtime)")
+    args = parser.parse_args()
+
+    if args.profile_imports:
+        return profile_imports([arg for arg in sys.argv if arg != "--profile-imports"])
+
+    if not args.inputs:
+        result = convert_single(args.profile, args.output_format, renderer=args.renderer,
+                                role_mode=args.role_mode, planner=args.planner,
+                                llm_budget=args.llm_budget)
+        if args.report:
+            write_report(args.report, [{"input": INPUT_MIDI, "output": result["output_path"],
+                                        "status": "done", "timings": result["timings"],
+                                        "metrics": result["metrics"]}])
+        return
+
+    summary = run_batch(
+        args.inputs,
+        args.output_dir,
+        workers=args.workers,
+        llm_concurrency=args.llm_concurrency,
+        manifest_path=args.manifest,
+        force=args.force,
+        profile_dir=args.profile,
+        renderer=args.renderer,
+        output_format=args.output_format,
+        role_mode=args.role_mode,
+        planner=args.planner,
+        llm_budget=args.llm_budget
+    )
+    print(f"✅ Batch finished: {summary['done']} converted, {summary['failed']} failed, "
+          f"{summary['skipped']} skipped")
+    if args.report:
+        write_report(args.report, summary["entries"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
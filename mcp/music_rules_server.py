@@ -1,3 +1,5 @@
+import numpy as np
+
 class MusicRulesServer:
     INSTRUMENT_RANGES = {
         # Strings
@@ -63,6 +65,11 @@ class MusicRulesServer:
         "Voice Oohs": (48, 84),  # C3-C6
     }
 
+    NUM_PITCHES = 128
+
+    def __init__(self):
+        self._build_index()
+
     def validate_pitch(self, instrument, pitch):
         """
         Validate if a pitch is within the instrument's playable range.
@@ -76,6 +83,48 @@ class MusicRulesServer:
         low, high = self.INSTRUMENT_RANGES[instrument]
         return low <= pitch <= high
     
+    def _build_index(self):
+        """
+        Precompute a (instrument x MIDI pitch) playability table so range
+        checks and reassignment become array lookups instead of scans.
+        """
+        self.instrument_names = list(self.INSTRUMENT_RANGES)
+        self._instrument_ids = {name: i for i, name in enumerate(self.instrument_names)}
+
+        pitches = np.arange(self.NUM_PITCHES)
+        ranges = np.array([self.INSTRUMENT_RANGES[name] for name in self.instrument_names])
+        self._playable = (pitches >= ranges[:, :1]) & (pitches <= ranges[:, 1:])
+
+        self._lookup_cache = {}
+
+    def _suitable_lookup(self, current_instrument, preferred_instruments):
+        """
+        128-entry table mapping each pitch to the instrument id that
+        find_suitable_instrument would pick (-1 when none fits)
+        """
+        preferred = tuple(
+            inst for inst in preferred_instruments if inst in self._instrument_ids
+        )
+        key = (current_instrument, preferred)
+        lookup = self._lookup_cache.get(key)
+        if lookup is not None:
+            return lookup
+
+        # Search order: preferred instruments first, then every other instrument
+        order = [self._instrument_ids[inst] for inst in preferred]
+        order += [
+            i for i, name in enumerate(self.instrument_names)
+            if name != current_instrument
+        ]
+        candidates = self._playable[order]
+
+        lookup = np.full(self.NUM_PITCHES, -1, dtype=np.intp)
+        fits = candidates.any(axis=0)
+        lookup[fits] = np.asarray(order)[candidates.argmax(axis=0)[fits]]
+
+        self._lookup_cache[key] = lookup
+        return lookup
+
     def find_suitable_instrument(self, pitch, current_instrument=None, preferred_instruments=None):
         """
         Find a suitable instrument for a given pitch.
@@ -84,36 +133,51 @@ class MusicRulesServer:
         if preferred_instruments is None:
             preferred_instruments = []
         
-        # First, try preferred instruments
-        for inst in preferred_instruments:
-            if inst in self.INSTRUMENT_RANGES and self.validate_pitch(inst, pitch):
-                return inst
+        if not 0 <= pitch < self.NUM_PITCHES:
+            return None
+        
+        inst_id = self._suitable_lookup(current_instrument, preferred_instruments)[pitch]
+        return self.instrument_names[inst_id] if inst_id >= 0 else None
+    
+    def find_suitable_instruments(self, pitches, current_instrument=None, preferred_instruments=None):
+        """
+        Bulk version of find_suitable_instrument over a pitch array.
+        Returns an array of indices into self.instrument_names (-1 if none fits).
+        """
+        if preferred_instruments is None:
+            preferred_instruments = []
+        
+        pitches = np.asarray(pitches, dtype=np.intp)
+        lookup = self._suitable_lookup(current_instrument, preferred_instruments)
         
-        # Then, search all instruments
-        for inst, (low, high) in self.INSTRUMENT_RANGES.items():
-            if inst == current_instrument:
-                continue  # Skip current instrument
-            if low <= pitch <= high:
-                return inst
+        targets = np.full(len(pitches), -1, dtype=np.intp)
+        valid = (pitches >= 0) & (pitches < self.NUM_PITCHES)
+        targets[valid] = lookup[pitches[valid]]
+        return targets
+    
+    def range_mask(self, instrument, pitches):
+        """
+        Boolean mask of the pitches playable by the instrument.
+        Unknown instruments accept every pitch (backward compatible).
+        """
+        pitches = np.asarray(pitches, dtype=np.intp)
+        if instrument not in self._instrument_ids:
+            return np.ones(len(pitches), dtype=bool)
         
-        return None
+        mask = np.zeros(len(pitches), dtype=bool)
+        valid = (pitches >= 0) & (pitches < self.NUM_PITCHES)
+        mask[valid] = self._playable[self._instrument_ids[instrument], pitches[valid]]
+        return mask
     
     def filter_notes_by_range(self, instrument, notes):
         """
         Filter notes to only include those within the instrument's range.
-        Returns tuple: (valid_notes, invalid_notes)
+        Takes a NoteTable and returns tuple of views: (valid_notes, invalid_notes)
         """
         if instrument not in self.INSTRUMENT_RANGES:
             # Unknown instrument - return all notes (backward compatible)
-            return notes, []
-        
-        valid_notes = []
-        invalid_notes = []
+            return notes, notes.select(slice(0, 0))
         
-        for note in notes:
-            if self.validate_pitch(instrument, note["pitch"]):
-                valid_notes.append(note)
-            else:
-                invalid_notes.append(note)
+        in_range = self.range_mask(instrument, notes.pitch)
         
-        return valid_notes, invalid_notes
+        return notes.select(in_range), notes.select(~in_range)
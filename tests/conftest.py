@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Modules import each other as utils.*, agents.*, mcp.* from the repo root
+root_dir = Path(__file__).parent.parent
+if str(root_dir) not in sys.path:
+    sys.path.insert(0, str(root_dir))
@@ -0,0 +1,103 @@
+"""
+The web app end to end: uploads go through the job queue (real worker
+processes, rule planner, direct renderer) into folders under tmp_path.
+"""
+import io
+import json
+import os
+import time
+
+import pytest
+
+from app import create_app
+
+INPUT_MIDI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input.mid")
+JOB_TIMEOUT = 120
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("PLAN_CACHE_PATH", "")
+    monkeypatch.setenv("RESULT_CACHE_DIR", str(tmp_path / "result_cache"))
+    monkeypatch.delenv("MEMORY_BUDGET_BYTES", raising=False)
+    app = create_app({
+        "OUTPUT_FOLDER": str(tmp_path / "output"),
+        "ARTIFACT_FOLDER": str(tmp_path / "artifacts"),
+        "JOB_FOLDER": str(tmp_path / "jobs"),
+        "SECRET_KEY": "test",
+        "JOB_WORKERS": 1,
+    })
+    yield app
+    app.extensions["converter"].shutdown()
+
+
+def upload(client):
+    with open(INPUT_MIDI, "rb") as f:
+        data = f.read()
+    return client.post("/convert", data={
+        "file": (io.BytesIO(data), "input.mid"),
+        "planner": "rules",
+        "renderer": "direct",
+    }, content_type="multipart/form-data")
+
+
+def wait_for_job(client, job_id):
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def parse_events(text):
+    """
+    [(event name, data)] from a text/event-stream body
+    """
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_events_stream_until_done(app):
+    client = app.test_client()
+    response = upload(client)
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    stream = client.get(f"/jobs/{job_id}/events")
+    assert stream.mimetype == "text/event-stream"
+    # Reads the body until the generator stops, at the done event
+    events = parse_events(stream.get_data(as_text=True))
+
+    assert events[-1][0] == "done"
+    assert events[-1][1]["progress"] == 1.0
+    assert all(name in ("queued", "running", "done") for name, _ in events)
+    assert events[-1][1]["download_url"].endswith(".musicxml")
+
+
+def test_cached_score_survives_the_output_sweep(app):
+    services = app.extensions["converter"]
+    client = app.test_client()
+    job = wait_for_job(client, upload(client).get_json()["job_id"])
+    assert job["status"] == "done"
+    # The result is cached by the completion hook, just after the job is done
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while services.result_cache.stats()["entries"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    # A cached artifact last read longer than OUTPUT_TTL ago
+    artifact = services.result_cache.artifact_path(services.job_store.get(job["job_id"])["cache_key"])
+    stale = time.time() - 2 * 24 * 3600
+    os.utime(artifact, (stale, stale))
+
+    response = upload(client)
+    assert response.status_code == 200
+    assert response.get_json()["cached"] is True
+    services.storage.sweep()
+
+    download = client.get(response.get_json()["download_url"])
+    assert download.status_code == 200
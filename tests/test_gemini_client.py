@@ -0,0 +1,82 @@
+"""
+The shared Gemini client against the local stub server: one client per
+process, GEMINI_TIMEOUT applied to requests, and 5xx answers retried.
+"""
+import time
+
+import httpx
+import pytest
+from google.genai import errors
+
+from utils import gemini_client
+from utils.gemini_client import get_client, get_model_name, reset_client
+from utils.gemini_stub import start_stub_server
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """
+    Start a stub with the given options and point a fresh client at it
+    """
+    servers = []
+
+    def start(**options):
+        server, url = start_stub_server(**options)
+        servers.append(server)
+        monkeypatch.setenv("GEMINI_BASE_URL", url)
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        reset_client()
+        return server
+
+    monkeypatch.setenv("GEMINI_RETRY_INITIAL_DELAY", "0.01")
+    monkeypatch.setenv("GEMINI_RETRY_MAX_DELAY", "0.05")
+    yield start
+    reset_client()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _ask(client):
+    return client.models.generate_content(model=get_model_name(), contents="ping").text
+
+
+def test_one_shared_client(stub):
+    server = stub()
+    client = get_client()
+    assert get_client() is client
+    assert gemini_client._client is client
+
+    assert "assignments" in _ask(client)
+    assert "assignments" in _ask(get_client())
+    assert server.RequestHandlerClass.requests_served == 2
+
+
+def test_timeout_is_applied(stub, monkeypatch):
+    monkeypatch.setenv("GEMINI_TIMEOUT", "0.2")
+    monkeypatch.setenv("GEMINI_RETRY_ATTEMPTS", "1")
+    stub(latency=2.0)
+
+    t0 = time.perf_counter()
+    with pytest.raises(httpx.TimeoutException):
+        _ask(get_client())
+    assert time.perf_counter() - t0 < 1.5
+
+
+def test_retries_server_errors(stub, monkeypatch):
+    monkeypatch.setenv("GEMINI_RETRY_ATTEMPTS", "3")
+    server = stub(fail_first=2)
+
+    assert "assignments" in _ask(get_client())
+    assert server.RequestHandlerClass.requests_failed == 2
+    assert server.RequestHandlerClass.requests_served == 1
+
+
+def test_gives_up_after_the_retry_attempts(stub, monkeypatch):
+    monkeypatch.setenv("GEMINI_RETRY_ATTEMPTS", "2")
+    server = stub(fail_first=5)
+
+    with pytest.raises(errors.ServerError):
+        _ask(get_client())
+    assert server.RequestHandlerClass.requests_failed == 2
+    assert server.RequestHandlerClass.requests_served == 0
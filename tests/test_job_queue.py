@@ -0,0 +1,53 @@
+"""
+The memory budget shared between web processes through MemoryLedger.
+"""
+import multiprocessing
+import os
+import time
+
+from utils.job_queue import JobQueue, JobStore, MemoryLedger
+
+INPUT_MIDI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input.mid")
+JOB_TIMEOUT = 120
+
+
+def test_ledgers_share_one_budget(tmp_path):
+    path = str(tmp_path / "memory.json")
+    first, second = MemoryLedger(path), MemoryLedger(path)
+    assert first.reserve("a", 60, budget=100)
+    assert not second.reserve("b", 60, budget=100)
+    first.release("a")
+    assert second.reserve("b", 60, budget=100)
+    assert first.total() == 60
+
+
+def test_reservations_of_exited_processes_are_dropped(tmp_path):
+    ledger = MemoryLedger(str(tmp_path / "memory.json"))
+    context = multiprocessing.get_context("fork")
+    child = context.Process(target=ledger.reserve, args=("crashed", 80, 100))
+    child.start()
+    child.join()
+    assert ledger.reserve("next", 80, budget=100)
+
+
+def test_job_waits_for_memory_held_by_another_process(tmp_path, monkeypatch):
+    monkeypatch.setenv("PLAN_CACHE_PATH", "")
+    store = JobStore(str(tmp_path / "jobs"))
+    queue = JobQueue(store, workers=1, memory_budget=100)
+    # What another web worker's running job reserved
+    other = MemoryLedger(queue.ledger.path)
+    assert other.reserve("other", 80, budget=100)
+    try:
+        with open(INPUT_MIDI, "rb") as f:
+            job = queue.submit(f.read(), str(tmp_path / "out.musicxml"), memory=50,
+                               planner="rules", renderer="direct")
+        assert queue.stats()["waiting"] == 1
+        assert queue.stats()["memory_reserved_total"] == 80
+
+        other.release("other")
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while store.get(job["id"])["status"] != "done":
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+    finally:
+        queue.shutdown()
@@ -0,0 +1,129 @@
+"""
+SMFReader against pretty_midi on seeded synthetic type-1 files: the notes
+(pitch, start and duration in seconds) and the estimated tempo must be
+exactly equal, not just close.
+"""
+import io
+import struct
+
+import numpy as np
+import pretty_midi
+import pytest
+
+from utils.midi_reader import SMFReader, estimate_tempo
+
+RESOLUTION = 480
+
+
+def _varint(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _track(events):
+    """
+    MTrk chunk from (tick, event bytes) pairs. Channel events repeating
+    the previous status byte are written with running status.
+    """
+    body = bytearray()
+    tick = 0
+    status = None
+    for event_tick, event in sorted(events, key=lambda e: e[0]):
+        body += _varint(event_tick - tick)
+        tick = event_tick
+        if event[0] < 0xF0 and event[0] == status:
+            body += event[1:]
+        else:
+            body += event
+            # Meta and sysex events cancel running status
+            status = event[0] if event[0] < 0xF0 else None
+    body += b"\x00\xff\x2f\x00"
+    return b"MTrk" + struct.pack(">L", len(body)) + bytes(body)
+
+
+def _conductor(rng, length):
+    events = [(0, b"\xff\x58\x04\x04\x02\x18\x08"), (0, b"\xff\x51\x03" + (500000).to_bytes(3, "big"))]
+    for tick in np.sort(rng.integers(1, length, 6)):
+        tempo = int(rng.integers(300000, 1000000))
+        events.append((int(tick), b"\xff\x51\x03" + tempo.to_bytes(3, "big")))
+    # A repeated tempo, which the reader keeps out of its tempo map
+    events.append((length // 2, b"\xff\x51\x03" + (500000).to_bytes(3, "big")))
+    events.append((length // 3, b"\xff\x58\x04\x03\x02\x18\x08"))
+    return _track(events)
+
+
+def _note_track(rng, channel, notes, length):
+    events = []
+    for _ in range(notes):
+        start = int(rng.integers(0, length))
+        end = start + int(rng.choice([0, 1, 60, 120, 240, 480, 960, 1500]))
+        pitch = int(rng.integers(21, 109))
+        events.append((start, bytes([0x90 | channel, pitch, int(rng.integers(1, 128))])))
+        if rng.random() < 0.5:
+            # Note-on with velocity 0 as the note-off
+            events.append((end, bytes([0x90 | channel, pitch, 0])))
+        else:
+            events.append((end, bytes([0x80 | channel, pitch, int(rng.integers(0, 128))])))
+        if rng.random() < 0.2:
+            # Re-struck at the tick it ends: off and on at the same tick
+            events.append((end, bytes([0x90 | channel, pitch, 90])))
+            events.append((end + 240, bytes([0x80 | channel, pitch, 0])))
+
+    # Controller, program, bend and aftertouch noise plus sysex and text
+    for tick in rng.integers(0, length, notes // 4):
+        kind = int(rng.integers(0, 6))
+        if kind == 0:
+            event = bytes([0xB0 | channel, int(rng.integers(0, 120)), int(rng.integers(0, 128))])
+        elif kind == 1:
+            event = bytes([0xC0 | channel, int(rng.integers(0, 128))])
+        elif kind == 2:
+            event = bytes([0xE0 | channel, int(rng.integers(0, 128)), int(rng.integers(0, 128))])
+        elif kind == 3:
+            event = bytes([0xD0 | channel, int(rng.integers(0, 128))])
+        elif kind == 4:
+            payload = bytes([0x7E, 0x7F, 0x09, 0x01])
+            event = b"\xf0" + _varint(len(payload) + 1) + payload + b"\xf7"
+        else:
+            text = b"marker"
+            event = b"\xff\x06" + _varint(len(text)) + text
+        events.append((int(tick), event))
+    return _track(events)
+
+
+def synthetic_smf(seed, tracks=4, notes=300):
+    rng = np.random.default_rng(seed)
+    length = notes * 120
+    chunks = [_conductor(rng, length)]
+    for track in range(tracks):
+        # Channel 9 included: drums are read like any other channel
+        chunks.append(_note_track(rng, (track * 3) % 16, notes, length))
+    header = b"MThd" + struct.pack(">LHHH", 6, 1, len(chunks), RESOLUTION)
+    return header + b"".join(chunks)
+
+
+def _sorted_notes(pitch, start, duration):
+    order = np.lexsort((duration, pitch, start))
+    return np.asarray(pitch)[order], np.asarray(start)[order], np.asarray(duration)[order]
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_notes_and_tempo_match_pretty_midi(seed):
+    data = synthetic_smf(seed)
+    notes = SMFReader().read(data).notes
+
+    midi = pretty_midi.PrettyMIDI(io.BytesIO(data))
+    reference = [note for instrument in midi.instruments for note in instrument.notes]
+    expected = _sorted_notes(
+        np.array([note.pitch for note in reference]),
+        np.array([note.start for note in reference]),
+        np.array([note.end - note.start for note in reference]),
+    )
+
+    assert len(notes) == len(reference)
+    for ours, theirs in zip(_sorted_notes(notes.pitch, notes.start, notes.duration), expected):
+        np.testing.assert_array_equal(ours, theirs)
+    assert estimate_tempo(notes.start) == midi.estimate_tempo()
@@ -0,0 +1,147 @@
+"""
+The direct MusicXML writer against the music21 engine: both renderings of
+the same assignments must hold the same notes per part (onset, pitch and
+duration after joining ties, in quarter notes) over the same number of
+measures. Layout (voices, chord grouping, how ties are split) may differ.
+"""
+import os
+import xml.etree.ElementTree as ET
+from collections import Counter
+from fractions import Fraction
+
+import numpy as np
+import pretty_midi
+
+from agents.midi_analysis_agent import MIDIAnalysisAgent
+from agents.role_assignment_agent import RoleAssignmentAgent
+from agents.note_assignment_agent import NoteAssignmentAgent
+from agents.feature_extraction_agent import FeatureExtractionAgent
+from utils.score_renderer import render_score
+
+INPUT_MIDI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input.mid")
+
+# Fixed so no LLM is asked; two instruments per role exercise range reassignment
+PLAN = {
+    "Melody": ["Violin", "Flute"],
+    "Harmony": ["Viola"],
+    "Bass": ["Cello", "Double Bass"],
+}
+
+STEP_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+
+def write_dense_midi(path, notes=600, seed=7):
+    """
+    Overlapping notes of random lengths over a wide range, so every role
+    needs several voices, chords and ties across barlines
+    """
+    rng = np.random.default_rng(seed)
+    midi = pretty_midi.PrettyMIDI(initial_tempo=96)
+    piano = pretty_midi.Instrument(program=0)
+    starts = np.sort(rng.integers(0, notes * 2, notes)) * 0.125
+    for start, length, pitch in zip(starts, rng.integers(1, 24, notes), rng.integers(30, 96, notes)):
+        piano.notes.append(pretty_midi.Note(velocity=80, pitch=int(pitch),
+                                            start=float(start), end=float(start + length * 0.125)))
+    midi.instruments.append(piano)
+    midi.write(path)
+    return path
+
+
+def orchestrate(midi_path):
+    notes, tempo_map = MIDIAnalysisAgent().run(midi_path)
+    melody, harmony, bass = RoleAssignmentAgent().run(notes)
+    roles = {"Melody": melody, "Harmony": harmony, "Bass": bass}
+    features = FeatureExtractionAgent().run(roles, tempo_map)
+    result = NoteAssignmentAgent(planner="rules").run(roles, features, plan=PLAN)
+    return result["assignments"], tempo_map
+
+
+def _midi_pitch(pitch):
+    return (int(pitch.findtext("octave")) + 1) * 12 + STEP_SEMITONES[pitch.findtext("step")] \
+        + int(float(pitch.findtext("alter", "0")))
+
+
+def read_parts(path):
+    """
+    {part name: (Counter of (onset, pitch, duration), measure count)}
+    """
+    root = ET.parse(path).getroot()
+    names = {sp.get("id"): sp.findtext("part-name") for sp in root.iter("score-part")}
+    parts = {}
+    for part in root.findall("part"):
+        notes = []
+        # Tied notes still waiting for their continuation, by pitch
+        open_ties = {}
+        divisions = 1
+        measure_start = Fraction(0)
+        measures = part.findall("measure")
+        for measure in measures:
+            position = Fraction(0)
+            longest = Fraction(0)
+            last_onset = Fraction(0)
+            for el in measure:
+                if el.tag == "attributes" and el.findtext("divisions"):
+                    divisions = int(el.findtext("divisions"))
+                elif el.tag in ("backup", "forward"):
+                    step = Fraction(int(el.findtext("duration")), divisions)
+                    position += -step if el.tag == "backup" else step
+                elif el.tag == "note":
+                    duration = Fraction(int(el.findtext("duration", "0")), divisions)
+                    if el.find("chord") is not None:
+                        onset = last_onset
+                    else:
+                        onset = measure_start + position
+                        position += duration
+                        last_onset = onset
+                    longest = max(longest, position)
+                    pitch = el.find("pitch")
+                    if pitch is None:
+                        continue
+                    midi_pitch = _midi_pitch(pitch)
+                    ties = {tie.get("type") for tie in el.findall("tie")}
+                    note = None
+                    if "stop" in ties:
+                        pending = open_ties.get(midi_pitch, [])
+                        note = next((n for n in pending if n[0] + n[2] == onset), None)
+                        if note is not None:
+                            pending.remove(note)
+                            note[2] += duration
+                    if note is None:
+                        note = [onset, midi_pitch, duration]
+                        notes.append(note)
+                    if "start" in ties:
+                        open_ties.setdefault(midi_pitch, []).append(note)
+            measure_start += longest
+        parts[names[part.get("id")]] = (Counter(tuple(n) for n in notes), len(measures))
+    return parts
+
+
+def render_both(assignments, tempo_map, tmp_path):
+    paths = {}
+    for engine in ("direct", "music21"):
+        files = render_score(assignments, tempo_map, str(tmp_path / f"{engine}.musicxml"),
+                             engine=engine, workers=1)
+        paths[engine] = files[0]
+    return read_parts(paths["direct"]), read_parts(paths["music21"])
+
+
+def assert_equivalent(direct, reference):
+    assert list(direct) == list(reference)
+    for name in reference:
+        direct_notes, direct_measures = direct[name]
+        reference_notes, reference_measures = reference[name]
+        assert direct_measures == reference_measures, name
+        assert direct_notes == reference_notes, name
+
+
+def test_input_mid_matches_music21(tmp_path):
+    assignments, tempo_map = orchestrate(INPUT_MIDI)
+    assert_equivalent(*render_both(assignments, tempo_map, tmp_path))
+
+
+def test_dense_multi_voice_matches_music21(tmp_path):
+    midi_path = write_dense_midi(str(tmp_path / "dense.mid"))
+    assignments, tempo_map = orchestrate(midi_path)
+    # Several voices per part, or the file is not testing what it should
+    assert max(len(table) for table in assignments.values()) > 100
+    assert_equivalent(*render_both(assignments, tempo_map, tmp_path))
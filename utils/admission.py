@@ -0,0 +1,112 @@
+"""
+Memory estimates for admission control.
+
+MemoryModel predicts how much memory each pipeline stage adds to a worker
+process for a given note count (estimate_note_count gives that cheaply for
+an upload), so JobQueue can hold jobs back while the memory budget is taken
+by others and reject jobs that could never fit. Each finished job reports
+its actual peak, which fit() turns into a calibrated model:
+
+    python -m benchmarks memory --log memory_samples.jsonl --output memory_model.json
+    MEMORY_MODEL=memory_model.json gunicorn ...
+"""
+import json
+import os
+
+from utils.pipeline import STAGES
+
+# Bytes per note each stage adds on top of the worker's footprint before the
+# job, measured on synthetic files; music21 builds a Python object graph per
+# note and needs ~50x what the direct writer does
+DEFAULT_BYTES_PER_NOTE = {
+    "parse": 80,
+    "roles": 80,
+    "features": 120,
+    "orchestrate": 100,
+    "render": {"direct": 160, "music21": 9000},
+}
+# Fixed cost of any job (buffers, agents' per-call state, output writing)
+DEFAULT_OVERHEAD_BYTES = 16 * 1024 * 1024
+# fit() scales the worst observed bytes per note by this
+FIT_MARGIN = 1.2
+
+
+def default_memory_budget():
+    """
+    MEMORY_BUDGET_BYTES, else half the machine's physical memory. "0"
+    disables the budget; None is also returned where memory can't be read.
+    """
+    value = os.getenv("MEMORY_BUDGET_BYTES")
+    if value is not None:
+        return int(value) or None
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class MemoryModel:
+    def __init__(self, bytes_per_note=None, overhead=DEFAULT_OVERHEAD_BYTES):
+        self.bytes_per_note = bytes_per_note or DEFAULT_BYTES_PER_NOTE
+        self.overhead = overhead
+
+    @classmethod
+    def from_env(cls):
+        """
+        The model saved at MEMORY_MODEL, else the defaults above
+        """
+        path = os.getenv("MEMORY_MODEL")
+        return cls.load(path) if path else cls()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["bytes_per_note"], data["overhead"])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"bytes_per_note": self.bytes_per_note, "overhead": self.overhead}, f, indent=2)
+
+    def _rate(self, stage, renderer):
+        rate = self.bytes_per_note[stage]
+        return rate[renderer] if isinstance(rate, dict) else rate
+
+    def estimate(self, notes, renderer="music21"):
+        """
+        {"stages": {stage: bytes}, "peak": bytes} for a job of this many notes.
+        Stages run one after another, so the job's peak is the largest stage.
+        """
+        stages = {stage: int(self.overhead + self._rate(stage, renderer) * notes) for stage in STAGES}
+        return {"stages": stages, "peak": max(stages.values())}
+
+    @classmethod
+    def fit(cls, samples, margin=FIT_MARGIN):
+        """
+        Model covering every sample, each {"notes", "renderer", "stages":
+        {stage: bytes added}} as recorded by finished jobs: per stage (and
+        render engine), the largest bytes per note seen, times margin. The
+        overhead is kept on top as headroom for small jobs, whose added
+        memory is mostly noise. Stages or engines without samples keep the
+        defaults.
+        """
+        model = cls()
+        bytes_per_note = json.loads(json.dumps(model.bytes_per_note))
+        fitted = {}
+        for sample in samples:
+            if sample["notes"] <= 0:
+                continue
+            for stage, added in sample["stages"].items():
+                if added is None:
+                    continue
+                key = (stage, sample["renderer"]) if stage == "render" else (stage, None)
+                rate = added / sample["notes"]
+                fitted[key] = max(fitted.get(key, 0.0), rate)
+
+        for (stage, renderer), rate in fitted.items():
+            rate = int(rate * margin) + 1
+            if renderer is None:
+                bytes_per_note[stage] = rate
+            else:
+                bytes_per_note[stage][renderer] = rate
+        return cls(bytes_per_note, model.overhead)
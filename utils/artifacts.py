@@ -0,0 +1,129 @@
+"""
+Intermediate results of a conversion, kept for re-orchestration.
+
+A JobArtifacts is a path prefix: <prefix>.notes.npz holds the parsed note
+columns, the role split (as row indices) and the tempo map,
+<prefix>.features.json the extracted features, and every rendered part is
+stored as <prefix>.part.<key>.xml, keyed on a hash of everything that went
+into it. Re-running the pipeline with an edited plan then skips parsing,
+role detection, feature extraction and Gemini, and only renders the parts
+whose instrument or notes changed.
+
+All files of one prefix share a stem, so a StorageManager evicts them
+together.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from utils.note_table import NoteTable
+from utils.storage import atomic_output
+from utils.tempo_map import TempoMap
+
+ROLES = ("Melody", "Harmony", "Bass")
+
+
+class ArtifactsMissingError(RuntimeError):
+    pass
+
+
+class JobArtifacts:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.notes_path = f"{prefix}.notes.npz"
+        self.features_path = f"{prefix}.features.json"
+        # Part fragments found / rendered during this run
+        self.hits = 0
+        self.misses = 0
+
+    def has_analysis(self):
+        return os.path.exists(self.notes_path) and os.path.exists(self.features_path)
+
+    def save_analysis(self, notes, tempo_map, roles, features):
+        """
+        Store the parsed notes, tempo map, role split and features.
+        Roles must be views over notes (as RoleAssignmentAgent returns them).
+        """
+        directory = os.path.dirname(self.prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        columns = {f"role_{role}": roles[role].index for role in ROLES}
+        with atomic_output(self.notes_path) as tmp_path:
+            # A file object, since np.savez appends .npz to bare paths
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    pitch=notes.pitch,
+                    start=notes.start,
+                    duration=notes.duration,
+                    change_times=tempo_map.change_times,
+                    change_beats=tempo_map.change_beats,
+                    bpms=tempo_map.bpms,
+                    time_signature=np.array(tempo_map.time_signature),
+                    estimated=np.array(tempo_map.estimated),
+                    **columns
+                )
+        with atomic_output(self.features_path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(features, f)
+
+    def load_analysis(self):
+        """
+        (notes, tempo_map, roles, features) as saved by save_analysis
+        """
+        try:
+            with np.load(self.notes_path) as data:
+                notes = NoteTable(data["pitch"], data["start"], data["duration"])
+                tempo_map = TempoMap(
+                    data["change_times"], data["change_beats"], data["bpms"],
+                    tuple(data["time_signature"].tolist()), bool(data["estimated"])
+                )
+                roles = {role: notes.select(data[f"role_{role}"]) for role in ROLES}
+            with open(self.features_path, "r", encoding="utf-8") as f:
+                features = json.load(f)
+        except FileNotFoundError:
+            raise ArtifactsMissingError("The intermediate results of this conversion have expired")
+        return notes, tempo_map, roles, features
+
+    # ------------------------------------------------------------------
+    # Rendered parts
+    # ------------------------------------------------------------------
+    @staticmethod
+    def key(*values):
+        """
+        Content hash of a part's inputs (arrays by their bytes, anything
+        else by repr)
+        """
+        digest = hashlib.sha256()
+        for value in values:
+            if isinstance(value, np.ndarray):
+                digest.update(value.dtype.str.encode("ascii"))
+                digest.update(np.ascontiguousarray(value).tobytes())
+            else:
+                digest.update(repr(value).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:32]
+
+    def _fragment_path(self, key):
+        return f"{self.prefix}.part.{key}.xml"
+
+    def get(self, key):
+        """
+        The stored fragment (bytes) for key, or None
+        """
+        try:
+            with open(self._fragment_path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        with atomic_output(self._fragment_path(key)) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
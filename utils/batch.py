@@ -0,0 +1,208 @@
+"""
+Batch conversion of many MIDI files.
+
+Files are converted on a process pool while Gemini calls are bounded by a
+separate cross-process semaphore. Every finished file is appended to a JSON
+Lines manifest, so an interrupted run can resume and skip completed work.
+"""
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.pipeline import run_pipeline
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+MANIFEST_NAME = "manifest.jsonl"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Set in each worker process by _init_worker
+_llm_slots = None
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def collect_inputs(patterns, output_dir):
+    """
+    Expand files, directories (searched recursively) and glob patterns into
+    [(midi_path, output_path)] with one MusicXML output per input. Outputs
+    mirror the layout below each directory argument.
+    """
+    inputs = []
+    seen = set()
+    used_outputs = set()
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+            matches = [(path, os.path.relpath(path, pattern)) for path in sorted(paths)]
+        else:
+            paths = glob.glob(pattern, recursive=True)
+            matches = [(path, os.path.basename(path)) for path in sorted(paths)]
+
+        matches = [
+            (path, rel) for path, rel in matches
+            if os.path.isfile(path) and path.lower().endswith(MIDI_EXTENSIONS)
+        ]
+        if not matches:
+            print(f"⚠️ No MIDI files match {pattern}")
+
+        for path, rel in matches:
+            path = os.path.abspath(path)
+            if path in seen:
+                continue
+            seen.add(path)
+
+            stem = os.path.join(os.path.abspath(output_dir), os.path.splitext(rel)[0])
+            output_path = stem + ".musicxml"
+            if output_path in used_outputs:
+                # Same file name from different inputs; disambiguate by source path
+                output_path = f"{stem}_{hashlib.sha1(path.encode()).hexdigest()[:8]}.musicxml"
+            used_outputs.add(output_path)
+            inputs.append((path, output_path))
+
+    return inputs
+
+
+class Manifest:
+    """
+    Append-only JSON Lines record of converted files. The last line for an
+    input wins, and a line cut short by an interrupted run is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry["input"]] = entry
+
+    def is_done(self, midi_path, digest, output_path, options):
+        entry = self.entries.get(midi_path)
+        return (
+            entry is not None
+            and entry["status"] == "done"
+            and entry["sha256"] == digest
+            and entry["output"] == output_path
+            and entry["options"] == options
+            and all(os.path.exists(path) for path in entry.get("files", [output_path]))
+        )
+
+    def record(self, entry):
+        self.entries[entry["input"]] = entry
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _init_worker(llm_slots):
+    global _llm_slots
+    _llm_slots = llm_slots
+
+
+def convert_file(midi_path, output_path, digest, options, profile_dir=None):
+    """
+    Worker entry point: convert one file and return its manifest entry
+    """
+    entry = {
+        "input": midi_path,
+        "sha256": digest,
+        "output": output_path,
+        "options": options,
+        "timings": {},
+        "error": None,
+    }
+    started = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        profile_prefix = None
+        if profile_dir:
+            profile_prefix = os.path.join(
+                profile_dir, os.path.splitext(os.path.basename(output_path))[0]
+            )
+        result = run_pipeline(midi_path, output_path, llm_limiter=_llm_slots,
+                              profile_prefix=profile_prefix, **options)
+        entry.update(
+            status="done",
+            timings=result["timings"],
+            metrics=result["metrics"],
+            files=result["files"],
+            instruments=result["instruments"],
+            tempo=result["tempo"],
+        )
+    except Exception as e:
+        entry.update(status="failed", error=str(e))
+    entry["seconds"] = round(time.perf_counter() - started, 4)
+    entry["finished"] = time.time()
+    return entry
+
+
+def run_batch(patterns, output_dir, workers=None, llm_concurrency=2,
+              manifest_path=None, force=False, profile_dir=None, **options):
+    """
+    Convert every MIDI file matched by patterns into output_dir.
+    options are passed to run_pipeline. Returns a summary of counts plus the
+    manifest entries written by this run.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME))
+    # Round-trip through JSON so options compare equal to manifest entries
+    options = json.loads(json.dumps(options))
+
+    inputs = collect_inputs(patterns, output_dir)
+    pending = []
+    for midi_path, output_path in inputs:
+        digest = file_hash(midi_path)
+        if force or not manifest.is_done(midi_path, digest, output_path, options):
+            pending.append((midi_path, output_path, digest))
+
+    summary = {"total": len(inputs), "skipped": len(inputs) - len(pending), "done": 0, "failed": 0,
+               "entries": []}
+    print(f"🎼 {summary['total']} MIDI files, {summary['skipped']} already converted, "
+          f"{len(pending)} to convert")
+    if not pending:
+        return summary
+
+    llm_slots = multiprocessing.BoundedSemaphore(llm_concurrency)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(llm_slots,)
+    ) as pool:
+        futures = {
+            pool.submit(convert_file, midi_path, output_path, digest, options, profile_dir):
+                (midi_path, output_path, digest)
+            for midi_path, output_path, digest in pending
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            try:
+                entry = future.result()
+            except Exception as e:
+                # The worker process died (e.g. out of memory)
+                midi_path, output_path, digest = futures[future]
+                entry = {
+                    "input": midi_path, "sha256": digest, "output": output_path,
+                    "options": options, "timings": {}, "error": str(e),
+                    "status": "failed", "finished": time.time(),
+                }
+            manifest.record(entry)
+            summary[entry["status"]] += 1
+            summary["entries"].append(entry)
+            if entry["status"] == "done":
+                print(f"[{n}/{len(pending)}] ✅ {entry['input']} -> {entry['output']} "
+                      f"({entry['seconds']:.2f}s)")
+            else:
+                print(f"[{n}/{len(pending)}] ❌ {entry['input']}: {entry['error']}")
+
+    return summary
@@ -0,0 +1,62 @@
+"""
+Compressed score formats.
+
+write_mxl packages a MusicXML file as .mxl (the zipped MusicXML container
+format every notation program reads); gzip_file makes the .gz sibling used
+for Content-Encoding: gzip downloads. Both stream in chunks and publish the
+result with an atomic rename, so concurrent requests never see partial files.
+"""
+import gzip
+import os
+import shutil
+import zipfile
+
+from utils.storage import atomic_output
+
+MXL_MIMETYPE = "application/vnd.recordare.musicxml"
+CONTAINER_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<container>\n'
+    '  <rootfiles>\n'
+    '    <rootfile full-path="{name}" media-type="application/vnd.recordare.musicxml+xml"/>\n'
+    '  </rootfiles>\n'
+    '</container>\n'
+)
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def mxl_path_for(xml_path):
+    return os.path.splitext(xml_path)[0] + ".mxl"
+
+
+def write_mxl(xml_path, mxl_path=None, compresslevel=6):
+    """
+    Zip xml_path into an .mxl container. Returns the .mxl path.
+    """
+    mxl_path = mxl_path or mxl_path_for(xml_path)
+    score_name = os.path.splitext(os.path.basename(mxl_path))[0] + ".musicxml"
+
+    with atomic_output(mxl_path) as tmp_path:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+            # The mimetype entry must come first and be stored uncompressed
+            zf.writestr("mimetype", MXL_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+            zf.writestr("META-INF/container.xml", CONTAINER_XML.format(name=score_name))
+            with open(xml_path, "rb") as src, zf.open(score_name, "w") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    return mxl_path
+
+
+def gzip_file(path, compresslevel=6):
+    """
+    Write path + ".gz" unless an up-to-date copy exists. Returns the .gz path.
+    """
+    gz_path = path + ".gz"
+    if os.path.exists(gz_path) and os.path.getmtime(gz_path) >= os.path.getmtime(path):
+        return gz_path
+
+    with atomic_output(gz_path) as tmp_path:
+        with open(path, "rb") as src, open(tmp_path, "wb") as raw:
+            # mtime=0 keeps the bytes (and so the ETag) stable across rebuilds
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=compresslevel, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    return gz_path
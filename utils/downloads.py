@@ -0,0 +1,124 @@
+"""
+File downloads with validators, byte ranges and gzip negotiation.
+
+Single ranges, If-None-Match and If-Range go through Flask's send_file, which
+hands the open file to the server's wsgi.file_wrapper (sendfile where the
+server supports it) or to X-Sendfile when USE_X_SENDFILE is on. Multi-range
+requests are answered here with multipart/byteranges, since werkzeug only
+handles single ranges.
+"""
+import os
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+from utils.compression import gzip_file
+
+# Mimetypes worth compressing on the fly (.mxl is already zipped)
+GZIP_MIMETYPES = ("application/xml",)
+# More ranges than this are answered with the whole file
+MAX_RANGES = 32
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _if_range_matches(path, etag):
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return int(os.path.getmtime(path)) <= if_range.date.timestamp()
+    return True
+
+
+def _byte_spans(ranges, size):
+    spans = []
+    for begin, end in ranges:
+        if begin < 0:
+            start, stop = max(size + begin, 0), size
+        else:
+            start, stop = begin, min(size if end is None else end, size)
+        if start < stop:
+            spans.append((start, stop))
+    return spans
+
+
+def _multipart_ranges(path, mimetype, etag, spans, size):
+    boundary = os.urandom(12).hex()
+    heads = [
+        (f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+         f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode("ascii")
+        for start, stop in spans
+    ]
+    tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+    # Parts after the first are preceded by a CRLF
+    length = (sum(len(head) for head in heads) + sum(stop - start for start, stop in spans)
+              + 2 * (len(spans) - 1) + len(tail))
+
+    def generate():
+        with open(path, "rb") as f:
+            for i, (head, (start, stop)) in enumerate(zip(heads, spans)):
+                if i:
+                    yield b"\r\n"
+                yield head
+                f.seek(start)
+                remaining = stop - start
+                while remaining:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        yield tail
+
+    response = Response(generate(), status=206,
+                        content_type=f"multipart/byteranges; boundary={boundary}")
+    response.headers["Content-Length"] = str(length)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.set_etag(etag)
+    return response
+
+
+def send_download(path, download_name, mimetype):
+    """
+    Send path as an attachment, honoring Range (single and multi),
+    If-None-Match/If-Range and Accept-Encoding: gzip
+    """
+    etag = file_etag(path)
+
+    # Compressed transfer only for whole-file requests, so ranges always
+    # address the real file bytes
+    if mimetype in GZIP_MIMETYPES and request.range is None \
+            and request.accept_encodings["gzip"] > 0:
+        gz_path = gzip_file(path)
+        response = send_file(gz_path, mimetype=mimetype, as_attachment=True,
+                             download_name=download_name, conditional=True,
+                             etag=f"{file_etag(gz_path)}-gzip")
+        if response.status_code != 304:
+            response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    ranges = request.range
+    if ranges is not None and 1 < len(ranges.ranges) <= MAX_RANGES \
+            and _if_range_matches(path, etag):
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        size = os.path.getsize(path)
+        spans = _byte_spans(ranges.ranges, size)
+        if not spans:
+            raise RequestedRangeNotSatisfiable(length=size)
+        response = _multipart_ranges(path, mimetype, etag, spans, size)
+        response.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=True,
+                             download_name=download_name, conditional=True, etag=etag)
+    if mimetype in GZIP_MIMETYPES:
+        response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,91 @@
+"""
+Shared Gemini client.
+
+The google-genai SDK is only imported when a client is actually built: it
+is the slowest import of the whole app, and runs that never call Gemini
+(cached plans, the rule planner, re-orchestration) should not pay for it.
+"""
+import os
+import threading
+
+DEFAULT_MODEL = "gemini-3-flash-preview"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def http_options_from_env():
+    """
+    HTTP settings for the Gemini client, read from GEMINI_* environment variables:
+    GEMINI_BASE_URL (e.g. a local stub server), GEMINI_TIMEOUT (seconds),
+    GEMINI_RETRY_ATTEMPTS, GEMINI_RETRY_INITIAL_DELAY, GEMINI_RETRY_MAX_DELAY
+    """
+    from google.genai import types
+
+    retry_options = types.HttpRetryOptions(
+        attempts=int(_env_float("GEMINI_RETRY_ATTEMPTS", 3)),
+        initial_delay=_env_float("GEMINI_RETRY_INITIAL_DELAY", 0.5),
+        max_delay=_env_float("GEMINI_RETRY_MAX_DELAY", 8.0),
+        exp_base=2,
+    )
+    return types.HttpOptions(
+        base_url=os.getenv("GEMINI_BASE_URL") or None,
+        # The SDK expects milliseconds
+        timeout=int(_env_float("GEMINI_TIMEOUT", 60.0) * 1000),
+        retry_options=retry_options,
+    )
+
+
+def get_model_name():
+    return os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+
+
+def get_client():
+    """
+    Process-wide Gemini client, created on first use.
+    Reusing one client keeps its HTTP connection pool warm across requests.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+
+                _client = genai.Client(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_options=http_options_from_env(),
+                )
+    return _client
+
+
+def reset_client():
+    """
+    Drop the shared client (after a fork or a config change)
+    """
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def _after_fork():
+    # A forked child must not share the parent's HTTP connections, and the
+    # lock may have been held by a parent thread that did not come along
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def list_models(client=None):
+    """
+    Diagnostic only: list the models visible to the API key
+    """
+    client = client or get_client()
+    return [m.name for m in client.models.list()]
@@ -0,0 +1,111 @@
+"""
+Minimal local stand-in for the Gemini generateContent endpoint.
+
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port> to run
+conversions and measure per-request latency without network access:
+
+    python -m utils.gemini_stub --port 8765 --latency 0.2
+
+fail_first=N answers the first N generateContent calls with a 503, for
+exercising the client's retries. Served and failed calls are counted on
+server.RequestHandlerClass (requests_served, requests_failed).
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PLAN = {
+    "assignments": {
+        "Melody": ["Violin"],
+        "Harmony": ["Viola"],
+        "Bass": ["Cello"]
+    },
+    "explanations": {
+        "Melody": "Stub plan: violin for melody",
+        "Harmony": "Stub plan: viola for harmony",
+        "Bass": "Stub plan: cello for bass"
+    }
+}
+
+
+def make_handler(plan, latency, fail_first=0):
+    body = json.dumps({
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": json.dumps(plan)}]},
+            "finishReason": "STOP"
+        }]
+    }).encode("utf-8")
+    models = json.dumps({"models": [{"name": "models/stub-model"}]}).encode("utf-8")
+    unavailable = json.dumps({
+        "error": {"code": 503, "message": "Stub outage", "status": "UNAVAILABLE"}
+    }).encode("utf-8")
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        requests_served = 0
+        requests_failed = 0
+        # Handler threads update the counts concurrently
+        _lock = threading.Lock()
+
+        @classmethod
+        def _count(cls):
+            """
+            Count one generateContent call; True if it should fail
+            """
+            with cls._lock:
+                if cls.requests_failed < fail_first:
+                    cls.requests_failed += 1
+                    return True
+                cls.requests_served += 1
+                return False
+
+        def _send(self, payload, status=200):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if latency:
+                time.sleep(latency)
+            if self._count():
+                self._send(unavailable, status=503)
+            else:
+                self._send(body)
+
+        def do_GET(self):
+            self._send(models)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(port=0, plan=None, latency=0.0, fail_first=0):
+    """
+    Start the stub in a daemon thread. Returns (server, base_url).
+    """
+    handler = make_handler(plan or DEFAULT_PLAN, latency, fail_first)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Gemini stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Artificial delay per request (seconds)")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, latency=args.latency)
+    print(f"Gemini stub listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,69 @@
+"""
+Import-time profiling for the command line.
+
+Python only records import times when started with -X importtime, so
+profile_imports re-runs the command in a child interpreter with that flag,
+passes its output through and summarizes the per-module times it reported.
+Forked batch workers inherit the flag, so their imports are counted too.
+"""
+import subprocess
+import sys
+
+IMPORTTIME_PREFIX = "import time:"
+# Libraries a run should only load when a stage needs them
+HEAVY_MODULES = ("music21", "pretty_midi", "google.genai")
+
+
+def parse_importtime(lines):
+    """
+    [(module, self_us, cumulative_us, depth)] from -X importtime lines
+    """
+    entries = []
+    for line in lines:
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        fields = line[len(IMPORTTIME_PREFIX):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # The column header
+            continue
+        name = fields[2].rstrip()
+        module = name.lstrip(" ")
+        # One space before top-level imports, two more per nesting level
+        entries.append((module, self_us, cumulative_us, (len(name) - len(module) - 1) // 2))
+    return entries
+
+
+def print_report(entries, top=20):
+    total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+    print(f"📦 {len(entries)} modules imported in {total_us / 1e6:.3f}s")
+    print(f"  {'cumulative':>11} {'self':>9}  module")
+    for module, self_us, cumulative_us, _ in sorted(entries, key=lambda e: -e[2])[:top]:
+        print(f"  {cumulative_us / 1000:9.1f}ms {self_us / 1000:7.1f}ms  {module}")
+
+    loaded = {module: cumulative for module, _, cumulative, _ in entries}
+    print("  " + ", ".join(
+        f"{name}: {loaded[name] / 1000:.1f}ms" if name in loaded else f"{name}: not loaded"
+        for name in HEAVY_MODULES
+    ))
+
+
+def profile_imports(argv, top=20):
+    """
+    Run `python -X importtime argv...`, then print its slowest imports.
+    Returns the child's exit code.
+    """
+    child = subprocess.Popen([sys.executable, "-X", "importtime", *argv],
+                             stderr=subprocess.PIPE, text=True)
+    lines = []
+    for line in child.stderr:
+        if line.startswith(IMPORTTIME_PREFIX):
+            lines.append(line)
+        else:
+            sys.stderr.write(line)
+    code = child.wait()
+    print_report(parse_importtime(lines), top)
+    return code
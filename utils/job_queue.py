@@ -0,0 +1,345 @@
+"""
+Background conversion jobs.
+
+Jobs run on a bounded process pool so music21 rendering can use every core.
+Job state lives as one JSON file per job on the local filesystem, so worker
+processes can report progress and any web process can read it back.
+"""
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.pipeline import STAGES, run_pipeline
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{16,64}$")
+# Reservations shared by every web process using the same job folder
+MEMORY_LEDGER_FILENAME = "memory_reservations.json"
+# How often jobs waiting on memory held by other processes look again
+MEMORY_RETRY_SECONDS = 1.0
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class JobTooLargeError(RuntimeError):
+    pass
+
+
+class JobStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, job_id):
+        if not JOB_ID_RE.match(job_id or ""):
+            raise KeyError(job_id)
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def create(self, **fields):
+        job_id = os.urandom(8).hex()
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "stages": {stage: False for stage in STAGES},
+            "progress": 0.0,
+            "created": time.time(),
+            "updated": time.time(),
+            "error": None,
+            "result": None,
+        }
+        job.update(fields)
+        self._write(job)
+        return job
+
+    def get(self, job_id):
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (KeyError, FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def update(self, job_id, **fields):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        job["updated"] = time.time()
+        self._write(job)
+        return job
+
+    def mark_stage(self, job_id, stage):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job["stages"][stage] = True
+        job["progress"] = sum(job["stages"].values()) / len(job["stages"])
+        job["updated"] = time.time()
+        self._write(job)
+        return job
+
+    def _write(self, job):
+        # Write to a temp file and rename so readers never see partial JSON
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def clear(self):
+        for filename in os.listdir(self.root):
+            try:
+                os.remove(os.path.join(self.root, filename))
+            except OSError:
+                pass
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MemoryLedger:
+    """
+    Memory reserved by running jobs in every process sharing path, so one
+    budget holds for all the workers of a pre-fork server rather than for
+    each. The reservations are a JSON object {job_id: [pid, bytes]} read and
+    rewritten under an exclusive flock; those of processes that have exited
+    (a crashed or killed worker) are dropped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                reservations = json.loads(f.read() or "{}")
+            except json.JSONDecodeError:
+                reservations = {}
+            reservations = {job_id: entry for job_id, entry in reservations.items()
+                            if _process_alive(entry[0])}
+            yield reservations
+            f.seek(0)
+            f.truncate()
+            json.dump(reservations, f)
+
+    def reserve(self, job_id, memory, budget):
+        """
+        Reserve memory bytes for job_id if the total stays within budget.
+        Returns whether it did.
+        """
+        with self._locked() as reservations:
+            if sum(entry[1] for entry in reservations.values()) + memory > budget:
+                return False
+            reservations[job_id] = [os.getpid(), memory]
+            return True
+
+    def release(self, job_id):
+        with self._locked() as reservations:
+            reservations.pop(job_id, None)
+
+    def total(self):
+        with self._locked() as reservations:
+            return sum(entry[1] for entry in reservations.values())
+
+
+def run_job(job_root, job_id, midi, output_path, options):
+    """
+    Worker entry point: run the pipeline and record progress in the job store.
+    midi is the uploaded file's bytes, or a path that is removed afterwards.
+    """
+    store = JobStore(job_root)
+    store.update(job_id, status="running")
+    try:
+        result = run_pipeline(
+            midi, output_path,
+            progress=lambda stage: store.mark_stage(job_id, stage),
+            **options
+        )
+        store.update(job_id, status="done", result=result)
+    except Exception as e:
+        store.update(job_id, status="failed", error=str(e))
+    finally:
+        if isinstance(midi, str) and os.path.exists(midi):
+            os.remove(midi)
+
+
+class JobQueue:
+    """
+    Bounded process pool for conversion jobs. submit() raises QueueFullError
+    once max_pending jobs are queued or running. With a memory_budget
+    (bytes), each job carries a memory estimate: jobs start in submission
+    order, only while the estimates of the running ones leave room for
+    theirs, and submit() raises JobTooLargeError for a job that could never
+    fit. The budget is shared through a MemoryLedger in the job store's
+    folder, so it covers the running jobs of every process using that
+    folder; order is only kept within each process. Waiting jobs keep their
+    upload in memory, so max_pending also caps that. on_done, if given, is
+    called with the final job record (done or failed) in this process.
+    """
+
+    def __init__(self, store, workers=None, max_pending=32, on_done=None, memory_budget=None):
+        self.store = store
+        self.on_done = on_done
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.memory_budget = memory_budget
+        self.ledger = MemoryLedger(os.path.join(store.root, MEMORY_LEDGER_FILENAME)) \
+            if memory_budget is not None else None
+        self._executor = None
+        self._pending = 0
+        # Jobs held back for a worker or for memory, oldest first
+        self._waiting = deque()
+        self._running = 0
+        self._reserved = 0
+        self._retry = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A forked web worker starts with no pool and nothing pending of its own
+        self._executor = None
+        self._pending = 0
+        self._waiting = deque()
+        self._running = 0
+        self._reserved = 0
+        self._retry = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so importing the app does not spawn workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, midi, output_path, meta=None, memory=None, **options):
+        """
+        Queue a conversion of midi (bytes, or a path the worker removes when
+        done). memory is the job's estimated peak in bytes (see
+        utils.admission). meta is stored on the job record as-is; options
+        are passed to run_pipeline.
+        """
+        memory = memory or 0
+        if self.memory_budget is not None and memory > self.memory_budget:
+            raise JobTooLargeError(
+                f"This file needs about {memory // 2 ** 20} MB to convert, "
+                f"more than the server allows ({self.memory_budget // 2 ** 20} MB)"
+            )
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError("Conversion queue is full, please retry shortly")
+            self._pending += 1
+
+        job = self.store.create(options=options, memory_estimate=memory, **(meta or {}))
+        with self._lock:
+            self._waiting.append((job["id"], midi, output_path, options, memory))
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """
+        Start waiting jobs, oldest first, while a worker is free and the
+        memory budget has room for the next one. A large job at the head
+        holds back smaller ones behind it, so it cannot be starved by this
+        process's jobs.
+        """
+        while True:
+            with self._lock:
+                if not self._waiting or self._running >= self.workers:
+                    return
+                job_id, midi, output_path, options, memory = self._waiting[0]
+                if self.ledger is not None and not self.ledger.reserve(job_id, memory, self.memory_budget):
+                    self._retry_later()
+                    return
+                self._waiting.popleft()
+                self._running += 1
+                self._reserved += memory
+                executor = self._get_executor()
+
+            try:
+                future = executor.submit(run_job, self.store.root, job_id, midi, output_path, options)
+            except Exception as e:
+                self._release(job_id, memory)
+                self.store.update(job_id, status="failed", error=str(e))
+                continue
+            future.add_done_callback(
+                lambda f, job_id=job_id, memory=memory: self._finished(job_id, memory, f)
+            )
+
+    def _retry_later(self):
+        # Called with self._lock held. Other processes free their memory
+        # without telling this one, so look again shortly
+        if self._retry is None:
+            self._retry = threading.Timer(MEMORY_RETRY_SECONDS, self._retried)
+            self._retry.daemon = True
+            self._retry.start()
+
+    def _retried(self):
+        with self._lock:
+            self._retry = None
+        self._dispatch()
+
+    def _release(self, job_id, memory):
+        with self._lock:
+            self._pending -= 1
+            self._running -= 1
+            self._reserved -= memory
+            if self.ledger is not None:
+                self.ledger.release(job_id)
+
+    def _finished(self, job_id, memory, future):
+        self._release(job_id, memory)
+        # Cancelled by shutdown(); nothing to record or start
+        if future.cancelled():
+            return
+        self._dispatch()
+        # run_job records its own errors; this catches crashed workers
+        error = future.exception()
+        if error is not None:
+            self.store.update(job_id, status="failed", error=str(error))
+
+        job = self.store.get(job_id)
+        if self.on_done is not None and job is not None:
+            try:
+                self.on_done(job)
+            except Exception as e:
+                print(f"⚠️ Job {job_id} completion hook failed: {e}")
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def stats(self):
+        """
+        Jobs waiting and running, and the memory the running ones reserve,
+        in this process and in all processes sharing the budget
+        """
+        with self._lock:
+            return {"waiting": len(self._waiting), "running": self._running,
+                    "memory_reserved": self._reserved,
+                    "memory_reserved_total": self.ledger.total() if self.ledger is not None
+                    else self._reserved}
+
+    def shutdown(self):
+        with self._lock:
+            self._waiting.clear()
+            if self._retry is not None:
+                self._retry.cancel()
+                self._retry = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,240 @@
+"""
+Measure-level random access into partwise MusicXML files.
+
+build_index scans a written score once and stores the byte span of every
+measure (per part) in a JSON sidecar next to it. Previews then read just the
+requested measures with seek/read and wrap them in a minimal score-partwise
+document, so paging through a large score never parses the whole file.
+"""
+import json
+import mmap
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from utils.storage import atomic_output
+
+INDEX_SUFFIX = ".index.json"
+# Bumped when the sidecar layout changes so stale indexes get rebuilt
+INDEX_VERSION = 1
+
+# Every tag the index cares about, matched in one pass over the raw bytes.
+# The explicit (?:\s...)? tails keep <part-name-display>, <measure-style> etc. out.
+TAG_RE = re.compile(
+    rb'<part-list(?:\s[^>]*)?>'
+    rb'|<score-part\s[^>]*>|</score-part>'
+    rb'|<part-name(?:\s[^>]*)?>(?P<name>[^<]*)</part-name>'
+    rb'|<part\s[^>]*>'
+    rb'|<measure(?:\s[^>]*)?>|</measure>'
+    rb'|<attributes(?:\s[^>]*)?>|</attributes>'
+)
+ID_RE = re.compile(rb'\bid="([^"]*)"')
+NUMBER_RE = re.compile(rb'\bnumber="([^"]*)"')
+
+ALTER_SIGNS = {-2: "bb", -1: "b", 0: "", 1: "#", 2: "##"}
+
+
+def index_path_for(xml_path):
+    return xml_path + INDEX_SUFFIX
+
+
+def _scan(data):
+    """
+    Collect byte offsets from an in-memory (or mmapped) MusicXML document
+    """
+    part_list_start = None
+    score_parts = {}
+    names = {}
+    parts = []
+    score_part = None
+    part = None
+    measure = None
+    attr_start = None
+
+    for m in TAG_RE.finditer(data):
+        tag = m.group(0)
+        if tag.startswith(b"<part-list"):
+            part_list_start = m.start()
+        elif tag.startswith(b"<score-part"):
+            score_part = [ID_RE.search(tag).group(1).decode("utf-8"), m.start()]
+        elif tag == b"</score-part>":
+            if score_part is not None:
+                score_parts[score_part[0]] = [score_part[1], m.end()]
+                score_part = None
+        elif tag.startswith(b"<part-name"):
+            if score_part is not None:
+                names[score_part[0]] = m.group("name").decode("utf-8")
+        elif tag.startswith(b"<part"):
+            part_id = ID_RE.search(tag).group(1).decode("utf-8")
+            part = {"id": part_id, "measures": [], "numbers": [], "attributes": []}
+            parts.append(part)
+        elif tag.startswith(b"<measure"):
+            number = NUMBER_RE.search(tag)
+            measure = [m.start(), m.end()]
+            part["numbers"].append(number.group(1).decode("utf-8") if number else "")
+        elif tag == b"</measure>":
+            measure.append(m.end())
+            part["measures"].append(measure)
+            measure = None
+        elif tag.startswith(b"<attributes"):
+            attr_start = m.start()
+        elif tag == b"</attributes>" and measure is not None:
+            # [measure position, start, end]
+            part["attributes"].append([len(part["measures"]), attr_start, m.end()])
+
+    if part_list_start is None or not parts:
+        raise ValueError("Not a partwise MusicXML score")
+
+    for part in parts:
+        part["name"] = names.get(part["id"], part["id"])
+        part["score_part"] = score_parts.get(part["id"])
+    return {"part_list_start": part_list_start, "parts": parts}
+
+
+def build_index(xml_path):
+    """
+    Scan xml_path and write its measure index sidecar. Returns the index.
+    """
+    stat = os.stat(xml_path)
+    with open(xml_path, "rb") as f:
+        if stat.st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                index = _scan(data)
+        else:
+            index = _scan(b"")
+    index.update({"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+
+    with atomic_output(index_path_for(xml_path)) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+    return index
+
+
+def load_index(xml_path):
+    """
+    The index for xml_path, rebuilt when missing or older than the score
+    (e.g. a score exported from the result cache without its sidecar)
+    """
+    stat = os.stat(xml_path)
+    try:
+        with open(index_path_for(xml_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index["size"] == stat.st_size \
+                and index["mtime_ns"] == stat.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_index(xml_path)
+
+
+def measure_count(index):
+    return max(len(part["measures"]) for part in index["parts"])
+
+
+def select_parts(index, part_ids=None):
+    """
+    Index entries for part_ids (all parts when None), in score order
+    """
+    if not part_ids:
+        return index["parts"]
+    known = {part["id"]: part for part in index["parts"]}
+    unknown = [part_id for part_id in part_ids if part_id not in known]
+    if unknown:
+        raise ValueError(f"Unknown part(s): {', '.join(unknown)}")
+    wanted = set(part_ids)
+    return [part for part in index["parts"] if part["id"] in wanted]
+
+
+def _read(f, start, end):
+    f.seek(start)
+    return f.read(end - start)
+
+
+def _carried_attributes(part, first):
+    """
+    Attribute spans in force at measure position first but written in
+    earlier measures: the opening attributes plus the latest change
+    """
+    earlier = [span for span in part["attributes"] if span[0] < first]
+    if not earlier:
+        return []
+    carried = [earlier[0]]
+    if earlier[-1] is not earlier[0]:
+        carried.append(earlier[-1])
+    return [(start, end) for _, start, end in carried]
+
+
+def read_fragment(xml_path, index, first, last, part_ids=None):
+    """
+    Measures first..last (0-based positions, inclusive) of the selected
+    parts as a standalone score-partwise document (bytes)
+    """
+    parts = select_parts(index, part_ids)
+    out = []
+    with open(xml_path, "rb") as f:
+        out.append(_read(f, 0, index["part_list_start"]))
+        out.append(b"<part-list>\n")
+        for part in parts:
+            if part["score_part"]:
+                out.append(b"    " + _read(f, *part["score_part"]) + b"\n")
+        out.append(b"  </part-list>\n")
+
+        for part in parts:
+            out.append(f'  <part id="{part["id"]}">\n'.encode("utf-8"))
+            carried = _carried_attributes(part, first)
+            for position in range(first, min(last + 1, len(part["measures"]))):
+                start, body, end = part["measures"][position]
+                out.append(b"    " + _read(f, start, body))
+                if position == first and carried:
+                    # Divisions, clef and time signature so the fragment renders on its own
+                    out.append(b"\n      " + b"\n      ".join(_read(f, a, b) for a, b in carried))
+                out.append(_read(f, body, end) + b"\n")
+            out.append(b"  </part>\n")
+    out.append(b"</score-partwise>\n")
+    return b"".join(out)
+
+
+def _note_json(el):
+    pitch = el.find("pitch")
+    entry = {
+        "pitch": None,
+        "duration": int(el.findtext("duration", "0")),
+        "type": el.findtext("type"),
+        "dots": len(el.findall("dot")),
+        "voice": el.findtext("voice", "1"),
+        "chord": el.find("chord") is not None,
+        "ties": [tie.get("type") for tie in el.findall("tie")],
+    }
+    if pitch is not None:
+        alter = int(float(pitch.findtext("alter", "0")))
+        entry["pitch"] = f'{pitch.findtext("step")}{ALTER_SIGNS.get(alter, "")}{pitch.findtext("octave")}'
+    return entry
+
+
+def read_fragment_json(xml_path, index, first, last, part_ids=None):
+    """
+    Measures first..last of the selected parts as plain JSON-ready data:
+    notes (pitch name or None for rests, duration in divisions) per measure
+    """
+    parts = select_parts(index, part_ids)
+    result = []
+    with open(xml_path, "rb") as f:
+        for part in parts:
+            divisions = None
+            for _, start, end in part["attributes"][:1]:
+                divisions = ET.fromstring(_read(f, start, end)).findtext("divisions")
+            measures = []
+            for position in range(first, min(last + 1, len(part["measures"]))):
+                start, _, end = part["measures"][position]
+                el = ET.fromstring(_read(f, start, end))
+                measures.append({
+                    "number": part["numbers"][position],
+                    "notes": [_note_json(n) for n in el.iter("note")],
+                })
+            result.append({
+                "id": part["id"],
+                "name": part["name"],
+                "divisions": int(divisions) if divisions else None,
+                "measures": measures,
+            })
+    return result
@@ -0,0 +1,278 @@
+"""
+Pipeline instrumentation.
+
+StageTimer records wall-clock time, CPU time and peak memory for each
+pipeline stage. MetricsRegistry aggregates finished job reports and renders
+them in the Prometheus text exposition format for /metrics.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Seconds between memory samples while a stage runs
+SAMPLE_INTERVAL = 0.01
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def current_rss_bytes():
+    """
+    Resident set size of this process, or None where /proc is unavailable
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def max_rss_bytes():
+    """
+    Lifetime peak RSS of this process (used when /proc can't be sampled)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageTimer:
+    """
+    Times consecutive pipeline stages. Call lap(stage) as each stage ends;
+    a background thread samples RSS so every stage gets its own peak.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._wall = self._started
+        self._cpu = time.process_time()
+
+        self._sampling = current_rss_bytes() is not None
+        self._peak = current_rss_bytes() if self._sampling else None
+        # Footprint before the first stage, for the memory each stage adds
+        self.start_rss = self._peak if self._sampling else max_rss_bytes()
+        self._stop = threading.Event()
+        if self._sampling:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            rss = current_rss_bytes()
+            if rss is not None and rss > self._peak:
+                self._peak = rss
+
+    def lap(self, stage):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if self._sampling:
+            peak = max(self._peak, current_rss_bytes() or 0)
+            # Start the next stage's peak from the current footprint
+            self._peak = current_rss_bytes() or 0
+        else:
+            peak = max_rss_bytes()
+
+        self.stages[stage] = {
+            "wall_seconds": round(wall - self._wall, 4),
+            "cpu_seconds": round(cpu - self._cpu, 4),
+            "peak_rss_bytes": peak,
+        }
+        self._wall = wall
+        self._cpu = cpu
+
+    def stop(self):
+        self._stop.set()
+        return round(time.perf_counter() - self._started, 4)
+
+    def timings(self):
+        return {stage: entry["wall_seconds"] for stage, entry in self.stages.items()}
+
+    def added_bytes(self):
+        """
+        {stage: peak RSS above the footprint before the first stage}, None
+        where RSS is unavailable. Without /proc this is measured against
+        the process's lifetime peak, so it only shows growth past that.
+        """
+        return {
+            stage: None if entry["peak_rss_bytes"] is None or self.start_rss is None
+            else max(entry["peak_rss_bytes"] - self.start_rss, 0)
+            for stage, entry in self.stages.items()
+        }
+
+
+@contextmanager
+def profile_job(prefix):
+    """
+    cProfile + tracemalloc around a block. Writes <prefix>.prof (load with
+    pstats or snakeviz) and <prefix>.tracemalloc.txt (top allocation sites).
+    """
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield [f"{prefix}.prof", f"{prefix}.tracemalloc.txt"]
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        profiler.dump_stats(f"{prefix}.prof")
+        with open(f"{prefix}.tracemalloc.txt", "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + body + "}"
+
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe Prometheus registry: counters, gauges and histograms
+    keyed by name and labels.
+    """
+
+    def __init__(self, namespace="midi_converter"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        # name -> {"type", "help", "samples": {labels: value}}
+        self._metrics = {}
+
+    def _samples(self, name, kind, help_text):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = {"type": kind, "help": help_text, "samples": {}}
+        return metric["samples"]
+
+    def inc(self, name, help_text, value=1, **labels):
+        with self._lock:
+            samples = self._samples(name, "counter", help_text)
+            key = tuple(sorted(labels.items()))
+            samples[key] = samples.get(key, 0) + value
+
+    def set_max(self, name, help_text, value, **labels):
+        """
+        Gauge that keeps the largest value seen
+        """
+        with self._lock:
+            samples = self._samples(name, "gauge", help_text)
+            key = tuple(sorted(labels.items()))
+            samples[key] = max(samples.get(key, value), value)
+
+    def observe(self, name, help_text, value, buckets=DEFAULT_BUCKETS, **labels):
+        with self._lock:
+            samples = self._samples(name, "histogram", help_text)
+            key = tuple(sorted(labels.items()))
+            hist = samples.get(key)
+            if hist is None:
+                hist = samples[key] = {"buckets": buckets, "counts": [0] * len(buckets),
+                                       "sum": 0.0, "count": 0}
+            for i, bound in enumerate(hist["buckets"]):
+                if value <= bound:
+                    hist["counts"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def record_job(self, status, report=None):
+        """
+        Fold one finished job (and its run_pipeline metrics report) into the registry
+        """
+        self.inc("jobs_total", "Conversion jobs by final status", status=status)
+        if not report:
+            return
+
+        for stage, entry in report["stages"].items():
+            self.observe("stage_seconds", "Wall-clock time per pipeline stage",
+                         entry["wall_seconds"], stage=stage)
+            self.inc("stage_cpu_seconds_total", "CPU time per pipeline stage",
+                     entry["cpu_seconds"], stage=stage)
+            if entry["peak_rss_bytes"] is not None:
+                self.set_max("stage_peak_rss_bytes", "Largest peak RSS seen during a stage",
+                             entry["peak_rss_bytes"], stage=stage)
+
+        added = [value for value in report["memory"]["added_bytes"].values() if value is not None]
+        if added:
+            self.set_max("job_memory_added_bytes", "Largest memory a job added to its worker",
+                         max(added))
+
+        # Re-orchestrations reuse notes parsed by an earlier job
+        if not report.get("reused_analysis"):
+            self.inc("notes_total", "Notes parsed from uploaded MIDI files", report["notes"])
+        if report["tempo_estimated"]:
+            self.inc("tempo_estimations_total", "Files whose tempo had to be estimated")
+            self.inc("tempo_estimate_seconds_total", "Time spent estimating tempo",
+                     report["tempo_estimate_seconds"])
+
+        llm = report["llm"]
+        self.inc("plan_requests_total", "Orchestration plans by plan cache outcome",
+                 plan_cache=llm["plan_cache"], planner=llm["planner"],
+                 fallback=str(llm["fallback"]).lower())
+        if llm["speculative"]:
+            self.inc("speculative_plans_total", "Jobs that went ahead with the rule plan "
+                     "because Gemini was over its latency budget")
+        if llm["seconds"] is not None:
+            self.observe("llm_seconds", "Gemini request latency", llm["seconds"])
+
+        self.observe("reassign_seconds", "Time spent on range validation and reassignment",
+                     report["reassign_seconds"])
+        self.inc("reassigned_notes_total", "Notes moved to another instrument by range checks",
+                 report["reassigned_notes"])
+        self.inc("unplaceable_notes_total", "Out-of-range notes no instrument could take",
+                 report["unplaceable_notes"])
+        self.inc("parts_total", "Score parts by whether they were rendered or reused",
+                 report["parts_rendered"], source="rendered")
+        self.inc("parts_total", "Score parts by whether they were rendered or reused",
+                 report["parts_reused"], source="reused")
+
+    def render(self, gauges=None):
+        """
+        Prometheus text format. gauges adds point-in-time values as
+        {name: (help, value)}.
+        """
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                full_name = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full_name} {metric['help']}")
+                lines.append(f"# TYPE {full_name} {metric['type']}")
+                for labels, value in sorted(metric["samples"].items()):
+                    if metric["type"] != "histogram":
+                        lines.append(f"{full_name}{_format_labels(labels)} {value}")
+                        continue
+                    for bound, count in zip(value["buckets"], value["counts"]):
+                        bucket_labels = labels + (("le", f"{bound}"),)
+                        lines.append(f"{full_name}_bucket{_format_labels(bucket_labels)} {count}")
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} "
+                                 f"{value['count']}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {value['sum']}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {value['count']}")
+
+        for name, (help_text, value) in sorted((gauges or {}).items()):
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name} {value}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,423 @@
+"""
+Streaming Standard MIDI File reader.
+
+Memory-maps the file (or reads straight from bytes, memoryviews and file
+objects), walks each MTrk chunk once and pairs note-on/note-off events
+straight into compact arrays, without building mido messages or pretty_midi
+Instrument/Note objects. Note pairing, tempo handling and tick-to-seconds
+conversion follow pretty_midi so both produce the same notes.
+
+scan_header checks the header and chunk table without decoding any events,
+so malformed or oversized uploads can be rejected before a full parse.
+estimate_note_count decodes a bounded sample of each track to predict how
+many notes a full parse would find, for admission control.
+"""
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+from utils.note_table import NoteTable
+
+# pretty_midi refuses files whose last tick is beyond this (likely corrupt)
+MAX_TICK = 10_000_000
+DEFAULT_TICK_SCALE_BPM = 120.0
+
+# Bytes estimate_note_count decodes before extrapolating, shared between
+# tracks by size, and the least it decodes of any track
+NOTE_SAMPLE_BYTES = 64 * 1024
+MIN_TRACK_SAMPLE_BYTES = 1024
+
+# Data bytes following each system status byte (0xF0/0xF7/0xFF handled separately)
+SYSTEM_DATA_LENGTH = {
+    0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0,
+    0xF8: 0, 0xFA: 0, 0xFB: 0, 0xFC: 0, 0xFE: 0,
+}
+
+
+class MidiParseError(ValueError):
+    pass
+
+
+class MidiHeader:
+    """
+    Result of scan_header: file layout without any decoded events
+    """
+
+    def __init__(self, fmt, resolution, tracks, size):
+        self.format = fmt
+        self.resolution = resolution
+        # [(chunk data offset, chunk data size)] per MTrk
+        self.tracks = tracks
+        self.size = size
+
+    @property
+    def num_tracks(self):
+        return len(self.tracks)
+
+
+def scan_header(data, max_tracks=None, max_bytes=None):
+    """
+    Validate the MThd header and the MTrk chunk table of an SMF buffer
+    (bytes, memoryview or mmap). Raises MidiParseError for malformed files
+    and for files over max_bytes or max_tracks. Returns a MidiHeader.
+    """
+    size = len(data)
+    if max_bytes is not None and size > max_bytes:
+        raise MidiParseError(f"MIDI file is {size} bytes, the limit is {max_bytes}")
+    if data[0:4] != b"MThd":
+        raise MidiParseError("MThd not found. Probably not a MIDI file")
+    if size < 14:
+        raise MidiParseError("Unexpected end of MIDI data")
+
+    header_size = struct.unpack_from(">L", data, 4)[0]
+    fmt, num_tracks, resolution = struct.unpack_from(">hhh", data, 8)
+    if header_size < 6 or fmt not in (0, 1, 2):
+        raise MidiParseError("Invalid MThd header")
+    if resolution <= 0:
+        raise MidiParseError("SMPTE or zero time division is not supported")
+    if num_tracks < 1:
+        raise MidiParseError("MIDI file has no tracks")
+    if max_tracks is not None and num_tracks > max_tracks:
+        raise MidiParseError(f"MIDI file has {num_tracks} tracks, the limit is {max_tracks}")
+
+    tracks = []
+    pos = 8 + header_size
+    for _ in range(num_tracks):
+        if data[pos:pos + 4] != b"MTrk":
+            raise MidiParseError("no MTrk header at start of track")
+        if pos + 8 > size:
+            raise MidiParseError("Unexpected end of MIDI data")
+        chunk_size = struct.unpack_from(">L", data, pos + 4)[0]
+        tracks.append((pos + 8, chunk_size))
+        pos += 8 + chunk_size
+        if pos > size:
+            raise MidiParseError("Unexpected end of MIDI data")
+
+    return MidiHeader(fmt, resolution, tracks, size)
+
+
+def _count_note_ons(data, pos, end):
+    """
+    (note-ons with velocity > 0, bytes decoded) for the events of one track
+    starting before end. Stops quietly at malformed data; the full parse
+    reports it.
+    """
+    start = pos
+    notes = 0
+    last_status = None
+    try:
+        while pos < end:
+            pos = _read_varint(data, pos)[1]
+            status = data[pos]
+            if status < 0x80:
+                if last_status is None:
+                    break
+                status = last_status
+            else:
+                pos += 1
+                if status != 0xFF:
+                    last_status = status
+
+            kind = status & 0xF0
+            if kind == 0x90:
+                if data[pos + 1]:
+                    notes += 1
+                pos += 2
+            elif kind == 0x80 or kind == 0xA0 or kind == 0xB0 or kind == 0xE0:
+                pos += 2
+            elif kind == 0xC0 or kind == 0xD0:
+                pos += 1
+            elif status == 0xFF:
+                length, pos = _read_varint(data, pos + 1)
+                pos += length
+            elif status == 0xF0 or status == 0xF7:
+                length, pos = _read_varint(data, pos)
+                pos += length
+            elif status in SYSTEM_DATA_LENGTH:
+                pos += SYSTEM_DATA_LENGTH[status]
+            else:
+                break
+    except IndexError:
+        pass
+    return notes, pos - start
+
+
+def estimate_note_count(data, header=None, sample_bytes=NOTE_SAMPLE_BYTES):
+    """
+    Expected number of notes in an SMF buffer. Files up to sample_bytes of
+    track data are counted exactly; otherwise the start of each track is
+    decoded (a share of sample_bytes in proportion to its size) and scaled
+    by the track's size, so the cost is bounded however large the file.
+    header is the file's scan_header result, scanned here if not given.
+    """
+    header = header or scan_header(data)
+    track_bytes = sum(size for _, size in header.tracks) or 1
+    total = 0.0
+    for chunk_start, size in header.tracks:
+        sample = max(sample_bytes * size // track_bytes, MIN_TRACK_SAMPLE_BYTES)
+        notes, decoded = _count_note_ons(data, chunk_start, chunk_start + min(size, sample))
+        if decoded:
+            total += notes * size / decoded
+    return int(round(total))
+
+
+class MidiData:
+    """
+    Result of reading an SMF file: notes plus the timing metadata needed to
+    map between ticks, seconds and beats
+    """
+
+    def __init__(self, notes, resolution, tick_scales, time_signatures, max_tick, tempo_events):
+        self.notes = notes
+        self.resolution = resolution
+        # [(tick, seconds per tick)], same layout as PrettyMIDI._tick_scales
+        self.tick_scales = tick_scales
+        # [(tick, numerator, denominator)]
+        self.time_signatures = time_signatures
+        self.max_tick = max_tick
+        # Number of set_tempo events seen on track 0 (0 means the default 120 BPM)
+        self.tempo_events = tempo_events
+
+    def tick_to_time(self, ticks):
+        return ticks_to_seconds(ticks, self.tick_scales)
+
+
+def ticks_to_seconds(ticks, tick_scales):
+    """
+    Vectorized tick -> seconds over a piecewise-constant tempo map, computed
+    with the same floating point steps as pretty_midi's tick_to_time table
+    """
+    starts = np.array([t for t, _ in tick_scales], dtype=np.int64)
+    scales = np.array([s for _, s in tick_scales], dtype=np.float64)
+
+    bases = np.zeros(len(tick_scales), dtype=np.float64)
+    for k in range(1, len(tick_scales)):
+        bases[k] = bases[k - 1] + scales[k - 1] * float(starts[k] - starts[k - 1])
+
+    ticks = np.asarray(ticks, dtype=np.int64)
+    segment = np.searchsorted(starts, ticks, side="right") - 1
+    return bases[segment] + scales[segment] * (ticks - starts[segment])
+
+
+def _read_varint(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+class SMFReader:
+    """
+    Read notes from a Standard MIDI File.
+
+    skip_tracks: track indices whose notes are ignored; their chunks are
+        jumped over without decoding (track 0 is still scanned for tempo).
+    skip_channels: 0-based MIDI channels to ignore, e.g. {9} for GM drums.
+    """
+
+    def __init__(self, skip_tracks=(), skip_channels=()):
+        self.skip_tracks = frozenset(skip_tracks)
+        self.skip_channels = frozenset(skip_channels)
+
+    def read(self, source):
+        """
+        Read a path, bytes-like object (bytes, bytearray, memoryview) or
+        binary file object. Returns MidiData.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as fh:
+                try:
+                    data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files cannot be mapped
+                    raise MidiParseError("MThd not found. Probably not a MIDI file")
+                try:
+                    return self.read_buffer(data)
+                finally:
+                    data.close()
+        if isinstance(source, memoryview):
+            return self.read_buffer(source.cast("B"))
+        if isinstance(source, (bytes, bytearray)):
+            return self.read_buffer(source)
+        if hasattr(source, "getbuffer"):
+            # BytesIO: parse its buffer in place
+            with source.getbuffer() as data:
+                return self.read_buffer(data)
+        return self.read_buffer(source.read())
+
+    def read_buffer(self, data):
+        try:
+            return self._parse(data)
+        except (IndexError, struct.error):
+            raise MidiParseError("Unexpected end of MIDI data")
+
+    def _parse(self, data):
+        header = scan_header(data)
+        resolution = header.resolution
+
+        pitch = array("h")
+        start_tick = array("q")
+        end_tick = array("q")
+        tick_scales = [(0, 60.0 / (DEFAULT_TICK_SCALE_BPM * resolution))]
+        time_signatures = []
+        tempo_events = []
+        max_tick = 0
+
+        for track_idx, (chunk_start, size) in enumerate(header.tracks):
+            chunk_end = chunk_start + size
+            collect_notes = track_idx not in self.skip_tracks
+            if not collect_notes and track_idx != 0:
+                continue
+
+            last_tick = self._parse_track(
+                data, chunk_start, chunk_end, track_idx == 0, collect_notes,
+                resolution, pitch, start_tick, end_tick, tick_scales, time_signatures,
+                tempo_events
+            )
+            max_tick = max(max_tick, last_tick)
+
+        if max_tick + 1 > MAX_TICK:
+            raise MidiParseError(
+                f"MIDI file has a largest tick of {max_tick + 1}, it is likely corrupt"
+            )
+
+        starts = np.frombuffer(start_tick, dtype=np.int64)
+        ends = np.frombuffer(end_tick, dtype=np.int64)
+        start_time = ticks_to_seconds(starts, tick_scales)
+        end_time = ticks_to_seconds(ends, tick_scales)
+        notes = NoteTable(np.frombuffer(pitch, dtype=np.int16), start_time, end_time - start_time)
+
+        return MidiData(
+            notes, resolution, tick_scales, time_signatures, max_tick, len(tempo_events)
+        )
+
+    def _parse_track(self, data, pos, end, is_first, collect_notes, resolution,
+                     pitch, start_tick, end_tick, tick_scales, time_signatures, tempo_events):
+        skip_channels = self.skip_channels
+        open_notes = {}
+        tick = 0
+        last_status = None
+
+        while pos < end:
+            # Delta time (variable-length quantity), inlined for speed
+            byte = data[pos]
+            pos += 1
+            delta = byte & 0x7F
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                delta = (delta << 7) | (byte & 0x7F)
+            tick += delta
+
+            status = data[pos]
+            if status < 0x80:
+                if last_status is None:
+                    raise MidiParseError("running status without last_status")
+                status = last_status
+            else:
+                pos += 1
+                if status != 0xFF:
+                    # Meta events don't set running status
+                    last_status = status
+
+            kind = status & 0xF0
+            if kind == 0x90 or kind == 0x80:
+                note = data[pos]
+                velocity = data[pos + 1]
+                pos += 2
+                if note > 127 or velocity > 127:
+                    raise MidiParseError("data byte must be in range 0..127")
+                channel = status & 0x0F
+                if not collect_notes or channel in skip_channels:
+                    continue
+                key = (channel << 7) | note
+                if kind == 0x90 and velocity > 0:
+                    open_notes.setdefault(key, []).append(tick)
+                elif key in open_notes:
+                    # One note-off closes every earlier note-on of this pitch;
+                    # a note-on at the same tick stays open (as in pretty_midi)
+                    pending = open_notes[key]
+                    kept = [t for t in pending if t == tick]
+                    closed = len(pending) - len(kept)
+                    for t in pending:
+                        if t != tick:
+                            pitch.append(note)
+                            start_tick.append(t)
+                            end_tick.append(tick)
+                    if closed and kept:
+                        open_notes[key] = kept
+                    else:
+                        del open_notes[key]
+            elif kind == 0xA0 or kind == 0xB0 or kind == 0xE0:
+                pos += 2
+            elif kind == 0xC0 or kind == 0xD0:
+                pos += 1
+            elif status == 0xFF:
+                meta_type = data[pos]
+                length, pos = _read_varint(data, pos + 1)
+                if is_first and meta_type == 0x51 and length == 3:
+                    tempo = (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]
+                    self._add_tempo(tick_scales, tick, tempo, resolution)
+                    tempo_events.append(tick)
+                elif meta_type == 0x58 and length >= 2:
+                    time_signatures.append((tick, data[pos], 2 ** data[pos + 1]))
+                pos += length
+            elif status == 0xF0 or status == 0xF7:
+                length, pos = _read_varint(data, pos)
+                pos += length
+            elif status in SYSTEM_DATA_LENGTH:
+                pos += SYSTEM_DATA_LENGTH[status]
+            else:
+                raise MidiParseError(f"undefined status byte 0x{status:02x}")
+
+        if pos != end:
+            raise MidiParseError("Track data overruns its chunk")
+        return tick
+
+    @staticmethod
+    def _add_tempo(tick_scales, tick, tempo, resolution):
+        tick_scale = 60.0 / ((6e7 / tempo) * resolution)
+        if tick == 0:
+            # A tempo at the very start replaces the default
+            tick_scales[:] = [(0, tick_scale)]
+        elif tick_scale != tick_scales[-1][1]:
+            # Repeated BPM values are common; keep only real changes
+            tick_scales.append((tick, tick_scale))
+
+
+def estimate_tempo(onsets):
+    """
+    Global tempo estimate from note onsets (seconds), following pretty_midi's
+    estimate_tempo (inter-onset interval clustering, Dixon 2001)
+    """
+    onsets = np.sort(np.asarray(onsets, dtype=np.float64))
+    ioi = np.diff(onsets)
+    ioi = ioi[(ioi > .05) & (ioi < 2)]
+    # Fold intervals into the 30..300 bpm range
+    for n in range(ioi.shape[0]):
+        while ioi[n] < .2:
+            ioi[n] *= 2
+
+    clusters = []
+    counts = []
+    for interval in ioi.tolist():
+        cluster_arr = np.asarray(clusters)
+        if clusters and (np.abs(cluster_arr - interval) < .025).any():
+            k = int(np.argmin(cluster_arr - interval))
+            clusters[k] = (counts[k] * clusters[k] + interval) / (counts[k] + 1)
+            counts[k] += 1
+        else:
+            clusters.append(interval)
+            counts.append(1.)
+
+    if not clusters:
+        raise ValueError("Can't provide a global tempo estimate when there"
+                         " are fewer than two notes.")
+    best = np.argsort(np.asarray(counts))[::-1][0]
+    return 60. / clusters[best]
@@ -0,0 +1,195 @@
+"""
+The music21 render engine, the reference backend.
+
+Builds music21 Measures, Voices, Chords and ties from the shared
+utils.score_layout measure layout and exports them as MusicXML. Parts can
+be exported one by one (in a process pool, or to reuse stored fragments)
+and stitched into one score. Imported by utils.score_renderer only when
+this engine is used, since loading music21 alone takes a large share of a
+short conversion.
+"""
+import re
+from itertools import repeat
+
+from music21 import stream, note, chord, clef, instrument, tempo, meter, tie
+from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+from utils.score_layout import ScoreLayout, clef_for, layout_part, split_duration
+
+ID_ATTR_RE = re.compile(rb'\bid="([^"]*)"')
+MIDI_CHANNEL_RE = re.compile(rb'<midi-channel>\d+</midi-channel>')
+
+
+def _fill_voice(container, events, layout):
+    """
+    Append the (start, length, pitches, tie_stop, tie_start) segments of
+    one voice to a Measure or Voice, with rests in the gaps. Lengths are
+    split into notatable pieces the same way the direct writer splits them.
+    """
+    quarter = 1 / layout.divisions
+    pos = 0
+    for start, size, pitches, tie_stop, tie_start in events:
+        if start > pos:
+            for value, _, _ in split_duration(start - pos, layout.durations):
+                container.coreAppend(note.Rest(quarterLength=value * quarter))
+        pieces = split_duration(size, layout.durations)
+        last = len(pieces) - 1
+        for k, (value, _, _) in enumerate(pieces):
+            if len(pitches) == 1:
+                element = note.Note(pitches[0], quarterLength=value * quarter)
+            else:
+                # From Notes: a Chord built from MIDI numbers re-spells them, which is slow
+                element = chord.Chord([note.Note(p) for p in pitches], quarterLength=value * quarter)
+            stop = tie_stop or k > 0
+            start_tie = tie_start or k < last
+            if stop or start_tie:
+                element.tie = tie.Tie("continue" if stop and start_tie else "stop" if stop else "start")
+            container.coreAppend(element)
+        pos = start + size
+    if pos < layout.measure_len:
+        for value, _, _ in split_duration(layout.measure_len - pos, layout.durations):
+            container.coreAppend(note.Rest(quarterLength=value * quarter))
+    container.coreElementsChanged()
+
+
+def _music21_part(inst_name, onset, length, pitch, layout, n_measures, tempo_marks):
+    """
+    A Part built measure by measure from the shared layout, with chords,
+    voices and barline ties already in place
+    """
+    quarter = 1 / layout.divisions
+    measures = layout_part(onset, length, pitch, layout.measure_len)
+    sign, line = clef_for(pitch)
+
+    part = stream.Part()
+    part.insert(0, instrument.fromString(inst_name))
+    for m in range(n_measures):
+        measure = stream.Measure(number=m + 1)
+        if m == 0:
+            measure.insert(0, clef.clefFromString(f"{sign}{line}"))
+            measure.insert(0, meter.TimeSignature(f"{layout.beats}/{layout.beat_type}"))
+
+        voices = measures.pop(m, None)
+        if not voices:
+            rest = note.Rest(quarterLength=layout.measure_len * quarter)
+            rest.fullMeasure = True
+            measure.insert(0, rest)
+        elif len(voices) == 1:
+            _fill_voice(measure, next(iter(voices.values())), layout)
+        else:
+            for voice in sorted(voices):
+                container = stream.Voice(id=str(voice + 1))
+                _fill_voice(container, voices[voice], layout)
+                measure.insert(0, container)
+
+        # After the notes: coreAppend places elements at the highest time so far
+        for offset, bpm in tempo_marks.get(m, ()):
+            measure.insert(offset * quarter, tempo.MetronomeMark(number=bpm))
+        part.coreAppend(measure)
+    part.coreElementsChanged()
+    return part
+
+
+def _export_score(score):
+    """
+    MusicXML bytes for a Score built by _music21_part. Its measures, rests,
+    voices and ties are complete, so music21's copy and makeNotation pass
+    are skipped.
+    """
+    return GeneralObjectExporter(score).parseWellformedObject(score)
+
+
+def _export_music21_part(spec, layout, n_measures):
+    """
+    Worker: one part as a single-part MusicXML document (bytes)
+    """
+    inst_name, onset, length, pitch, tempo_marks = spec
+    score = stream.Score()
+    score.insert(0, _music21_part(inst_name, onset, length, pitch, layout, n_measures, tempo_marks))
+    return _export_score(score)
+
+
+def _stitch_parts(docs, output_path):
+    """
+    Join single-part MusicXML documents into one score. Ids from different
+    worker processes can collide, so they are renumbered; MIDI channels are
+    numbered in part order, skipping the drum channel, as music21 does.
+    """
+    channels = (c for c in range(1, 1000) if c % 16 != 10)
+    part_lists = []
+    bodies = []
+    for i, doc in enumerate(docs, 1):
+        ids = {}
+
+        def rename(match):
+            old = match.group(1)
+            if old not in ids:
+                ids[old] = f"P{i}".encode() if not ids else f"P{i}-I{len(ids)}".encode()
+            return b'id="' + ids[old] + b'"'
+
+        list_start = doc.index(b">", doc.index(b"<part-list")) + 1
+        part_list = ID_ATTR_RE.sub(rename, doc[list_start:doc.index(b"</part-list>")])
+        part_lists.append(MIDI_CHANNEL_RE.sub(
+            lambda _: f"<midi-channel>{next(channels)}</midi-channel>".encode(), part_list
+        ).strip())
+        body = doc[doc.index(b"<part id"):doc.rindex(b"</part>") + len(b"</part>")]
+        # The divider comment music21 puts before each part of a multi-part score
+        spacer = 60 - len(f"Part {i}")
+        divider = f"<!--{'=' * (spacer // 2)} Part {i} {'=' * (spacer - spacer // 2)}-->\n  "
+        bodies.append(divider.encode() + ID_ATTR_RE.sub(
+            lambda m: b'id="' + ids.get(m.group(1), m.group(1)) + b'"', body
+        ))
+
+    head = docs[0]
+    with open(output_path, "wb") as fh:
+        fh.write(head[:head.index(b"<part-list")] + b"<part-list>\n    ")
+        fh.write(b"\n    ".join(part_lists))
+        fh.write(b"\n  </part-list>\n  ")
+        fh.write(b"\n  ".join(bodies))
+        fh.write(b"\n</score-partwise>\n")
+
+
+def render_music21(assignments, tempo_map, output_path, grid, executor=None, fragments=None):
+    """
+    Write the score for assignments to output_path. executor, if given,
+    exports parts concurrently; fragments (a utils.artifacts.JobArtifacts)
+    supplies and stores per-part exports. Returns the Score when it was
+    built in one piece, else None.
+    """
+    layout = ScoreLayout.for_tempo_map(tempo_map, grid)
+    parts, n_measures = layout.quantize(assignments, tempo_map)
+    marks = layout.tempo_marks(tempo_map)
+    # Tempo marks live in the first part so they survive MusicXML export
+    specs = [(inst_name, onset, length, pitch, marks if i == 0 else {})
+             for i, (inst_name, onset, length, pitch) in enumerate(parts)]
+
+    if fragments is not None and specs:
+        # Parts are exported one by one (as with a pool) so each can be reused
+        keys = [fragments.key("music21", layout.grid, layout.beats, layout.beat_type, n_measures,
+                              inst_name, sorted(part_marks.items()), onset, length, pitch)
+                for inst_name, onset, length, pitch, part_marks in specs]
+        docs = [fragments.get(key) for key in keys]
+        todo = [k for k, doc in enumerate(docs) if doc is None]
+        mapper = executor.map if executor is not None else map
+        exported = mapper(_export_music21_part, [specs[k] for k in todo],
+                          repeat(layout), repeat(n_measures))
+        for k, doc in zip(todo, exported):
+            fragments.put(keys[k], doc)
+            docs[k] = doc
+        _stitch_parts(docs, output_path)
+        return None
+
+    if executor is not None:
+        docs = list(executor.map(_export_music21_part, specs, repeat(layout), repeat(n_measures)))
+        _stitch_parts(docs, output_path)
+        return None
+
+    score = stream.Score()
+    for spec in specs:
+        inst_name, onset, length, pitch, part_marks = spec
+        # Parts run in parallel; append() would place them one after another
+        score.insert(0, _music21_part(inst_name, onset, length, pitch, layout, n_measures, part_marks))
+
+    with open(output_path, "wb") as fh:
+        fh.write(_export_score(score))
+    return score
@@ -0,0 +1,233 @@
+"""
+Direct MusicXML writer.
+
+Serializes the measure layout from utils.score_layout (chords, voices,
+barline ties) plus rests, streaming partwise MusicXML straight to a file
+handle one measure at a time, without building music21 objects. Selected
+with render_score(engine="direct").
+
+Given an executor, parts are laid out and serialized in worker processes,
+and long parts are split into measure ranges that are serialized
+concurrently. Voices are assigned over the whole part before splitting, so
+the output is byte-identical to the serial writer.
+
+Given a fragment store (utils.artifacts.JobArtifacts), each part's measures
+are looked up by a hash of its instrument and quantized notes and only the
+parts not found are rendered, so re-orchestrating one role leaves the other
+parts untouched.
+"""
+from itertools import groupby
+from xml.sax.saxutils import escape, quoteattr
+
+from utils.score_layout import (
+    ScoreLayout, clef_for, split_duration, part_chords, chords_in_range,
+    layout_measures, layout_part
+)
+
+# MIDI pitch class -> (step, alter), spelled the way music21 spells MIDI numbers
+PITCH_SPELLING = [
+    ("C", 0), ("C", 1), ("D", 0), ("E", -1), ("E", 0), ("F", 0),
+    ("F", 1), ("G", 0), ("G", 1), ("A", 0), ("B", -1), ("B", 0),
+]
+
+
+def _render_chunk(task):
+    """
+    Worker: serialize measures first..stop-1 of one part
+    """
+    writer, chords, clef, tempo_marks, first, stop = task
+    measures = layout_measures(*chords, writer.measure_len, first, stop)
+    return "".join(
+        writer._measure(m, measures.get(m), clef, tempo_marks) for m in range(first, stop)
+    )
+
+
+class MusicXMLWriter(ScoreLayout):
+    def write(self, assignments, tempo_map, fh, executor=None, chunk_measures=None, fragments=None):
+        """
+        Stream a partwise score for {instrument: NoteTable} to a text file handle.
+        With an executor, parts (and chunks of chunk_measures measures) are
+        rendered in its worker processes. With a fragment store, stored parts
+        are reused and newly rendered ones are stored.
+        """
+        tempo_marks = self.tempo_marks(tempo_map)
+        parts, n_measures = self.quantize(assignments, tempo_map)
+
+        fh.write(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+            '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+            '<score-partwise version="4.0">\n'
+            '  <part-list>\n'
+        )
+        for i, (inst_name, *_rest) in enumerate(parts, 1):
+            name = escape(inst_name)
+            fh.write(
+                f'    <score-part id="P{i}">\n'
+                f'      <part-name>{name}</part-name>\n'
+                f'      <score-instrument id="P{i}-I1">\n'
+                f'        <instrument-name>{name}</instrument-name>\n'
+                f'      </score-instrument>\n'
+                f'    </score-part>\n'
+            )
+        fh.write('  </part-list>\n')
+
+        keys = {}
+        stored = {}
+        if fragments is not None:
+            for i, (inst_name, onset, length, pitch) in enumerate(parts, 1):
+                keys[i] = fragments.key(
+                    "direct", self.grid, self.beats, self.beat_type, inst_name, n_measures,
+                    sorted(tempo_marks.items()) if i == 1 else [], onset, length, pitch
+                )
+                data = fragments.get(keys[i])
+                if data is not None:
+                    stored[i] = data.decode("utf-8")
+
+        todo = [(i, part) for i, part in enumerate(parts, 1) if i not in stored]
+        if executor is not None:
+            chunks = self._parallel_chunks(todo, tempo_marks, n_measures, executor, chunk_measures)
+        else:
+            chunks = self._serial_chunks(todo, tempo_marks, n_measures)
+        # Chunks arrive in score order, grouped by part
+        rendered = groupby(chunks, key=lambda chunk: chunk[0])
+
+        for i in range(1, len(parts) + 1):
+            fh.write(f'  <part id="P{i}">\n')
+            if i in stored:
+                fh.write(stored[i])
+            else:
+                _, texts = next(rendered)
+                kept = [] if fragments is not None else None
+                for _, text in texts:
+                    fh.write(text)
+                    if kept is not None:
+                        kept.append(text)
+                if kept is not None:
+                    fragments.put(keys[i], "".join(kept).encode("utf-8"))
+            fh.write('  </part>\n')
+
+        fh.write('</score-partwise>\n')
+
+    def _serial_chunks(self, parts, tempo_marks, n_measures):
+        """
+        (part number, measure text) for every measure of the given
+        [(part number, part)], one measure at a time
+        """
+        for i, (inst_name, onset, length, pitch) in parts:
+            measures = layout_part(onset, length, pitch, self.measure_len)
+            clef = clef_for(pitch)
+            marks = tempo_marks if i == 1 else {}
+            for m in range(n_measures):
+                yield i, self._measure(m, measures.pop(m, None), clef, marks)
+
+    def _parallel_chunks(self, parts, tempo_marks, n_measures, executor, chunk_measures):
+        """
+        (part number, text of chunk_measures measures) rendered in executor
+        """
+        if not parts:
+            return
+        # Voices depend on the whole part, so chords are voiced per part first
+        voiced = list(executor.map(part_chords, *zip(*[part[1:] for _, part in parts])))
+
+        chunk = chunk_measures or n_measures
+        tasks = []
+        for (i, (inst_name, onset, length, pitch)), chords in zip(parts, voiced):
+            marks = tempo_marks if i == 1 else {}
+            for first in range(0, n_measures, chunk):
+                stop = min(first + chunk, n_measures)
+                lo, hi = first * self.measure_len, stop * self.measure_len
+                tasks.append((i, (self, chords_in_range(chords, lo, hi), clef_for(pitch),
+                                  marks, first, stop)))
+
+        # map() yields in submission order, so chunks come back in score order
+        for (i, _), text in zip(tasks, executor.map(_render_chunk, [task for _, task in tasks])):
+            yield i, text
+
+    def _measure(self, m, voices, clef, tempo_marks):
+        buf = [f'    <measure number="{m + 1}">\n']
+        if m == 0:
+            buf.append(self._attributes(clef))
+        for offset, bpm in tempo_marks.get(m, ()):
+            buf.append(self._tempo(offset, bpm))
+        self._measure_body(voices, buf)
+        buf.append('    </measure>\n')
+        return "".join(buf)
+
+    def _attributes(self, clef):
+        return (
+            '      <attributes>\n'
+            f'        <divisions>{self.divisions}</divisions>\n'
+            f'        <time><beats>{self.beats}</beats><beat-type>{self.beat_type}</beat-type></time>\n'
+            f'        <clef><sign>{clef[0]}</sign><line>{clef[1]}</line></clef>\n'
+            '      </attributes>\n'
+        )
+
+    def _tempo(self, offset, bpm):
+        return (
+            '      <direction placement="above">\n'
+            '        <direction-type><metronome>'
+            f'<beat-unit>quarter</beat-unit><per-minute>{bpm:g}</per-minute>'
+            '</metronome></direction-type>\n'
+            + (f'        <offset>{offset}</offset>\n' if offset else '')
+            + f'        <sound tempo={quoteattr(f"{bpm:g}")}/>\n'
+            '      </direction>\n'
+        )
+
+    def _measure_body(self, voices, buf):
+        if not voices:
+            buf.append(
+                f'      <note><rest measure="yes"/><duration>{self.measure_len}</duration>'
+                '<voice>1</voice></note>\n'
+            )
+            return
+
+        for n, voice in enumerate(sorted(voices)):
+            if n:
+                buf.append(f'      <backup><duration>{self.measure_len}</duration></backup>\n')
+            voice_id = voice + 1
+            pos = 0
+            for start, size, chord, tie_stop, tie_start in voices[voice]:
+                if start > pos:
+                    self._rest(start - pos, voice_id, buf)
+                self._note(size, chord, tie_stop, tie_start, voice_id, buf)
+                pos = start + size
+            if pos < self.measure_len:
+                self._rest(self.measure_len - pos, voice_id, buf)
+
+    def _rest(self, size, voice_id, buf):
+        for value, name, dots in split_duration(size, self.durations):
+            buf.append(
+                f'      <note><rest/><duration>{value}</duration><voice>{voice_id}</voice>'
+                f'<type>{name}</type>{"<dot/>" * dots}</note>\n'
+            )
+
+    def _note(self, size, chord, tie_stop, tie_start, voice_id, buf):
+        pieces = split_duration(size, self.durations)
+        last = len(pieces) - 1
+        for k, (value, name, dots) in enumerate(pieces):
+            stop = tie_stop or k > 0
+            start = tie_start or k < last
+            ties = ('<tie type="stop"/>' if stop else '') + ('<tie type="start"/>' if start else '')
+            tied = ('<tied type="stop"/>' if stop else '') + ('<tied type="start"/>' if start else '')
+            notations = f'<notations>{tied}</notations>' if tied else ''
+            for c, midi in enumerate(chord):
+                step, alter = PITCH_SPELLING[midi % 12]
+                buf.append(
+                    '      <note>'
+                    + ('<chord/>' if c else '')
+                    + f'<pitch><step>{step}</step>'
+                    + (f'<alter>{alter}</alter>' if alter else '')
+                    + f'<octave>{midi // 12 - 1}</octave></pitch>'
+                    f'<duration>{value}</duration>{ties}<voice>{voice_id}</voice>'
+                    f'<type>{name}</type>{"<dot/>" * dots}{notations}</note>\n'
+                )
+
+
+def write_musicxml(assignments, tempo_map, output_path, grid=0.25, executor=None,
+                   chunk_measures=None, fragments=None):
+    writer = MusicXMLWriter.for_tempo_map(tempo_map, grid)
+
+    with open(output_path, "w", encoding="utf-8") as fh:
+        writer.write(assignments, tempo_map, fh, executor, chunk_measures, fragments)
+    return output_path
@@ -0,0 +1,83 @@
+"""
+Vectorized note statistics for feature extraction.
+
+Polyphony uses a sweep line: each note adds +1 at its start and -1 at its
+end, the 2n events are sorted once and a cumulative sum gives the number of
+sounding notes between consecutive events. Ends sort before starts at equal
+times, so notes that merely touch never count as overlapping. Everything is
+NumPy, so million-note roles stay well under a second.
+"""
+import numpy as np
+
+# Histogram buckets for 1..HISTOGRAM_LEVELS sounding notes; the last bucket
+# also holds anything denser
+HISTOGRAM_LEVELS = 8
+PITCH_PERCENTILES = (10, 50, 90)
+
+
+def sounding_counts(start, end):
+    """
+    Sweep the note intervals. Returns (times, counts) where counts[k] notes
+    sound between times[k] and times[k + 1].
+    """
+    times = np.concatenate([end, start])
+    steps = np.concatenate([np.full(len(end), -1, dtype=np.int64), np.ones(len(start), dtype=np.int64)])
+    # Stable sort keeps the ends (listed first) ahead of starts at equal times
+    order = np.argsort(times, kind="stable")
+    return times[order], np.cumsum(steps[order])
+
+
+def polyphony_stats(start, end, levels=HISTOGRAM_LEVELS):
+    """
+    Max and time-weighted mean polyphony while anything sounds, plus the
+    share of sounding time spent at each level 1..levels
+    """
+    times, counts = sounding_counts(start, end)
+    if len(times) < 2:
+        return {"max_polyphony": 0, "mean_polyphony": 0.0, "polyphony_histogram": [0.0] * levels}
+
+    span = np.diff(times)
+    counts = counts[:-1]
+    sounding = counts > 0
+    sounding_time = float(span[sounding].sum())
+
+    histogram = np.zeros(levels)
+    mean = 0.0
+    if sounding_time > 0:
+        weights = np.bincount(
+            np.minimum(counts[sounding], levels), weights=span[sounding], minlength=levels + 1
+        )
+        histogram = weights[1:] / sounding_time
+        mean = float((counts[sounding] * span[sounding]).sum()) / sounding_time
+
+    return {
+        # Zero-length notes dip the count below zero for an instant
+        "max_polyphony": max(int(counts.max()), 0),
+        "mean_polyphony": mean,
+        "polyphony_histogram": histogram.tolist(),
+    }
+
+
+def pitch_stats(pitch):
+    low, median, high = np.percentile(pitch, PITCH_PERCENTILES)
+    return {
+        "pitch_min": int(pitch.min()),
+        "pitch_max": int(pitch.max()),
+        "pitch_p10": float(low),
+        "pitch_median": float(median),
+        "pitch_p90": float(high),
+    }
+
+
+def ioi_stats(onsets):
+    """
+    Inter-onset intervals between distinct onsets (chords count once)
+    """
+    ioi = np.diff(np.unique(onsets))
+    if not len(ioi):
+        return {"ioi_mean_ql": 0.0, "ioi_median_ql": 0.0, "ioi_std_ql": 0.0}
+    return {
+        "ioi_mean_ql": float(ioi.mean()),
+        "ioi_median_ql": float(np.median(ioi)),
+        "ioi_std_ql": float(ioi.std()),
+    }
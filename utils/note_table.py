@@ -0,0 +1,154 @@
+import numpy as np
+
+PITCH_DTYPE = np.int16
+TIME_DTYPE = np.float64
+
+
+class NoteTable:
+    """
+    Columnar container for symbolic notes.
+
+    Pitch, start and duration (seconds) are stored once as parallel NumPy
+    arrays. Subsets such as roles or instrument parts share those columns
+    and only carry an index array, so splitting a file never copies notes.
+    """
+
+    __slots__ = ("_pitch", "_start", "_duration", "_index")
+
+    def __init__(self, pitch, start, duration, index=None):
+        self._pitch = np.asarray(pitch, dtype=PITCH_DTYPE)
+        self._start = np.asarray(start, dtype=TIME_DTYPE)
+        self._duration = np.asarray(duration, dtype=TIME_DTYPE)
+        self._index = None if index is None else np.asarray(index, dtype=np.intp)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.empty(0))
+
+    @classmethod
+    def from_records(cls, notes):
+        """
+        Build a table from an iterable of {"pitch", "start", "duration"} dicts
+        """
+        notes = list(notes)
+        return cls(
+            [n["pitch"] for n in notes],
+            [n["start"] for n in notes],
+            [n["duration"] for n in notes],
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Combine several tables. Views over the same columns are merged by
+        concatenating their indices; anything else is materialized.
+        """
+        tables = [t for t in tables if t is not None]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+
+        first = tables[0]
+        if all(t.shares_columns(first) for t in tables):
+            return cls(
+                first._pitch, first._start, first._duration,
+                index=np.concatenate([t.index for t in tables])
+            )
+
+        return cls(
+            np.concatenate([t.pitch for t in tables]),
+            np.concatenate([t.start for t in tables]),
+            np.concatenate([t.duration for t in tables]),
+        )
+
+    # ------------------------------------------------------------------
+    # Columns
+    # ------------------------------------------------------------------
+    def _column(self, base):
+        return base if self._index is None else base[self._index]
+
+    @property
+    def pitch(self):
+        return self._column(self._pitch)
+
+    @property
+    def start(self):
+        return self._column(self._start)
+
+    @property
+    def duration(self):
+        return self._column(self._duration)
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    @property
+    def index(self):
+        """
+        Positions of this table's rows in the underlying columns
+        """
+        if self._index is None:
+            return np.arange(len(self._pitch), dtype=np.intp)
+        return self._index
+
+    def shares_columns(self, other):
+        return self._pitch is other._pitch and self._start is other._start
+
+    # ------------------------------------------------------------------
+    # Selection
+    # ------------------------------------------------------------------
+    def select(self, selector):
+        """
+        Return a view selected by a boolean mask, an index array or a slice.
+        Slices of a full table are true NumPy views; masks and index arrays
+        produce a table that shares columns and stores only the indices.
+        """
+        if isinstance(selector, slice) and self._index is None:
+            return NoteTable(
+                self._pitch[selector], self._start[selector], self._duration[selector]
+            )
+        return NoteTable(
+            self._pitch, self._start, self._duration, index=self.index[selector]
+        )
+
+    def sorted(self):
+        """
+        Return the notes ordered by start time, highest pitch first on ties
+        (then shortest first, so the order never depends on parse order)
+        """
+        order = np.lexsort((self.duration, -self.pitch, self.start))
+        return self.select(order)
+
+    def compact(self):
+        """
+        Materialize a view into its own contiguous columns
+        """
+        return NoteTable(self.pitch, self.start, self.duration)
+
+    # ------------------------------------------------------------------
+    # Record-style access (for logging and legacy callers)
+    # ------------------------------------------------------------------
+    def records(self):
+        for p, s, d in zip(self.pitch.tolist(), self.start.tolist(), self.duration.tolist()):
+            yield {"pitch": p, "start": s, "duration": d}
+
+    def __iter__(self):
+        return self.records()
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            i = self.index[item]
+            return {
+                "pitch": int(self._pitch[i]),
+                "start": float(self._start[i]),
+                "duration": float(self._duration[i]),
+            }
+        return self.select(item)
+
+    def __len__(self):
+        return len(self._pitch) if self._index is None else len(self._index)
+
+    def __repr__(self):
+        return f"NoteTable({len(self)} notes)"
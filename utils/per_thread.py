@@ -0,0 +1,42 @@
+"""
+Per-thread attributes for objects shared between threads.
+
+Agents are built once per process and reused by every request thread, but
+they report per-call details (last_stats) through attributes. Declaring
+such an attribute as PerThread keeps each thread's value separate:
+
+    class SomeAgent:
+        last_stats = PerThread(dict)
+"""
+import threading
+
+
+class PerThread:
+    def __init__(self, default):
+        # Called to create the value a thread sees before it sets one
+        self.default = default
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    @staticmethod
+    def _local(instance):
+        local = instance.__dict__.get("_per_thread")
+        if local is None:
+            local = instance.__dict__.setdefault("_per_thread", threading.local())
+        return local
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        local = self._local(instance)
+        try:
+            return getattr(local, self.name)
+        except AttributeError:
+            value = self.default()
+            setattr(local, self.name, value)
+            return value
+
+    def __set__(self, instance, value):
+        setattr(self._local(instance), self.name, value)
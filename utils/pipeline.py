@@ -0,0 +1,166 @@
+import threading
+from contextlib import nullcontext
+
+from agents.midi_analysis_agent import MIDIAnalysisAgent
+from agents.role_assignment_agent import RoleAssignmentAgent
+from agents.note_assignment_agent import NoteAssignmentAgent
+from agents.feature_extraction_agent import FeatureExtractionAgent
+from utils.score_renderer import render_score
+from utils.artifacts import JobArtifacts
+from utils.metrics import StageTimer, profile_job
+
+# Pipeline stages in execution order (reported to progress callbacks)
+STAGES = ("parse", "roles", "features", "orchestrate", "render")
+
+# (agent class, constructor arguments) -> the instance every run reuses
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+def shared_agent(cls, **kwargs):
+    """
+    The process-wide cls(**kwargs), built on first use. Agents keep per-call
+    stats per thread, so concurrent runs can share one instance (and a
+    pre-fork server can build them once before forking).
+    """
+    key = (cls, tuple(sorted(kwargs.items())))
+    agent = _agents.get(key)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(key)
+            if agent is None:
+                agent = _agents[key] = cls(**kwargs)
+    return agent
+
+
+def run_pipeline(midi, output_path, split_points=None, role_mode=None,
+                 renderer=None, output_format=None, progress=None, llm_limiter=None,
+                 profile_prefix=None, index=False, artifacts=None, plan=None, explanations=None,
+                 planner=None, llm_budget=None):
+    """
+    Run the full MIDI -> MusicXML conversion. midi is a path, the file's
+    bytes or a binary file object.
+
+    progress, if given, is called as progress(stage) after each stage.
+    llm_limiter, if given, is held around the Gemini request.
+    profile_prefix, if given, writes cProfile and tracemalloc dumps for this run.
+    index=True writes the measure index used for score previews.
+    artifacts, if given, is a utils.artifacts path prefix: the parsed notes,
+    role split and features are saved there, or loaded from there when an
+    earlier run saved them (midi may then be None), and rendered parts are
+    reused across runs.
+    plan, if given, is an instrument plan {role: [instrument]} used instead
+    of asking Gemini, with optional explanations per role.
+    planner picks "gemini" or the offline "rules" planner ($PLANNER by
+    default); llm_budget caps the wait for Gemini in seconds, after which
+    the rule plan is used ($LLM_BUDGET_SECONDS by default).
+    Returns a dict with the instruments, tempo, explanations, output path
+    (plus every file written), per-stage timings in seconds and a detailed
+    metrics report.
+    """
+    profiler = profile_job(profile_prefix) if profile_prefix else nullcontext(None)
+    with profiler as profile_paths:
+        result = _run_stages(midi, output_path, split_points, role_mode,
+                             renderer, output_format, progress, llm_limiter, index,
+                             artifacts, plan, explanations, planner, llm_budget)
+    if profile_paths:
+        result["profile"] = profile_paths
+    return result
+
+
+def _run_stages(midi, output_path, split_points, role_mode, renderer,
+                output_format, progress, llm_limiter, index, artifacts, plan, explanations,
+                planner, llm_budget):
+    timer = StageTimer()
+    artifacts = JobArtifacts(artifacts) if artifacts else None
+    reused = artifacts is not None and artifacts.has_analysis()
+
+    def done(stage):
+        timer.lap(stage)
+        if progress is not None:
+            progress(stage)
+
+    try:
+        if reused:
+            # Re-orchestration: everything up to the plan comes from the earlier run
+            notes, tempo_map, roles, features = artifacts.load_analysis()
+            done("parse")
+            done("roles")
+            done("features")
+        else:
+            midi_agent = shared_agent(MIDIAnalysisAgent)
+            notes, tempo_map = midi_agent.run(midi)
+            done("parse")
+
+            melody, harmony, bass = shared_agent(RoleAssignmentAgent).run(
+                notes, split_points=split_points, mode=role_mode
+            )
+            roles = {
+                "Melody": melody,
+                "Harmony": harmony,
+                "Bass": bass
+            }
+            done("roles")
+
+            features = shared_agent(FeatureExtractionAgent).run(roles, tempo_map)
+            if artifacts is not None:
+                artifacts.save_analysis(notes, tempo_map, roles, features)
+            done("features")
+
+        note_agent = shared_agent(NoteAssignmentAgent, llm_limiter=llm_limiter, planner=planner,
+                                  llm_budget=llm_budget)
+        result = note_agent.run(roles, features, plan=plan, explanations=explanations)
+        assignments = result["assignments"]
+        done("orchestrate")
+
+        files = render_score(assignments, tempo_map, output_path, engine=renderer,
+                             output_format=output_format, index=index, fragments=artifacts)
+        done("render")
+    finally:
+        total_seconds = timer.stop()
+
+    note_stats = note_agent.last_stats
+    metrics = {
+        "stages": timer.stages,
+        "total_seconds": total_seconds,
+        "notes": len(notes),
+        # True when parse/roles/features were loaded from an earlier run
+        "reused_analysis": reused,
+        "tempo_estimated": False if reused else midi_agent.last_stats["tempo_estimated"],
+        "tempo_estimate_seconds": 0.0 if reused else midi_agent.last_stats["tempo_estimate_seconds"],
+        "roles": {role: len(role_notes) for role, role_notes in roles.items()},
+        # What the job cost the worker, for calibrating utils.admission.MemoryModel
+        "memory": {
+            "start_rss_bytes": timer.start_rss,
+            "added_bytes": timer.added_bytes(),
+        },
+        "llm": {
+            "plan_cache": note_stats["plan_cache"],
+            "planner": note_stats["planner"],
+            "seconds": note_stats["llm_seconds"],
+            "fallback": note_stats["fallback"],
+            "speculative": note_stats["speculative"],
+        },
+        "reassign_seconds": note_stats["reassign_seconds"],
+        "reassigned_notes": note_stats["reassigned_notes"],
+        "unplaceable_notes": note_stats["unplaceable_notes"],
+        # Parts taken from / rendered into the artifact store
+        "parts_reused": artifacts.hits if artifacts is not None else 0,
+        "parts_rendered": artifacts.misses if artifacts is not None else len(assignments),
+    }
+
+    return {
+        "instruments": list(assignments.keys()),
+        # Role -> instruments as planned, before range reassignment
+        "plan": result["plan"],
+        "tempo": round(tempo_map.bpm, 2),
+        "explanations": result.get("explanations", {}),
+        # True when Gemini failed and the rule planner stepped in
+        "fallback": result.get("fallback", False),
+        # True when Gemini was over its latency budget and the rule plan was used
+        "speculative": result.get("speculative", False),
+        "output_path": files[0],
+        "files": files,
+        "timings": timer.timings(),
+        "metrics": metrics,
+    }
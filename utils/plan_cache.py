@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "plan_cache.sqlite")
+
+
+def quantize(value, precision):
+    """
+    Round every float in a (nested) feature structure to `precision` decimals
+    so nearly identical feature vectors map to the same key
+    """
+    if isinstance(value, dict):
+        return {str(k): quantize(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [quantize(v, precision) for v in value]
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    # Normalize -0.0 so it hashes like 0.0
+    return round(value, precision) + 0.0
+
+
+class PlanCache:
+    """
+    Two-tier cache for orchestration plans returned by the LLM.
+
+    Plans are keyed on the quantized role features plus the model name and
+    prompt version. Lookups hit an in-memory LRU first, then an SQLite file
+    with TTL and size-based eviction. Pass path=None for memory only.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, precision=2, ttl_seconds=7 * 24 * 3600,
+                 max_entries=10000, memory_entries=256):
+        self.path = path
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS plans ("
+                    " key TEXT PRIMARY KEY,"
+                    " value TEXT NOT NULL,"
+                    " created REAL NOT NULL,"
+                    " accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS plans_accessed ON plans (accessed)")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a cache from PLAN_CACHE_* environment variables.
+        PLAN_CACHE_PATH="" keeps the cache in memory only.
+        """
+        return cls(
+            path=os.getenv("PLAN_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+            precision=int(os.getenv("PLAN_CACHE_PRECISION", "2")),
+            ttl_seconds=float(os.getenv("PLAN_CACHE_TTL", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "10000")),
+            memory_entries=int(os.getenv("PLAN_CACHE_MEMORY_ENTRIES", "256")),
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, features, model, prompt_version):
+        payload = json.dumps(
+            {
+                "features": quantize(features, self.precision),
+                "model": model,
+                "prompt_version": prompt_version,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, value, stored_at):
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return the cached plan for key, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self.path:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT value, created FROM plans WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now - row[1] <= self.ttl_seconds:
+                        conn.execute("UPDATE plans SET accessed = ? WHERE key = ?", (now, key))
+                        self._remember(key, row[0], row[1])
+                        self.hits_disk += 1
+                        return json.loads(row[0])
+                    if row is not None:
+                        conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+
+            self.misses += 1
+            return None
+
+    def put(self, key, plan):
+        now = time.time()
+        value = json.dumps(plan, sort_keys=True)
+        with self._lock:
+            self._remember(key, value, now)
+            if not self.path:
+                return
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO plans (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM plans WHERE key IN ("
+            " SELECT key FROM plans ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.path:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM plans")
+
+    def stats(self):
+        hits = self.hits_memory + self.hits_disk
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_plan_cache():
+    """
+    Process-wide plan cache shared by every NoteAssignmentAgent
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = PlanCache.from_env()
+        return _default_cache
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.storage import atomic_output
+
+DEFAULT_RESULT_DIR = os.path.join("cache", "results")
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def read_and_hash(stream):
+    """
+    Read a binary stream into memory, hashing it chunk by chunk as it comes
+    in. Returns (data as a bytearray, sha256 hex digest). The buffer is the
+    only full copy in this process; submitting a job pickles another one to
+    the worker.
+    """
+    digest = hashlib.sha256()
+    data = bytearray()
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        data += chunk
+    return data, digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished conversions.
+
+    Results are keyed on the uploaded file's content hash plus the pipeline
+    configuration. Each MusicXML artifact is stored as a file next to an
+    SQLite index holding its metadata, with TTL and total-size eviction.
+    Pass root=None to disable caching.
+    """
+
+    def __init__(self, root=DEFAULT_RESULT_DIR, ttl_seconds=7 * 24 * 3600,
+                 max_bytes=1024 * 1024 * 1024):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    " key TEXT PRIMARY KEY,"
+                    " meta TEXT NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " created REAL NOT NULL,"
+                    " accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a cache from RESULT_CACHE_* environment variables.
+        RESULT_CACHE_DIR="" disables the cache.
+        """
+        return cls(
+            root=os.getenv("RESULT_CACHE_DIR", DEFAULT_RESULT_DIR) or None,
+            ttl_seconds=float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600))),
+            max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))),
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, content_hash, **config):
+        payload = json.dumps({"content": content_hash, "config": config}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def artifact_path(self, key):
+        return os.path.join(self.root, f"{key}.musicxml")
+
+    def get(self, key):
+        """
+        Return the stored metadata for key, or None on a miss
+        """
+        if not self.root:
+            return None
+        now = time.time()
+        with self._lock:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT meta, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_seconds \
+                        and os.path.exists(self.artifact_path(key)):
+                    conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return json.loads(row[0])
+                if row is not None:
+                    self._delete(conn, key)
+            self.misses += 1
+            return None
+
+    def export(self, key, dest_path):
+        """
+        Make the cached artifact available at dest_path (hard link when possible)
+        """
+        if os.path.exists(dest_path):
+            return dest_path
+        try:
+            os.link(self.artifact_path(key), dest_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            with atomic_output(dest_path) as tmp_path:
+                shutil.copyfile(self.artifact_path(key), tmp_path)
+        return dest_path
+
+    def put(self, key, artifact_path, meta):
+        if not self.root:
+            return
+        now = time.time()
+        # Copy under a temp name and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(artifact_path, tmp_path)
+        os.replace(tmp_path, self.artifact_path(key))
+
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, meta, size, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(meta), os.path.getsize(artifact_path), now, now),
+                )
+                self._evict(conn, now)
+
+    def _delete(self, conn, key):
+        conn.execute("DELETE FROM results WHERE key = ?", (key,))
+        try:
+            os.remove(self.artifact_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, conn, now):
+        expired = conn.execute(
+            "SELECT key FROM results WHERE created < ?", (now - self.ttl_seconds,)
+        ).fetchall()
+        # Keep the most recently used artifacts that fit in max_bytes
+        total = 0
+        oversize = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed DESC"):
+            total += size
+            if total > self.max_bytes:
+                oversize.append((key,))
+        for (key,) in expired + oversize:
+            self._delete(conn, key)
+
+    def clear(self):
+        if not self.root:
+            return
+        with self._lock:
+            with self._connect() as conn:
+                for (key,) in conn.execute("SELECT key FROM results").fetchall():
+                    self._delete(conn, key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries, size = 0, 0
+        if self.root:
+            with self._connect() as conn:
+                entries, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+                ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
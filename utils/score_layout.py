@@ -0,0 +1,224 @@
+"""
+Measure layout shared by both score renderers.
+
+Quantized notes are grouped into chords (same onset and length), the chords
+are spread over the fewest voices that keep each voice free of overlaps
+(interval partitioning), and every chord is split at barlines into tied
+segments. Renderers receive measure-aligned data and only have to
+serialize it, so music21 never has to discover overlaps or ties itself.
+"""
+import heapq
+
+import numpy as np
+
+NOTE_TYPES = [
+    (4.0, "whole"), (2.0, "half"), (1.0, "quarter"), (0.5, "eighth"),
+    (0.25, "16th"), (0.125, "32nd"), (0.0625, "64th"),
+]
+
+
+def divisions_for_grid(grid):
+    """
+    MusicXML divisions per quarter note for a quantization grid (in quarters).
+    One grid step is one division, so the grid must be 1/2**k of a quarter.
+    """
+    divisions = round(1 / grid)
+    if divisions < 1 or divisions & (divisions - 1) or abs(divisions * grid - 1) > 1e-9:
+        raise ValueError(f"Direct writer needs a grid of 1/2**k quarter notes, got {grid}")
+    return divisions
+
+
+def duration_table(divisions, measure_len):
+    """
+    Notatable durations in divisions, largest first: [(length, type, dots)]
+    """
+    table = []
+    for ql, name in NOTE_TYPES:
+        for dots, factor in ((1, 1.5), (0, 1.0)):
+            length = ql * factor * divisions
+            if length == int(length) and 1 <= length <= measure_len:
+                table.append((int(length), name, dots))
+    table.sort(key=lambda entry: -entry[0])
+    return table
+
+
+def split_duration(length, table):
+    """
+    Greedily split a length into notatable pieces (tied when > 1 piece)
+    """
+    pieces = []
+    for value, name, dots in table:
+        while length >= value:
+            pieces.append((value, name, dots))
+            length -= value
+    return pieces
+
+
+def quantize_notes(notes, tempo_map, grid):
+    """
+    Snap a NoteTable to the grid. Returns (onset, length, pitch) in grid steps.
+    """
+    onset = np.round(tempo_map.seconds_to_beats(notes.start) / grid).astype(np.int64)
+    length = np.round(tempo_map.durations_to_beats(notes.start, notes.duration) / grid)
+    length = np.maximum(length, 1).astype(np.int64)
+    return onset, length, notes.pitch.astype(np.int64)
+
+
+def group_chords(onset, length, pitch):
+    """
+    Merge notes with identical onset and length into chords.
+    Returns chord onsets, lengths and a list of pitch tuples, ordered by onset.
+    """
+    if not len(onset):
+        return onset, length, []
+
+    order = np.lexsort((pitch, length, onset))
+    onset, length, pitch = onset[order], length[order], pitch[order]
+
+    heads = np.flatnonzero(np.r_[True, (np.diff(onset) != 0) | (np.diff(length) != 0)])
+    pitch_list = pitch.tolist()
+    bounds = heads.tolist() + [len(pitch_list)]
+    chords = [tuple(pitch_list[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+    return onset[heads], length[heads], chords
+
+
+def assign_voices(onset, end):
+    """
+    Interval partitioning: give each event (sorted by onset) the lowest free
+    voice, opening a new one only when all are busy. Uses the minimal number
+    of voices. Returns (voice per event, voice count).
+    """
+    voices = np.empty(len(onset), dtype=np.int64)
+    busy = []   # (end, voice)
+    free = []   # voice ids
+    count = 0
+
+    for i, (start, stop) in enumerate(zip(onset.tolist(), end.tolist())):
+        while busy and busy[0][0] <= start:
+            heapq.heappush(free, heapq.heappop(busy)[1])
+        if free:
+            voice = heapq.heappop(free)
+        else:
+            voice = count
+            count += 1
+        voices[i] = voice
+        heapq.heappush(busy, (stop, voice))
+
+    return voices, count
+
+
+def part_chords(onset, length, pitch):
+    """
+    Chords of one part with their voices: (onset, length, pitch tuples, voice)
+    """
+    chord_onset, chord_length, chords = group_chords(onset, length, pitch)
+    voices, _ = assign_voices(chord_onset, chord_onset + chord_length)
+    return chord_onset, chord_length, chords, voices
+
+
+def chords_in_range(part, lo, hi):
+    """
+    The chords of part_chords() output that sound within grid steps [lo, hi)
+    """
+    chord_onset, chord_length, chords, voices = part
+    rows = np.flatnonzero((chord_onset < hi) & (chord_onset + chord_length > lo))
+    return chord_onset[rows], chord_length[rows], [chords[k] for k in rows.tolist()], voices[rows]
+
+
+def layout_measures(chord_onset, chord_length, chords, voices, measure_len, first=0, stop=None):
+    """
+    Measure-aligned layout of voiced chords.
+    Returns {measure: {voice: [(start, length, pitches, tie_stop, tie_start)]}}
+    where start is relative to the measure and notes crossing a barline are
+    split into tied segments. Only measures first..stop-1 are laid out;
+    chords reaching in from before `first` continue as tied segments.
+    """
+    lo = first * measure_len
+    measures = {}
+    for start, size, chord, voice in zip(
+        chord_onset.tolist(), chord_length.tolist(), chords, voices.tolist()
+    ):
+        end = start + size
+        tie_stop = start < lo
+        start = max(start, lo)
+        limit = end if stop is None else min(end, stop * measure_len)
+        while start < limit:
+            measure, pos = divmod(start, measure_len)
+            seg_end = min(end, (measure + 1) * measure_len)
+            tie_start = seg_end < end
+            measures.setdefault(measure, {}).setdefault(voice, []).append(
+                (pos, seg_end - start, chord, tie_stop, tie_start)
+            )
+            tie_stop = True
+            start = seg_end
+
+    return measures
+
+
+def layout_part(onset, length, pitch, measure_len):
+    """
+    Build a measure-aligned layout for one part (see layout_measures)
+    """
+    return layout_measures(*part_chords(onset, length, pitch), measure_len)
+
+
+def clef_for(pitch):
+    """
+    (sign, line) of the clef for a part's MIDI pitches
+    """
+    return ("G", 2) if not len(pitch) or np.median(pitch) >= 60 else ("F", 4)
+
+
+class ScoreLayout:
+    """
+    The measure grid of a score: grid size (in quarters), meter, MusicXML
+    divisions and the notatable durations within one measure
+    """
+
+    def __init__(self, grid=0.25, beats=4, beat_type=4):
+        self.grid = grid
+        self.beats = beats
+        self.beat_type = beat_type
+        self.divisions = divisions_for_grid(grid)
+        if (beats * 4 * self.divisions) % beat_type:
+            raise ValueError(f"{beats}/{beat_type} measures don't fit a grid of {grid}")
+        self.measure_len = beats * 4 * self.divisions // beat_type
+        self.durations = duration_table(self.divisions, self.measure_len)
+
+    @classmethod
+    def for_tempo_map(cls, tempo_map, grid=0.25):
+        """
+        Layout in the piece's time signature, or 4/4 when that meter is not
+        expressible in grid divisions (e.g. 7/32 on a 16th grid)
+        """
+        try:
+            return cls(grid, *tempo_map.time_signature)
+        except ValueError:
+            return cls(grid)
+
+    def quantize(self, assignments, tempo_map):
+        """
+        ([(instrument, onset, length, pitch)], measure count) for
+        {instrument: NoteTable}, in grid steps
+        """
+        parts = []
+        total = 0
+        for inst_name, notes in assignments.items():
+            onset, length, pitch = quantize_notes(notes, tempo_map, self.grid)
+            if len(onset):
+                total = max(total, int((onset + length).max()))
+            parts.append((inst_name, onset, length, pitch))
+        return parts, max(1, -(-total // self.measure_len))
+
+    def tempo_marks(self, tempo_map):
+        """
+        {measure: [(offset, bpm)]} for every tempo change, snapped to the grid
+        """
+        marks = {}
+        for beat, bpm in tempo_map.tempo_changes():
+            measure, offset = divmod(int(round(beat / self.grid)), self.measure_len)
+            entries = marks.setdefault(measure, [])
+            if entries and entries[-1][0] == offset:
+                entries.pop()
+            entries.append((offset, round(bpm, 2)))
+        return marks
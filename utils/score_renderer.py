@@ -1,32 +1,81 @@
-from music21 import stream, note, instrument, tempo, meter
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 
-GRID = 0.25  # 16th note (in beats)
+from utils.compression import write_mxl
+from utils.measure_index import build_index
+from utils.storage import atomic_output
+from utils.musicxml_writer import write_musicxml
+from utils.tempo_map import TempoMap
 
-def render_score(assignments, tempo_bpm, output_path=None):
-    score = stream.Score()
-    score.insert(0, tempo.MetronomeMark(number=tempo_bpm))
+GRID = 0.25  # 16th note (in beats)
 
-    seconds_per_beat = 60 / tempo_bpm
+# Both engines serialize the same utils.score_layout measure layout: "music21"
+# (the reference backend, utils.music21_renderer) builds music21 measures from
+# it, "direct" streams MusicXML without music21 objects, or loading music21
+ENGINES = ("music21", "direct")
 
-    for inst_name, notes in assignments.items():
-        part = stream.Part()
-        part.insert(0, instrument.fromString(inst_name))
-        part.insert(0, meter.TimeSignature('4/4'))
+# "musicxml" writes plain XML, "mxl" only the zipped container, "both" writes
+# the .mxl next to the .musicxml file
+FORMATS = ("musicxml", "mxl", "both")
 
-        for n in notes:
-            beats = n["start"] / seconds_per_beat
-            dur = n["duration"] / seconds_per_beat
+# Parts longer than this many measures are split into chunks rendered
+# concurrently (direct engine, RENDER_WORKERS > 1)
+CHUNK_MEASURES = 256
 
-            beats = round(beats / GRID) * GRID
-            dur = max(round(dur / GRID) * GRID, GRID)
+def render_score(assignments, tempo_map, output_path=None, engine=None, output_format=None,
+                 index=False, workers=None, chunk_measures=None, fragments=None):
+    """
+    Render to output_path (a .musicxml path). Returns the paths written,
+    MusicXML first when it is kept. index=True also writes the measure
+    index sidecar used for previews (MusicXML output only).
 
-            nt = note.Note(n["pitch"], quarterLength=dur)
-            part.insert(beats, nt)
+    workers > 1 (default: RENDER_WORKERS, else 1) renders parts in a process
+    pool; the direct engine also splits parts longer than chunk_measures
+    (RENDER_CHUNK_MEASURES) into concurrently rendered measure ranges.
 
-        score.append(part)
+    fragments, if given (a utils.artifacts.JobArtifacts), supplies parts
+    rendered by an earlier run with the same instrument and notes; only the
+    other parts are rendered, and stored there for next time.
+    """
+    # tempo_map is a TempoMap (or a plain BPM number)
+    tempo_map = TempoMap.coerce(tempo_map)
 
     if output_path is None:
         output_path = "output/orchestral_score.musicxml"
-    
-    score.write("musicxml", output_path)
-    return score
+
+    output_format = output_format or os.getenv("SCORE_FORMAT", "musicxml")
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {FORMATS}")
+
+    engine = engine or os.getenv("SCORE_RENDERER", "music21")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown render engine '{engine}', expected one of {ENGINES}")
+
+    workers = workers or int(os.getenv("RENDER_WORKERS", "1"))
+    chunk_measures = chunk_measures or int(os.getenv("RENDER_CHUNK_MEASURES", CHUNK_MEASURES))
+    # A single part gains nothing from a pool unless it can be chunked
+    pool = ProcessPoolExecutor(max_workers=workers) \
+        if workers > 1 and assignments and (len(assignments) > 1 or engine == "direct") \
+        else nullcontext(None)
+
+    # Written under a temp name so downloads never see a partial score
+    with pool as executor, atomic_output(output_path) as tmp_path:
+        if engine == "direct":
+            write_musicxml(assignments, tempo_map, tmp_path, grid=GRID,
+                           executor=executor, chunk_measures=chunk_measures, fragments=fragments)
+        else:
+            # Imported here so runs with the direct engine never load music21
+            from utils.music21_renderer import render_music21
+            render_music21(assignments, tempo_map, tmp_path, GRID, executor=executor, fragments=fragments)
+
+    if index and output_format != "mxl":
+        build_index(output_path)
+
+    if output_format == "musicxml":
+        return [output_path]
+    mxl_path = write_mxl(output_path)
+    if output_format == "mxl":
+        os.remove(output_path)
+        return [mxl_path]
+    return [output_path, mxl_path]
@@ -0,0 +1,229 @@
+"""
+Bounded storage for generated scores.
+
+StorageManager keeps the output directory under a byte cap and an idle TTL.
+A score and its siblings (.mxl, .gz and the measure index) share a stem and
+are evicted together, least recently downloaded first. Downloads call
+touch(), which sets the file's atime; mtimes are left alone because
+download ETags are built from them. Since the access order lives on disk,
+it survives restarts. A daemon thread sweeps the directory periodically.
+Under a pre-fork server the sweeper stays in the process that started it;
+forked workers get fresh locks and sweep on demand.
+
+Writers go through atomic_output so a download never sees a partial file.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_SWEEP_INTERVAL = 60
+
+# In-progress writes are hidden dotfiles with this suffix
+TEMP_SUFFIX = ".tmp"
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yield a temporary path next to path and rename it over path when the
+    block completes; on error the temporary file is removed
+    """
+    # Not pre-created (as mkstemp would, mode 0600) so writers create it
+    # with the usual permissions
+    directory, name = os.path.split(path)
+    os.makedirs(directory or ".", exist_ok=True)
+    tmp_path = os.path.join(directory, f".{name}.{os.urandom(6).hex()}{TEMP_SUFFIX}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def stem_of(filename):
+    # orchestral_score_ab12.musicxml.index.json -> orchestral_score_ab12
+    return filename.split(".", 1)[0]
+
+
+class StorageManager:
+    """
+    Byte-capped, TTL-evicting view of one directory. ttl_seconds is idle
+    time: a file that has been neither written nor downloaded for that long
+    is removed.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.evictions = {"ttl": 0, "size": 0}
+        self.evicted_bytes = 0
+        self.usage = {"bytes": 0, "files": 0, "scores": 0}
+        self.last_sweep = None
+
+        os.makedirs(self.root, exist_ok=True)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The sweeper thread (and whoever held the lock) did not come along
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, root, prefix="OUTPUT", **defaults):
+        """
+        Build a manager for root from {prefix}_MAX_BYTES, {prefix}_TTL and
+        {prefix}_SWEEP_INTERVAL; defaults overrides the built-in defaults
+        """
+        defaults = {
+            "max_bytes": DEFAULT_MAX_BYTES,
+            "ttl_seconds": DEFAULT_TTL_SECONDS,
+            "sweep_interval": DEFAULT_SWEEP_INTERVAL,
+            **defaults,
+        }
+        return cls(
+            root,
+            max_bytes=int(os.getenv(f"{prefix}_MAX_BYTES", str(defaults["max_bytes"]))),
+            ttl_seconds=float(os.getenv(f"{prefix}_TTL", str(defaults["ttl_seconds"]))),
+            sweep_interval=float(os.getenv(f"{prefix}_SWEEP_INTERVAL", str(defaults["sweep_interval"]))),
+        )
+
+    def touch(self, path):
+        """
+        Record a download of path for LRU ordering (atime only)
+        """
+        try:
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+
+    def _scan(self):
+        """
+        ({stem: [bytes, last access, [paths]]}, [(temp path, mtime)])
+        """
+        groups = {}
+        temps = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(".") and entry.name.endswith(TEMP_SUFFIX):
+                    temps.append((entry.path, stat.st_mtime))
+                    continue
+                group = groups.setdefault(stem_of(entry.name), [0, 0.0, []])
+                group[0] += stat.st_size
+                group[1] = max(group[1], stat.st_atime, stat.st_mtime)
+                group[2].append(entry.path)
+        return groups, temps
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self, now=None):
+        """
+        Remove expired scores, then the least recently used ones until the
+        directory fits in max_bytes. Returns the sweep summary.
+        """
+        t0 = time.perf_counter()
+        now = time.time() if now is None else now
+        with self._lock:
+            groups, temps = self._scan()
+
+            # Temp files this old belong to writes that died mid-way
+            self._remove([path for path, mtime in temps if now - mtime > self.ttl_seconds])
+
+            evicted = {"ttl": 0, "size": 0}
+            evicted_bytes = 0
+            kept = []
+            for size, accessed, paths in groups.values():
+                if now - accessed > self.ttl_seconds:
+                    self._remove(paths)
+                    evicted["ttl"] += 1
+                    evicted_bytes += size
+                else:
+                    kept.append((accessed, size, paths))
+
+            # Most recently used first; whatever no longer fits goes
+            kept.sort(key=lambda group: group[0], reverse=True)
+            total = 0
+            files = 0
+            scores = 0
+            for accessed, size, paths in kept:
+                if total + size > self.max_bytes:
+                    self._remove(paths)
+                    evicted["size"] += 1
+                    evicted_bytes += size
+                    continue
+                total += size
+                files += len(paths)
+                scores += 1
+
+            for reason, count in evicted.items():
+                self.evictions[reason] += count
+            self.evicted_bytes += evicted_bytes
+            self.usage = {"bytes": total, "files": files, "scores": scores}
+            self.last_sweep = {
+                "time": now,
+                "seconds": round(time.perf_counter() - t0, 4),
+                "evicted": evicted,
+                "evicted_bytes": evicted_bytes,
+            }
+            return self.last_sweep
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️  Storage sweep failed: {e}")
+
+    def start(self):
+        """
+        Sweep once now, then every sweep_interval seconds in a daemon thread
+        """
+        self.sweep()
+        if self._thread is None and self.sweep_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "bytes": self.usage["bytes"],
+            "files": self.usage["files"],
+            "scores": self.usage["scores"],
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": dict(self.evictions),
+            "evicted_bytes": self.evicted_bytes,
+            "last_sweep": self.last_sweep,
+        }
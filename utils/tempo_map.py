@@ -0,0 +1,96 @@
+import numpy as np
+
+DEFAULT_TIME_SIGNATURE = (4, 4)
+
+
+class TempoMap:
+    """
+    Piecewise-constant tempo map for converting note times (seconds) to
+    beats (quarter notes). Each segment starts at change_times[k] seconds /
+    change_beats[k] beats and runs at bpms[k].
+    """
+
+    def __init__(self, change_times, change_beats, bpms,
+                 time_signature=DEFAULT_TIME_SIGNATURE, estimated=False):
+        self.change_times = np.asarray(change_times, dtype=np.float64)
+        self.change_beats = np.asarray(change_beats, dtype=np.float64)
+        self.bpms = np.asarray(bpms, dtype=np.float64)
+        self.time_signature = time_signature
+        # True when the tempo is a heuristic estimate rather than file data
+        self.estimated = estimated
+
+    @classmethod
+    def constant(cls, bpm, time_signature=DEFAULT_TIME_SIGNATURE, estimated=False):
+        return cls([0.0], [0.0], [float(bpm)], time_signature, estimated)
+
+    @classmethod
+    def from_changes(cls, times, bpms, time_signature=DEFAULT_TIME_SIGNATURE):
+        """
+        Build from tempo change times (seconds) and BPMs, accumulating beats
+        """
+        times = np.asarray(times, dtype=np.float64)
+        bpms = np.asarray(bpms, dtype=np.float64)
+        beats = np.zeros(len(times))
+        beats[1:] = np.cumsum(np.diff(times) * bpms[:-1] / 60.0)
+        return cls(times, beats, bpms, time_signature)
+
+    @classmethod
+    def from_midi(cls, midi):
+        """
+        Build from utils.midi_reader.MidiData. Beats come straight from ticks,
+        so they are exact at every tempo change.
+        """
+        ticks = np.array([t for t, _ in midi.tick_scales], dtype=np.int64)
+        scales = np.array([s for _, s in midi.tick_scales], dtype=np.float64)
+        return cls(
+            midi.tick_to_time(ticks),
+            ticks / midi.resolution,
+            # BPMs are rounded to strip float noise from 60 / (seconds per tick * resolution)
+            np.round(60.0 / (scales * midi.resolution), 6),
+            initial_time_signature(midi.time_signatures),
+        )
+
+    @classmethod
+    def coerce(cls, tempo):
+        """
+        Accept a TempoMap or a plain BPM number
+        """
+        return tempo if isinstance(tempo, cls) else cls.constant(float(tempo))
+
+    @property
+    def bpm(self):
+        """
+        Tempo at the start of the piece
+        """
+        return float(self.bpms[0])
+
+    def seconds_to_beats(self, seconds):
+        seconds = np.asarray(seconds, dtype=np.float64)
+        segment = np.maximum(np.searchsorted(self.change_times, seconds, side="right") - 1, 0)
+        return self.change_beats[segment] + (
+            (seconds - self.change_times[segment]) * self.bpms[segment] / 60.0
+        )
+
+    def durations_to_beats(self, start, duration):
+        """
+        Beat length of notes given their start and duration in seconds
+        """
+        start = np.asarray(start, dtype=np.float64)
+        return self.seconds_to_beats(start + duration) - self.seconds_to_beats(start)
+
+    def tempo_changes(self):
+        """
+        [(beat, bpm)] for every tempo change, for metronome marks
+        """
+        return list(zip(self.change_beats.tolist(), self.bpms.tolist()))
+
+
+def initial_time_signature(time_signatures):
+    """
+    Time signature in effect at tick 0, from [(tick, numerator, denominator)]
+    """
+    at_start = [ts for ts in sorted(time_signatures, key=lambda ts: ts[0]) if ts[0] == 0]
+    if not at_start:
+        return DEFAULT_TIME_SIGNATURE
+    _, numerator, denominator = at_start[-1]
+    return (numerator, denominator)
@@ -0,0 +1,68 @@
+"""
+Preloading for pre-fork servers.
+
+warm_up() imports the libraries the pipeline otherwise loads on first use
+(pretty_midi, music21, the Gemini SDK), builds the shared pipeline
+agents (and with them the instrument range tables) and renders a tiny score
+with every engine, so music21's lazily built caches exist too. Run in the
+master before forking, all of this is shared copy-on-write by the workers
+(and by the conversion processes they fork) instead of being rebuilt by
+each one on its first request.
+"""
+import gc
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from agents.midi_analysis_agent import MIDIAnalysisAgent
+from agents.role_assignment_agent import RoleAssignmentAgent
+from agents.note_assignment_agent import NoteAssignmentAgent
+from agents.feature_extraction_agent import FeatureExtractionAgent
+from utils.note_table import NoteTable
+from utils.pipeline import shared_agent
+from utils.score_renderer import ENGINES, render_score
+from utils.tempo_map import TempoMap
+
+
+def _sample_assignments():
+    # A C major arpeggio with a held chord, per role register
+    pitch = np.array([60, 64, 67, 72, 60, 64, 67])
+    start = np.array([0.0, 0.5, 1.0, 1.5, 2.0, 2.0, 2.0])
+    duration = np.array([0.5, 0.5, 0.5, 0.5, 2.0, 2.0, 2.0])
+    return {
+        "Violin": NoteTable(pitch + 12, start, duration),
+        "Viola": NoteTable(pitch, start, duration),
+        "Cello": NoteTable(pitch - 24, start, duration),
+    }
+
+
+def warm_up(freeze=True):
+    """
+    Load and exercise everything a conversion touches. freeze=True then
+    moves every object into the permanent GC generation, so collections in
+    forked children do not write to (and un-share) the preloaded pages.
+    Returns the seconds taken.
+    """
+    t0 = time.perf_counter()
+    # Imported lazily everywhere else; music21 comes with the render below
+    import pretty_midi  # noqa: F401
+    from google import genai  # noqa: F401
+
+    for cls in (MIDIAnalysisAgent, RoleAssignmentAgent, FeatureExtractionAgent):
+        shared_agent(cls)
+    # The configuration jobs from the web app use
+    shared_agent(NoteAssignmentAgent, llm_limiter=None, planner=None, llm_budget=None)
+
+    assignments = _sample_assignments()
+    tempo_map = TempoMap.constant(120.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for engine in ENGINES:
+            render_score(assignments, tempo_map, os.path.join(tmp, f"warmup_{engine}.musicxml"),
+                         engine=engine, workers=1)
+
+    gc.collect()
+    if freeze:
+        gc.freeze()
+    return round(time.perf_counter() - t0, 3)
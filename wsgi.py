@@ -0,0 +1,18 @@
+"""
+WSGI entry point for production servers.
+
+Build the app once in the master and fork workers from it, so the preloaded
+pipeline (music21, pretty_midi, the shared agents and range tables) is
+shared copy-on-write, e.g. with gunicorn:
+
+    gunicorn --preload --workers 4 --threads 8 --bind 0.0.0.0:5001 wsgi:app
+
+Threaded workers keep /jobs/<id>/events streams from blocking a whole
+worker. Set SECRET_KEY, or let the first worker create instance/secret_key.
+Conversions still run in each worker's JOB_WORKERS process pool, so size
+JOB_WORKERS to CPUs / workers. MEMORY_BUDGET_BYTES is shared by all workers
+through a reservation file in JOB_FOLDER.
+"""
+from app import create_app
+
+app = create_app(warm=True)